@@ -5,5 +5,5 @@
 # __all__ = ["get_agent_executor", "run_agent_graph"] 
 
 from .autopilot_agent import AutopilotAgent
-from .tools import code_search, video_generation, post_creation
+from .tools import code_search, commit_search, video_generation, post_creation
 from .prompts import AUTOPILOT_PROMPT 
\ No newline at end of file
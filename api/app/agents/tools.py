@@ -1,6 +1,7 @@
 """
 Agent tools for the AutopilotAgent:
 - code_search: Search over the indexed codebase
+- commit_search: Search over the embedded commit history
 - video_generation: Generate a Playwright script and video
 - post_creation: Generate a post for X/LinkedIn
 """
@@ -93,6 +94,24 @@ def code_search(feature_summary: str, commit_message: str, diff_text: str | None
     )
     return results
 
+def commit_search(query: str, repo_name: str | None = None, top_k: int = 5) -> List[Dict[str, Any]]:
+    """Commits whose diffs best match `query` (e.g. "changes to the login flow"), best first.
+
+    `repo_name` ("org/repo") scopes the search to that project; without it every project is searched.
+    """
+    # Imported lazily so the agent can load without Supabase credentials
+    from app.ingest.diff_splitter import search_commit_history_sync
+    from app.services.supabase_service import supabase
+
+    project_id = None
+    if repo_name:
+        project = supabase.table("projects").select("id").eq("full_name", repo_name).limit(1).execute()
+        if not project.data:
+            logger.warning(f"commit_search: no project named {repo_name}")
+            return []
+        project_id = project.data[0]["id"]
+    return search_commit_history_sync(query, project_id=project_id, limit=top_k)
+
 def video_generation(feature_context, code_chunks):
     """Deprecated placeholder – use `demo_generation` instead."""
     return "/path/to/generated/video.mp4"
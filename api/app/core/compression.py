@@ -0,0 +1,34 @@
+import zlib
+from typing import Tuple
+
+try:
+    import zstandard
+except ImportError:  # Declared in pyproject.toml; without it text is zlib-compressed and zstd blobs are unreadable
+    zstandard = None
+
+ZSTD_LEVEL = 6
+ZLIB_LEVEL = 6
+
+# The codec is stored next to each blob, so blobs written with either codec stay readable
+DEFAULT_CODEC = "zstd" if zstandard else "zlib"
+
+
+def compress_text(text: str) -> Tuple[str, bytes]:
+    """Compress UTF-8 text with zstd when available, zlib otherwise. Returns (codec, blob)."""
+    data = text.encode("utf-8")
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return "zlib", zlib.compress(data, ZLIB_LEVEL)
+
+
+def decompress_text(codec: str, blob: bytes) -> str:
+    """Inverse of compress_text. Raises RuntimeError for zstd blobs when zstandard is not installed."""
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd-compressed data needs the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(blob).decode("utf-8")
+    if codec == "zlib":
+        return zlib.decompress(blob).decode("utf-8")
+    if codec == "none":
+        return blob.decode("utf-8")
+    raise ValueError(f"Unknown compression codec {codec!r}")
@@ -0,0 +1,49 @@
+import os
+
+# Root directory for local, rebuildable caches (embedding cache, vector indexes, repo mirrors, ...).
+# Everything under it can be deleted at any time; it is only used to avoid repeated network work.
+CACHE_DIR = os.getenv("BUILDIE_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "buildie")
+
+# Content-addressed embedding cache (see app/ingest/embedding_cache.py)
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH") or os.path.join(CACHE_DIR, "embeddings.sqlite3")
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))  # 2GB
+
+# Local per-project vector indexes (see app/ingest/vector_index.py)
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR") or os.path.join(CACHE_DIR, "vector_indexes")
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32")  # "float32" or "float16" (half the RAM/disk)
+VECTOR_INDEX_REFRESH_SECONDS = int(os.getenv("VECTOR_INDEX_REFRESH_SECONDS", "300"))
+
+# IVF/PQ approximate index used for cross-project search (see app/ingest/ann_index.py)
+ANN_N_LISTS = int(os.getenv("ANN_N_LISTS", "0"))  # 0 = ~4*sqrt(N)
+ANN_PQ_SUBVECTORS = int(os.getenv("ANN_PQ_SUBVECTORS", "96"))  # 0 = IVF-Flat (no product quantization)
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "32"))
+ANN_RERANK = int(os.getenv("ANN_RERANK", "200"))  # PQ candidates re-scored exactly against the mmap'd vectors
+
+# Embeddings API budget shared by all indexing runs in the process (see app/ingest/embedding_scheduler.py)
+EMBEDDING_RPM_LIMIT = int(os.getenv("EMBEDDING_RPM_LIMIT", "3000"))
+EMBEDDING_TPM_LIMIT = int(os.getenv("EMBEDDING_TPM_LIMIT", "1000000"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+EMBEDDING_BACKOFF_BASE_SECONDS = float(os.getenv("EMBEDDING_BACKOFF_BASE_SECONDS", "1"))
+EMBEDDING_BACKOFF_MAX_SECONDS = float(os.getenv("EMBEDDING_BACKOFF_MAX_SECONDS", "60"))
+EMBEDDING_BATCH_REQUEUES = int(os.getenv("EMBEDDING_BATCH_REQUEUES", "3"))  # Times a batch goes back on the queue after retries run out
+
+# Bare git mirrors shared by RepoIndexer and CommitHistorian (see app/ingest/repo_cache.py)
+REPO_CACHE_ENABLED = os.getenv("REPO_CACHE_ENABLED", "true").lower() == "true"
+REPO_CACHE_DIR = os.getenv("REPO_CACHE_DIR") or os.path.join(CACHE_DIR, "repos")
+REPO_CACHE_MAX_BYTES = int(os.getenv("REPO_CACHE_MAX_BYTES", str(20 * 1024 ** 3)))  # 20GB, least recently used mirrors go first
+
+# Compressed commit diffs keyed by repo + SHA, in front of GitHub .diff downloads (see app/ingest/diff_cache.py)
+DIFF_CACHE_ENABLED = os.getenv("DIFF_CACHE_ENABLED", "true").lower() == "true"
+DIFF_CACHE_PATH = os.getenv("DIFF_CACHE_PATH") or os.path.join(CACHE_DIR, "diffs.sqlite3")
+DIFF_CACHE_MAX_BYTES = int(os.getenv("DIFF_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))  # 2GB of compressed diffs
+
+# Durable job queue for webhook work, run by `python -m app.workers.job_worker` (see app/services/job_queue.py)
+JOB_QUEUE_ENABLED = os.getenv("JOB_QUEUE_ENABLED", "true").lower() == "true"
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "2"))
+JOB_LOCK_TIMEOUT_SECONDS = int(os.getenv("JOB_LOCK_TIMEOUT_SECONDS", "900"))  # Running jobs not heartbeated for this long are reclaimed
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "10"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "900"))
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "7"))  # Finished jobs are purged after this long
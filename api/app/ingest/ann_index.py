@@ -0,0 +1,315 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+KMEANS_ITERATIONS = 20
+KMEANS_MAX_TRAINING_POINTS_PER_CENTROID = 64  # Train on a sample; more points barely move the centroids
+ASSIGN_BLOCK_ROWS = 16384  # Rows per block when assigning/encoding, bounds the (rows x centroids) temporaries
+
+
+def _assign(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest (L2) centroid for every row of x, computed block-wise."""
+    centroid_sq_norms = (centroids ** 2).sum(axis=1)
+    labels = np.empty(len(x), dtype=np.int32)
+    for start in range(0, len(x), ASSIGN_BLOCK_ROWS):
+        block = np.asarray(x[start:start + ASSIGN_BLOCK_ROWS], dtype=np.float32)
+        # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2; ||x||^2 is constant per row so it can be dropped
+        distances = centroid_sq_norms[None, :] - 2.0 * block.dot(centroids.T)
+        labels[start:start + len(block)] = np.argmin(distances, axis=1)
+    return labels
+
+
+def kmeans(x: np.ndarray, k: int, n_iter: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """Plain Lloyd's k-means on a random sample of x. Returns (k, D) float32 centroids."""
+    rng = np.random.default_rng(seed)
+    n = len(x)
+    if n == 0:
+        raise ValueError("Cannot train k-means on an empty matrix")
+    k = min(k, n)
+    sample_size = min(n, k * KMEANS_MAX_TRAINING_POINTS_PER_CENTROID)
+    sample = np.asarray(x[np.sort(rng.choice(n, size=sample_size, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), size=k, replace=False)].copy()
+
+    for _ in range(n_iter):
+        labels = _assign(sample, centroids)
+        counts = np.bincount(labels, minlength=k)
+        # Per-cluster sums via sort + reduceat (much faster than np.add.at for wide rows)
+        order = np.argsort(labels, kind="stable")
+        sums = np.zeros_like(centroids)
+        present = np.nonzero(counts)[0]
+        starts = np.concatenate([[0], np.cumsum(counts[present])[:-1]])
+        sums[present] = np.add.reduceat(sample[order], starts, axis=0)
+        non_empty = counts > 0
+        centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+        # Re-seed empty clusters with random sample points so every list stays usable
+        empty = np.nonzero(~non_empty)[0]
+        if len(empty):
+            centroids[empty] = sample[rng.choice(len(sample), size=len(empty), replace=False)]
+    return centroids
+
+
+class IVFPQIndex:
+    """
+    Pure-NumPy approximate nearest-neighbour index for inner-product (cosine on
+    L2-normalised vectors) search.
+
+    - A k-means coarse quantizer splits the vectors into `n_lists` inverted lists; a query
+      only scans the `nprobe` lists whose centroids score best.
+    - With `pq_subvectors > 0`, the residual (vector - list centroid) is product-quantized:
+      the D dims are cut into `pq_subvectors` sub-spaces, each encoded as one byte
+      (256-centroid codebook). 1536 float32 dims (6KB) become e.g. 96 bytes. Scores are
+      computed with per-query lookup tables (asymmetric distance computation).
+    - With `pq_subvectors == 0` the lists hold the raw vectors (IVF-Flat): exact scores,
+      more memory.
+
+    Ids are arbitrary int64s supplied to add(); search returns (ids, scores), best first.
+    When the original vectors are passed to search() (ids must then be row positions), the
+    best `rerank` PQ candidates are re-scored exactly, which recovers most of the recall
+    lost to quantization for the cost of reading a few hundred rows.
+    """
+
+    def __init__(self, n_lists: int = 1024, pq_subvectors: int = 96, pq_bits: int = 8, nprobe: int = 16, seed: int = 0):
+        if pq_bits != 8:
+            raise ValueError("Only 8-bit (uint8) PQ codes are supported")
+        self.n_lists = n_lists
+        self.pq_subvectors = pq_subvectors
+        self.pq_bits = pq_bits
+        self.nprobe = nprobe
+        self.seed = seed
+        self.dim: Optional[int] = None
+        self.centroids: Optional[np.ndarray] = None  # (n_lists, D)
+        self.codebooks: Optional[np.ndarray] = None  # (M, 256, D/M)
+        # Inverted lists stored contiguously, ordered by list: rows of list l live in [offsets[l], offsets[l+1])
+        self.list_offsets: Optional[np.ndarray] = None
+        self.ids: Optional[np.ndarray] = None
+        self.codes: Optional[np.ndarray] = None  # (N, M) uint8 for PQ, (N, D) float32 for IVF-Flat
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def __len__(self) -> int:
+        return 0 if self.ids is None else len(self.ids)
+
+    # -- Training / adding -------------------------------------------------------------
+
+    def train(self, vectors: np.ndarray) -> None:
+        n, self.dim = vectors.shape
+        if self.pq_subvectors and self.dim % self.pq_subvectors:
+            raise ValueError(f"dim {self.dim} is not divisible by pq_subvectors {self.pq_subvectors}")
+        started = time.perf_counter()
+        # Only a sample is ever needed for training; avoids materialising a memory-mapped corpus
+        sample_size = min(n, max(self.n_lists, 1 << self.pq_bits) * KMEANS_MAX_TRAINING_POINTS_PER_CENTROID)
+        rows = np.sort(np.random.default_rng(self.seed).choice(n, size=sample_size, replace=False))
+        vectors = np.asarray(vectors[rows], dtype=np.float32)
+        self.centroids = kmeans(vectors, min(self.n_lists, n), seed=self.seed)
+        self.n_lists = len(self.centroids)
+
+        if self.pq_subvectors:
+            residuals = vectors - self.centroids[_assign(vectors, self.centroids)]
+            sub_dim = self.dim // self.pq_subvectors
+            codebook_size = 1 << self.pq_bits
+            self.codebooks = np.zeros((self.pq_subvectors, codebook_size, sub_dim), dtype=np.float32)
+            for m in range(self.pq_subvectors):
+                sub = residuals[:, m * sub_dim:(m + 1) * sub_dim]
+                trained = kmeans(sub, codebook_size, seed=self.seed + m + 1)
+                self.codebooks[m, :len(trained)] = trained
+        print(f"IVFPQIndex: trained {self.n_lists} lists"
+              f"{f', PQ {self.pq_subvectors}x{self.pq_bits}bit' if self.pq_subvectors else ' (flat)'}"
+              f" on {sample_size}/{n} vectors in {time.perf_counter() - started:.2f}s")
+
+    def _encode(self, residuals: np.ndarray) -> np.ndarray:
+        sub_dim = self.dim // self.pq_subvectors
+        codes = np.empty((len(residuals), self.pq_subvectors), dtype=np.uint8)
+        for m in range(self.pq_subvectors):
+            codes[:, m] = _assign(residuals[:, m * sub_dim:(m + 1) * sub_dim], self.codebooks[m])
+        return codes
+
+    def add(self, vectors: np.ndarray, ids: Optional[Sequence[int]] = None) -> None:
+        """(Re)build the inverted lists from `vectors`. Replaces anything added before."""
+        if not self.is_trained:
+            self.train(vectors)
+        ids = np.arange(len(vectors), dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+
+        labels = _assign(vectors, self.centroids)
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=self.n_lists)
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.ids = ids[order]
+        if self.pq_subvectors:
+            codes = np.empty((len(vectors), self.pq_subvectors), dtype=np.uint8)
+            for start in range(0, len(vectors), ASSIGN_BLOCK_ROWS):
+                block = order[start:start + ASSIGN_BLOCK_ROWS]
+                residuals = np.asarray(vectors[block], dtype=np.float32) - self.centroids[labels[block]]
+                codes[start:start + len(block)] = self._encode(residuals)
+            self.codes = codes
+        else:
+            self.codes = np.asarray(vectors[order], dtype=np.float32)
+
+    # -- Searching ---------------------------------------------------------------------
+
+    def search(self, query: np.ndarray, k: int = 10, nprobe: Optional[int] = None,
+               vectors: Optional[np.ndarray] = None, rerank: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (ids, scores) of the approximate top-k by inner product, best first."""
+        if not len(self):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        query = np.asarray(query, dtype=np.float32)
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+
+        coarse = self.centroids.dot(query)
+        probed = np.argpartition(-coarse, nprobe - 1)[:nprobe]
+
+        if self.pq_subvectors:
+            sub_dim = self.dim // self.pq_subvectors
+            # lookup[m, c] = <query_m, codebook[m, c]>
+            lookup = np.einsum("mcd,md->mc", self.codebooks, query.reshape(self.pq_subvectors, sub_dim))
+            subspace = np.arange(self.pq_subvectors)
+
+        candidate_ids = []
+        candidate_scores = []
+        for l in probed:
+            start, end = self.list_offsets[l], self.list_offsets[l + 1]
+            if start == end:
+                continue
+            if self.pq_subvectors:
+                scores = coarse[l] + lookup[subspace, self.codes[start:end]].sum(axis=1)
+            else:
+                scores = self.codes[start:end].dot(query)
+            candidate_ids.append(self.ids[start:end])
+            candidate_scores.append(scores)
+        if not candidate_ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        all_ids = np.concatenate(candidate_ids)
+        all_scores = np.concatenate(candidate_scores).astype(np.float32)
+
+        if vectors is not None and rerank > k and len(all_ids) > k:
+            shortlist = min(rerank, len(all_ids))
+            shortlist_idx = np.argpartition(-all_scores, shortlist - 1)[:shortlist]
+            all_ids = all_ids[shortlist_idx]
+            rows = np.sort(all_ids)  # Sorted reads are friendlier to a memory-mapped matrix
+            exact = np.asarray(vectors[rows], dtype=np.float32).dot(query)
+            all_scores = exact[np.searchsorted(rows, all_ids)]
+
+        k = min(k, len(all_ids))
+        top = np.argpartition(-all_scores, k - 1)[:k]
+        top = top[np.argsort(-all_scores[top])]
+        return all_ids[top], all_scores[top]
+
+    # -- Persistence -------------------------------------------------------------------
+
+    def save(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "centroids.npy"), self.centroids)
+        np.save(os.path.join(directory, "list_offsets.npy"), self.list_offsets)
+        np.save(os.path.join(directory, "ids.npy"), self.ids)
+        np.save(os.path.join(directory, "codes.npy"), self.codes)
+        if self.codebooks is not None:
+            np.save(os.path.join(directory, "codebooks.npy"), self.codebooks)
+        with open(os.path.join(directory, "ann.json"), "w") as f:
+            json.dump({
+                "n_lists": self.n_lists,
+                "pq_subvectors": self.pq_subvectors,
+                "pq_bits": self.pq_bits,
+                "nprobe": self.nprobe,
+                "seed": self.seed,
+                "dim": self.dim,
+            }, f)
+
+    @classmethod
+    def load(cls, directory: str) -> "IVFPQIndex":
+        with open(os.path.join(directory, "ann.json"), "r") as f:
+            params = json.load(f)
+        index = cls(params["n_lists"], params["pq_subvectors"], params["pq_bits"], params["nprobe"], params["seed"])
+        index.dim = params["dim"]
+        index.centroids = np.load(os.path.join(directory, "centroids.npy"))
+        index.list_offsets = np.load(os.path.join(directory, "list_offsets.npy"))
+        index.ids = np.load(os.path.join(directory, "ids.npy"), mmap_mode="r")
+        index.codes = np.load(os.path.join(directory, "codes.npy"), mmap_mode="r")
+        if index.pq_subvectors:
+            index.codebooks = np.load(os.path.join(directory, "codebooks.npy"))
+        return index
+
+
+def default_n_lists(n_vectors: int) -> int:
+    """Rule of thumb: ~4*sqrt(N) lists keeps list scans and the coarse step balanced."""
+    return max(1, min(65536, int(4 * np.sqrt(max(n_vectors, 1)))))
+
+
+def exact_top_k(vectors: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    scores = np.asarray(vectors, dtype=np.float32).dot(np.asarray(query, dtype=np.float32))
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def benchmark(index: IVFPQIndex, vectors: np.ndarray, queries: np.ndarray, k: int = 10,
+              nprobes: Sequence[int] = (1, 2, 4, 8, 16, 32, 64), rerank: int = 0) -> List[Dict[str, Any]]:
+    """
+    Recall@k and latency of `index` against exact brute-force search over `vectors`.
+    `index` must have been built with ids == row positions of `vectors`.
+    """
+    exact_latencies = []
+    ground_truth = []
+    for q in queries:
+        started = time.perf_counter()
+        ground_truth.append(set(exact_top_k(vectors, q, k).tolist()))
+        exact_latencies.append(time.perf_counter() - started)
+    print(f"exact: p50 {np.percentile(exact_latencies, 50) * 1000:.2f}ms, p95 {np.percentile(exact_latencies, 95) * 1000:.2f}ms")
+
+    results = []
+    for nprobe in nprobes:
+        latencies = []
+        hits = 0
+        for q, truth in zip(queries, ground_truth):
+            started = time.perf_counter()
+            ids, _ = index.search(q, k=k, nprobe=nprobe, vectors=vectors if rerank else None, rerank=rerank)
+            latencies.append(time.perf_counter() - started)
+            hits += len(truth.intersection(ids.tolist()))
+        row = {
+            "nprobe": nprobe,
+            f"recall@{k}": hits / (k * len(queries)),
+            "p50_ms": float(np.percentile(latencies, 50) * 1000),
+            "p95_ms": float(np.percentile(latencies, 95) * 1000),
+        }
+        results.append(row)
+        print(f"nprobe={nprobe:>4}: recall@{k} {row[f'recall@{k}']:.3f}, p50 {row['p50_ms']:.2f}ms, p95 {row['p95_ms']:.2f}ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall-vs-latency benchmark of IVFPQIndex against exact search")
+    parser.add_argument("--index-dir", type=str, help="Benchmark on a LocalVectorIndex generation dir (uses its vectors.npy) instead of synthetic data.")
+    parser.add_argument("--n", type=int, default=100000, help="Synthetic vectors to generate.")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--n-lists", type=int, default=0, help="0 = 4*sqrt(N)")
+    parser.add_argument("--pq-subvectors", type=int, default=96, help="0 = IVF-Flat (no product quantization)")
+    parser.add_argument("--rerank", type=int, default=0, help="Re-score this many PQ candidates exactly (0 = off)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.index_dir:
+        vectors = np.load(os.path.join(args.index_dir, "vectors.npy"), mmap_mode="r")
+    else:
+        # Clustered synthetic data; uniform random vectors have no neighbourhood structure to exploit
+        centers = rng.normal(size=(max(1, args.n // 1000), args.dim)).astype(np.float32)
+        vectors = centers[rng.integers(0, len(centers), size=args.n)] + 0.5 * rng.normal(size=(args.n, args.dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = np.asarray(vectors[rng.choice(len(vectors), size=args.queries, replace=False)], dtype=np.float32)
+    queries += 0.05 * rng.normal(size=queries.shape).astype(np.float32)
+
+    index = IVFPQIndex(n_lists=args.n_lists or default_n_lists(len(vectors)), pq_subvectors=args.pq_subvectors)
+    started = time.perf_counter()
+    index.add(vectors)
+    print(f"Built index over {len(vectors)} x {vectors.shape[1]} vectors in {time.perf_counter() - started:.2f}s")
+    benchmark(index, vectors, queries, k=args.k, rerank=args.rerank)
+
+
+if __name__ == "__main__":
+    # python -m app.ingest.ann_index --n 200000
+    main()
@@ -0,0 +1,315 @@
+"""
+Structural chunkers, keyed by file extension.
+
+A chunker takes a file's source text and returns its definitions as dicts:
+    {'type', 'name', 'parent', 'start', 'end', 'segments'}
+with 0-based [start, end) line numbers. `segments` lists the line ranges that make up the
+chunk text. For a class/impl/interface header these are its own lines minus the spans of
+its members, so every line is embedded at most once. Top-level code outside any definition
+(imports, constants, route registrations, ...) is returned as one 'module' definition made
+of the uncovered line ranges. RepoIndexer turns definitions into token-limited chunks;
+files without a chunker (or whose chunker returns None) fall back to line windows.
+
+Python uses the standard library `ast`. The other languages use tree-sitter, whose grammars
+are declared in the `chunkers` dependency group of pyproject.toml (and in requirements.txt).
+Languages whose grammar is not installed are not registered; which ones were is logged at import.
+"""
+import ast
+import logging
+import os
+import importlib
+from typing import List, Dict, Any, Optional, Callable
+
+Definition = Dict[str, Any]
+Chunker = Callable[[str], Optional[List[Definition]]]
+
+_CHUNKERS: Dict[str, Chunker] = {}
+
+
+def register_chunker(extensions: List[str], chunker: Chunker) -> None:
+    for ext in extensions:
+        _CHUNKERS[ext.lower()] = chunker
+
+
+def get_chunker(path: str) -> Optional[Chunker]:
+    return _CHUNKERS.get(os.path.splitext(path)[1].lower())
+
+
+def supported_extensions() -> List[str]:
+    return sorted(_CHUNKERS)
+
+
+def _header_segments(start: int, end: int, member_spans: List[tuple]) -> List[tuple]:
+    """Line ranges of [start, end) that are not covered by any member span."""
+    segments = []
+    cursor = start
+    for member_start, member_end in sorted(member_spans):
+        if member_start > cursor:
+            segments.append((cursor, member_start))
+        cursor = max(cursor, member_end)
+    if cursor < end:
+        segments.append((cursor, end))
+    return segments
+
+
+def _module_remainder(source: str, definitions: List[Definition]) -> Optional[Definition]:
+    """The file's lines outside every definition as one 'module' definition, or None if they are blank."""
+    lines = source.splitlines()
+    segments = []
+    for seg_start, seg_end in _header_segments(0, len(lines), [(d['start'], d['end']) for d in definitions]):
+        while seg_start < seg_end and not lines[seg_start].strip():
+            seg_start += 1
+        while seg_end > seg_start and not lines[seg_end - 1].strip():
+            seg_end -= 1
+        if seg_start < seg_end:
+            segments.append((seg_start, seg_end))
+    if not segments:
+        return None
+    return {'type': 'module', 'name': None, 'parent': None,
+            'start': segments[0][0], 'end': segments[-1][1], 'segments': segments}
+
+
+def _with_module_remainder(source: str, definitions: List[Definition]) -> List[Definition]:
+    # No definitions at all: leave the file to the line-window fallback
+    if not definitions:
+        return definitions
+    module = _module_remainder(source, definitions)
+    return [module] + definitions if module else definitions
+
+
+# -- Python (ast) --------------------------------------------------------------------------
+
+def _python_definitions(body: List[ast.stmt]):
+    """Yield the functions/classes defined directly in `body`, including ones under if/try/with blocks."""
+    for node in body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            yield node
+        else:
+            for field in ('body', 'orelse', 'finalbody', 'handlers'):
+                yield from _python_definitions(getattr(node, field, None) or [])
+
+
+def _python_node_span(node: ast.AST) -> tuple:
+    """0-based [start, end) line range of a definition, decorators included."""
+    start = min([node.lineno] + [d.lineno for d in getattr(node, 'decorator_list', [])]) - 1
+    end = getattr(node, 'end_lineno', None) or start + 1 # Ensure end is valid
+    return start, end
+
+
+def _collect_python(node: ast.AST, parent: Optional[str], out: List[Definition]) -> None:
+    start, end = _python_node_span(node)
+    definition = {'type': type(node).__name__, 'name': node.name, 'parent': parent,
+                  'start': start, 'end': end, 'segments': [(start, end)]}
+    out.append(definition)
+    if not isinstance(node, ast.ClassDef):
+        return # Nested helpers stay inside their function
+    children = sorted(_python_definitions(node.body), key=lambda child: child.lineno)
+    definition['segments'] = _header_segments(start, end, [_python_node_span(child) for child in children])
+    qualified_name = f"{parent}.{node.name}" if parent else node.name
+    for child in children:
+        _collect_python(child, qualified_name, out)
+
+
+def chunk_python(source: str) -> Optional[List[Definition]]:
+    try:
+        tree = ast.parse(source)
+    except Exception as e:
+        logging.warning(f"AST parse failed, falling back to text chunking: {e}")
+        return None
+    definitions: List[Definition] = []
+    for node in _python_definitions(tree.body):
+        _collect_python(node, None, definitions)
+    return _with_module_remainder(source, definitions)
+
+
+register_chunker(['.py'], chunk_python)
+
+
+# -- tree-sitter -----------------------------------------------------------------------------
+
+# Per language:
+#   definitions: node types emitted as chunks
+#   containers:  definitions whose members are chunked separately (node type -> body field)
+#   name_fields: fields tried, in order, to find a definition's name
+#   wrappers:    node types that are descended into while looking for definitions
+#   bindings:    declarations that count as functions when they bind a function value,
+#                e.g. `const handler = async () => {...}`
+_JS_DEFINITIONS = {
+    'function_declaration', 'generator_function_declaration', 'class_declaration',
+    'method_definition', 'lexical_declaration', 'variable_declaration',
+}
+_JS_SPEC = {
+    'definitions': _JS_DEFINITIONS,
+    'containers': {'class_declaration': 'body'},
+    'name_fields': ('name',),
+    'wrappers': {'export_statement', 'class_body'},
+    'bindings': {'lexical_declaration', 'variable_declaration'},
+    'function_values': {'arrow_function', 'function_expression', 'function', 'generator_function'},
+}
+_TS_SPEC = {
+    **_JS_SPEC,
+    'definitions': _JS_DEFINITIONS | {
+        'abstract_class_declaration', 'interface_declaration', 'enum_declaration',
+        'type_alias_declaration', 'abstract_method_signature', 'internal_module',
+    },
+    'containers': {'class_declaration': 'body', 'abstract_class_declaration': 'body', 'internal_module': 'body'},
+    'wrappers': {'export_statement', 'class_body', 'statement_block', 'ambient_declaration'},
+}
+LANGUAGE_SPECS: Dict[str, Dict[str, Any]] = {
+    'javascript': {**_JS_SPEC, 'module': 'tree_sitter_javascript', 'factory': 'language',
+                   'extensions': ['.js', '.jsx', '.mjs', '.cjs']},
+    'typescript': {**_TS_SPEC, 'module': 'tree_sitter_typescript', 'factory': 'language_typescript',
+                   'extensions': ['.ts', '.mts', '.cts']},
+    'tsx': {**_TS_SPEC, 'module': 'tree_sitter_typescript', 'factory': 'language_tsx',
+            'extensions': ['.tsx']},
+    'go': {
+        'module': 'tree_sitter_go', 'factory': 'language', 'extensions': ['.go'],
+        'definitions': {'function_declaration', 'method_declaration', 'type_declaration'},
+        'containers': {},
+        'name_fields': ('name',),
+        'wrappers': set(),
+    },
+    'rust': {
+        'module': 'tree_sitter_rust', 'factory': 'language', 'extensions': ['.rs'],
+        'definitions': {'function_item', 'impl_item', 'trait_item', 'struct_item', 'enum_item',
+                        'mod_item', 'macro_definition', 'union_item'},
+        'containers': {'impl_item': 'body', 'trait_item': 'body', 'mod_item': 'body'},
+        'name_fields': ('name', 'type'),
+        'wrappers': {'declaration_list'},
+    },
+    'java': {
+        'module': 'tree_sitter_java', 'factory': 'language', 'extensions': ['.java'],
+        'definitions': {'class_declaration', 'interface_declaration', 'enum_declaration', 'record_declaration',
+                        'annotation_type_declaration', 'method_declaration', 'constructor_declaration'},
+        'containers': {'class_declaration': 'body', 'interface_declaration': 'body', 'enum_declaration': 'body',
+                       'record_declaration': 'body'},
+        'name_fields': ('name',),
+        'wrappers': {'class_body', 'interface_body', 'enum_body', 'enum_body_declarations'},
+    },
+}
+_COMMENT_TYPES = {'comment', 'line_comment', 'block_comment'}
+# Wrappers that belong to the definition they wrap (`export default class ...`)
+_ATTACHED_WRAPPERS = {'export_statement', 'ambient_declaration'}
+
+
+class TreeSitterChunker:
+    """Emit function/class/method definitions of one tree-sitter language, plus the top-level code around them."""
+
+    def __init__(self, name: str, language: Any, spec: Dict[str, Any]):
+        from tree_sitter import Parser
+        self.name = name
+        self.spec = spec
+        self.parser = Parser(language)
+
+    def __call__(self, source: str) -> Optional[List[Definition]]:
+        data = source.encode('utf-8')
+        try:
+            tree = self.parser.parse(data)
+        except Exception as e:
+            logging.warning(f"tree-sitter ({self.name}) parse failed, falling back to text chunking: {e}")
+            return None
+        definitions: List[Definition] = []
+        for node in self._definitions(tree.root_node):
+            self._collect(node, data, None, definitions)
+        return _with_module_remainder(source, definitions)
+
+    def _is_definition(self, node) -> bool:
+        if node.type not in self.spec['definitions']:
+            return False
+        if node.type in self.spec.get('bindings', ()):
+            # Only `const f = () => ...` style bindings, not every variable
+            return any(
+                (child.child_by_field_name('value') is not None
+                 and child.child_by_field_name('value').type in self.spec['function_values'])
+                for child in node.named_children if child.type == 'variable_declarator'
+            )
+        return True
+
+    def _definitions(self, node):
+        for child in node.named_children:
+            if self._is_definition(child):
+                yield child
+            elif child.type in self.spec['wrappers']:
+                yield from self._definitions(child)
+
+    def _name(self, node, data: bytes) -> Optional[str]:
+        if node.type in self.spec.get('bindings', ()):
+            declarator = next((c for c in node.named_children if c.type == 'variable_declarator'), None)
+            node = declarator or node
+        for field in self.spec['name_fields']:
+            name_node = node.child_by_field_name(field)
+            if name_node is not None:
+                return data[name_node.start_byte:name_node.end_byte].decode('utf-8', errors='ignore')
+        if node.type == 'type_declaration': # Go: `type X struct {...}`
+            spec = next((c for c in node.named_children if c.type in ('type_spec', 'type_alias')), None)
+            if spec is not None:
+                return self._name(spec, data)
+        return None
+
+    def _receiver(self, node, data: bytes) -> Optional[str]:
+        """Go methods: the receiver type is the natural parent (`func (s *Server) Start()` -> Server)."""
+        receiver = node.child_by_field_name('receiver')
+        if receiver is None:
+            return None
+        parts = data[receiver.start_byte:receiver.end_byte].decode('utf-8', errors='ignore').strip('()').split()
+        return parts[-1].lstrip('*').split('[')[0] if parts else None
+
+    @staticmethod
+    def _span(node) -> tuple:
+        """0-based [start, end) line range, extended upwards over directly preceding doc comments."""
+        while node.parent is not None and node.parent.type in _ATTACHED_WRAPPERS:
+            node = node.parent
+        start = node.start_point[0]
+        sibling = node.prev_sibling
+        while sibling is not None and sibling.type in _COMMENT_TYPES and sibling.end_point[0] >= start - 1:
+            start = sibling.start_point[0]
+            sibling = sibling.prev_sibling
+        # A node ending at column 0 does not include that line
+        end = node.end_point[0] + (1 if node.end_point[1] > 0 else 0)
+        return start, max(end, start + 1)
+
+    def _collect(self, node, data: bytes, parent: Optional[str], out: List[Definition]) -> None:
+        start, end = self._span(node)
+        name = self._name(node, data)
+        if parent is None and node.type == 'method_declaration':
+            parent = self._receiver(node, data)
+        definition = {'type': node.type, 'name': name, 'parent': parent,
+                      'start': start, 'end': end, 'segments': [(start, end)]}
+        out.append(definition)
+        body_field = self.spec['containers'].get(node.type)
+        body = node.child_by_field_name(body_field) if body_field else None
+        if body is None:
+            return
+        members = list(self._definitions(body))
+        if not members:
+            return
+        definition['segments'] = _header_segments(start, end, [self._span(member) for member in members])
+        qualified_name = f"{parent}.{name}" if parent and name else (name or parent)
+        for member in members:
+            self._collect(member, data, qualified_name, out)
+
+
+def _register_tree_sitter_languages() -> None:
+    try:
+        from tree_sitter import Language
+    except ImportError:
+        logging.warning(
+            "tree-sitter is not installed: only Python files get structural chunks "
+            f"({', '.join(LANGUAGE_SPECS)} use line windows)"
+        )
+        return
+    registered, missing = ['python'], []
+    for name, spec in LANGUAGE_SPECS.items():
+        try:
+            module = importlib.import_module(spec['module'])
+            language = Language(getattr(module, spec['factory'])())
+            register_chunker(spec['extensions'], TreeSitterChunker(name, language, spec))
+            registered.append(name)
+        except Exception as e:
+            missing.append(f"{name} ({e})") # Grammar not installed (or incompatible): these files use line windows
+    logging.info(f"Structural chunkers registered for: {', '.join(registered)}")
+    if missing:
+        logging.warning(f"No tree-sitter grammar, falling back to line windows for: {'; '.join(missing)}")
+
+
+_register_tree_sitter_languages()
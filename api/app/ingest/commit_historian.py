@@ -1,16 +1,32 @@
 import os
+import asyncio
+import concurrent.futures
 import tempfile
+import threading
 import shutil
 import git
 import uuid
+from contextlib import ExitStack
 from supabase import create_client, Client
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set
+from datetime import datetime, timezone
 
 # Remove analyze_changes_with_llm from import
-from .diff_processor import get_commit_diff 
+from .git_log import iter_commits_with_patches, list_commit_shas
 from ..services import supabase_service
+from .repo_cache import get_repo_cache
+from .diff_cache import get_diff_cache
+from .diff_splitter import embed_commit_diffs
+from ..core.config import REPO_CACHE_ENABLED
 
 COMMITS_TABLE_NAME = "commits"
+COMMIT_INGEST_BATCH_SIZE = int(os.getenv("COMMIT_INGEST_BATCH_SIZE", "500"))
+# Concurrent history ingestion: git processes producing commits with patches, and bulk DB writers
+COMMIT_GIT_CONCURRENCY = int(os.getenv("COMMIT_GIT_CONCURRENCY", str(min(4, os.cpu_count() or 1))))
+COMMIT_DB_CONCURRENCY = int(os.getenv("COMMIT_DB_CONCURRENCY", "2"))
+COMMIT_GIT_SHARD_SIZE = 2000  # Commits per `git log -p` process
+# Also embed every ingested diff for commit history search. Off by default: a long history costs many embedding requests
+COMMIT_EMBED_DIFFS = os.getenv("COMMIT_EMBED_DIFFS", "false").lower() == "true"
 
 class CommitHistorian:
     def __init__(self, supabase_url: str, supabase_key: str, openai_api_key: Optional[str] = None):
@@ -28,10 +44,19 @@ class CommitHistorian:
         print("CommitHistorian initialized.")
 
 
-    async def ingest_commit_history(self, project_id: uuid.UUID, repo_url: str, github_repo_id: Optional[int] = None, project_name: Optional[str] = None, project_full_name: Optional[str] = None, project_description: Optional[str] = None, project_private: Optional[bool] = False, project_owner_user_id: Optional[uuid.UUID] = None):
+    async def ingest_commit_history(self, project_id: uuid.UUID, repo_url: str, github_repo_id: Optional[int] = None, project_name: Optional[str] = None, project_full_name: Optional[str] = None, project_description: Optional[str] = None, project_private: Optional[bool] = False, project_owner_user_id: Optional[uuid.UUID] = None, resume: bool = True, git_concurrency: Optional[int] = None, db_concurrency: Optional[int] = None):
         """
-        Clones a repository, extracts its commit history, fetches diffs,
-        and stores comprehensive details in Supabase. LLM analysis removed.
+        Clones a repository, extracts its commit history and diffs locally in a single
+        `git log -p` pass, and stores comprehensive details in Supabase. LLM analysis removed.
+
+        Progress is checkpointed per batch in `ingestion_checkpoints`. With resume=True (the
+        default) commits already in the `commits` table are skipped, so a restarted run only
+        computes and stores the remainder.
+
+        The pending commits are split into shards that git workers read in parallel (one
+        `git log -p` process per shard, in threads). Their batches go through a bounded queue
+        to DB writers. git_concurrency / db_concurrency default to COMMIT_GIT_CONCURRENCY /
+        COMMIT_DB_CONCURRENCY; 1 and 1 give the sequential behaviour.
         """
         if not project_id:
             print(f"CommitHistorian Error: project_id is required. Project ID: {project_id}")
@@ -40,17 +65,22 @@ class CommitHistorian:
         repo_url_str = str(repo_url) # Ensure it's a string
 
         print(f"CommitHistorian: Starting full commit history ingestion for project_id: {project_id}, repo_url: {repo_url_str}")
-        temp_dir = tempfile.mkdtemp()
-        print(f"CommitHistorian: Created temporary directory: {temp_dir}")
+        checkout = ExitStack()
 
         try:
-            print(f"CommitHistorian: Cloning repo {repo_url_str}...")
-            cloned_repo = git.Repo.clone_from(repo_url_str, temp_dir)
-            print("CommitHistorian: Repo cloned.")
+            if REPO_CACHE_ENABLED:
+                # Bare mirror shared with RepoIndexer: only new objects are fetched after the first run
+                print(f"CommitHistorian: Syncing mirror of {repo_url_str}...")
+                cloned_repo = await asyncio.to_thread(checkout.enter_context, get_repo_cache().mirror(repo_url_str))
+            else:
+                temp_dir = tempfile.mkdtemp()
+                checkout.callback(shutil.rmtree, temp_dir, ignore_errors=True)
+                print(f"CommitHistorian: Cloning repo {repo_url_str} into {temp_dir}...")
+                cloned_repo = await asyncio.to_thread(git.Repo.clone_from, repo_url_str, temp_dir)
+            print("CommitHistorian: Repo ready.")
 
-            commit_shas_processed = set()
-            total_commits_iterated = 0
-            successfully_processed_count = 0
+            git_concurrency = max(1, git_concurrency or COMMIT_GIT_CONCURRENCY)
+            db_concurrency = max(1, db_concurrency or COMMIT_DB_CONCURRENCY)
 
             # Ensure project exists in Supabase. This is important because store_commit_details needs project_id.
             # The project_id is passed in, but let's verify/create the project entry if needed,
@@ -81,120 +111,174 @@ class CommitHistorian:
             # If `store_commit_details` requires more project context that `project_id` alone doesn't give,
             # this part might need adjustment.
 
-            print(f"CommitHistorian: Iterating through commits for project {project_id}...")
-            for commit in cloned_repo.iter_commits('--all'):
-                total_commits_iterated += 1
-                if commit.hexsha in commit_shas_processed:
-                    print(f"CommitHistorian: Skipping already processed SHA: {commit.hexsha[:7]}")
-                    continue
-                commit_shas_processed.add(commit.hexsha)
-
-                print(f"CommitHistorian: Processing commit {commit.hexsha[:7]} ({total_commits_iterated})...")
-
-                # 1. Fetch Diff
-                diff_text = await get_commit_diff(repo_html_url=repo_url_str, commit_sha=commit.hexsha)
-                if diff_text is None:
-                    print(f"Warning: Could not fetch diff for commit {commit.hexsha[:7]}. Some analyses might be skipped.")
-                
-                # 2. LLM Analysis - This section is removed.
-                # llm_analysis_results = {"change_summary": "Diff not available for LLM.", "is_feature_shipped": None}
-                # if diff_text:
-                #     try:
-                #         llm_analysis_results = await analyze_changes_with_llm(diff_text, commit.message.strip() if commit.message else "")
-                #     except Exception as e_llm:
-                #         print(f"Error during LLM analysis for commit {commit.hexsha[:7]}: {e_llm}")
-                #         llm_analysis_results = {"change_summary": f"LLM analysis failed: {e_llm}", "is_feature_shipped": None}
-                
-                # 3. Changed Files
-                changed_files_data = []
+            # Resume: everything already in the commits table is skipped without per-commit lookups
+            stored_shas: Set[str] = set()
+            if resume:
                 try:
-                    # Diff against parent (or EMPTY_TREE for initial commit)
-                    parent_commit = commit.parents[0] if commit.parents else git.EMPTY_TREE
-                    diff_index = commit.diff(parent_commit, create_patch=False)
-
-                    for diff_item in diff_index: # Iterates over all change types
-                        status = "modified" # Default
-                        file_path = diff_item.b_path or diff_item.a_path # b_path for new/modified, a_path for deleted
-
-                        if diff_item.new_file:
-                            status = "added"
-                            file_path = diff_item.b_path
-                        elif diff_item.deleted_file:
-                            status = "deleted"
-                            file_path = diff_item.a_path
-                        elif diff_item.renamed_file:
-                            status = "renamed" # supabase_service.store_commit_details expects added, removed, modified
-                                              # We can log renamed as modified b_path, or a delete of a_path and add of b_path.
-                                              # For simplicity, let's mark as modified for now.
-                            file_path = diff_item.b_path # The new path
-                        elif diff_item.a_mode != diff_item.b_mode : # Check for type change (e.g. file to symlink)
-                             status = "type_changed" # Or "modified"
-                             file_path = diff_item.b_path
-
-                        if file_path: # Ensure file_path is not None
-                             changed_files_data.append({"file_path": file_path, "status": status})
-                
-                except Exception as e_diff_files:
-                    print(f"Error extracting changed files for commit {commit.hexsha[:7]}: {e_diff_files}")
-                    # Fallback to commit.stats.files if precise status is hard
-                    if hasattr(commit, 'stats') and hasattr(commit.stats, 'files'):
-                        for file_path in commit.stats.files.keys():
-                            changed_files_data.append({"file_path": file_path, "status": "modified"}) # Generic status
-
-                # 4. Prepare data and store
-                # Construct a minimal raw_commit_payload, store_commit_details expects a dict.
-                raw_commit_data_for_storage = {
-                    "hexsha": commit.hexsha,
-                    "authored_date": commit.authored_datetime.isoformat(),
-                    "committed_date": commit.committed_datetime.isoformat(),
-                    "summary": commit.summary,
-                    "stats": {path: stats for path, stats in commit.stats.files.items()} if hasattr(commit, 'stats') and hasattr(commit.stats, 'files') else {}
-                }
+                    stored_shas = await supabase_service.get_stored_commit_shas(str(project_id))
+                    checkpoint = await supabase_service.get_ingestion_checkpoint(str(project_id))
+                    if checkpoint and checkpoint.get("status") != "completed":
+                        print(f"CommitHistorian: Resuming {checkpoint.get('status')} ingestion (last stored commit {(checkpoint.get('last_commit_sha') or '')[:7]}, {len(stored_shas)} commits already stored).")
+                except Exception as e_resume:
+                    print(f"CommitHistorian: Could not load the ingestion checkpoint, starting from scratch: {e_resume}")
+                    stored_shas = set()
+            all_shas = await asyncio.to_thread(list_commit_shas, cloned_repo)
+            pending_shas = [sha for sha in all_shas if sha not in stored_shas]
+            commits_skipped = len(all_shas) - len(pending_shas)
+            if commits_skipped:
+                print(f"CommitHistorian: {commits_skipped} of {len(all_shas)} commits are already stored; {len(pending_shas)} left.")
+            await self._save_checkpoint(project_id, status="running", commits_seen=len(all_shas), commits_skipped=commits_skipped,
+                                        commits_stored=commits_skipped, error=None, completed_at=None)
 
-                try:
-                    await supabase_service.store_commit_details(
-                        project_id=str(project_id), # Ensure UUID is string
-                        commit_sha=commit.hexsha,
-                        message=commit.message.strip() if commit.message else None,
-                        commit_timestamp=commit.committed_datetime.isoformat(),
-                        compare_url=f"{repo_url_str}/commit/{commit.hexsha}", # Standard commit URL
-                        
-                        author_name=commit.author.name,
-                        author_email=commit.author.email,
-                        author_github_username=None, # Not available from git.Commit
-                        
-                        committer_name=commit.committer.name,
-                        committer_email=commit.committer.email,
-                        committer_github_username=None, # Not available from git.Commit
-
-                        pusher_name=None, # Not applicable for historical ingestion
-                        pusher_email=None, # Not applicable for historical ingestion
-                        
-                        diff_text=diff_text,
-                        # change_summary=llm_analysis_results.get("change_summary"), # Removed
-                        # is_feature_shipped=llm_analysis_results.get("is_feature_shipped"), # Removed
-                        
-                        raw_commit_payload=raw_commit_data_for_storage,
-                        raw_push_event_payload=None, # Not applicable
-                        changed_files=changed_files_data
-                    )
-                    successfully_processed_count += 1
-                    if successfully_processed_count % 10 == 0 : # Log progress periodically
-                         print(f"CommitHistorian: Successfully processed {successfully_processed_count} commits so far.")
-
-                except Exception as e_store:
-                    print(f"CommitHistorian: Error storing commit details for {commit.hexsha[:7]}: {e_store}")
-                    # Optionally, add to a list of failed commits for retry or logging
-
-            print(f"CommitHistorian: Finished iterating. Processed {len(commit_shas_processed)} unique commits ({total_commits_iterated} total iterated).")
-            print(f"CommitHistorian: Successfully stored details for {successfully_processed_count} commits.")
+            print(f"CommitHistorian: Processing {len(pending_shas)} commits for project {project_id} "
+                  f"({git_concurrency} git workers, {db_concurrency} DB writers)...")
+            stored_count = await self._ingest_commits(project_id, cloned_repo, repo_url_str, pending_shas,
+                                                      commits_skipped, git_concurrency, db_concurrency)
+            await self._save_checkpoint(project_id, status="completed", completed_at=datetime.now(timezone.utc).isoformat(),
+                                        commits_stored=commits_skipped + stored_count)
+            print(f"CommitHistorian: Finished. {len(all_shas)} commits in history, {commits_skipped} already stored.")
+            print(f"CommitHistorian: Successfully stored details for {stored_count} of {len(pending_shas)} commits.")
 
         except git.exc.GitCommandError as e_git:
             print(f"CommitHistorian: Git command error during ingestion for project {project_id}: {e_git}")
+            await self._save_checkpoint(project_id, status="failed", error=str(e_git))
         except Exception as e_main:
             print(f"CommitHistorian: An error occurred during ingestion for project {project_id}: {e_main}")
+            await self._save_checkpoint(project_id, status="failed", error=str(e_main))
             import traceback
             traceback.print_exc()
         finally:
-            print(f"CommitHistorian: Cleaning up temporary directory: {temp_dir}")
-            shutil.rmtree(temp_dir) 
\ No newline at end of file
+            # Releases the mirror (or removes the temporary clone)
+            await asyncio.to_thread(checkout.close) 
+
+    @staticmethod
+    def _commit_record(commit: Dict[str, Any], repo_url_str: str) -> Dict[str, Any]:
+        """Row for supabase_service.store_commits_bulk from an iter_commits_with_patches() commit."""
+        commit_sha = commit["hexsha"]
+        # Construct a minimal raw_commit_payload, store_commit_details expects a dict.
+        raw_commit_data_for_storage = {
+            "hexsha": commit_sha,
+            "authored_date": commit["authored_date"],
+            "committed_date": commit["committed_date"],
+            "summary": commit["summary"],
+            "stats": commit["stats"],
+        }
+        return {
+            "commit_sha": commit_sha,
+            "message": commit["message"] or None,
+            "commit_timestamp": commit["committed_date"],
+            "compare_url": f"{repo_url_str}/commit/{commit_sha}", # Standard commit URL
+            "author_name": commit["author_name"],
+            "author_email": commit["author_email"],
+            "committer_name": commit["committer_name"],
+            "committer_email": commit["committer_email"],
+            # GitHub usernames and pusher are not available for historical ingestion
+            "diff_text": commit["diff_text"],
+            "raw_commit_payload": raw_commit_data_for_storage,
+            "changed_files": commit["changed_files"],
+        }
+
+    async def _ingest_commits(self, project_id: uuid.UUID, repo: git.Repo, repo_url_str: str, shas: List[str],
+                              commits_skipped: int, git_concurrency: int, db_concurrency: int) -> int:
+        """
+        Extract and store `shas`: git workers -> bounded queue of batches -> DB writers.
+        Returns the number of commits stored.
+        """
+        if not shas:
+            return 0
+        loop = asyncio.get_running_loop()
+        batches: asyncio.Queue = asyncio.Queue(maxsize=db_concurrency * 2)
+        git_slots = asyncio.Semaphore(git_concurrency)
+        stored_count = 0
+
+        stop = threading.Event()  # Set when the run ends early, so blocked git threads give up
+        diff_cache = get_diff_cache()  # Diffs read here are kept so webhooks and re-imports need not download them
+
+        def put_batch(batch: List[Dict[str, Any]]) -> None:
+            # Blocks on a full queue, which keeps git from racing ahead of the DB
+            while not stop.is_set():
+                future = asyncio.run_coroutine_threadsafe(batches.put(batch), loop)
+                try:
+                    future.result(timeout=1.0)
+                    return
+                except concurrent.futures.TimeoutError:
+                    if not future.cancel():
+                        return  # The put completed in the meantime
+            raise RuntimeError("commit history ingestion stopped")
+
+        def read_shard(shard: List[str]) -> None:
+            # Runs in a thread
+            batch: List[Dict[str, Any]] = []
+            for commit in iter_commits_with_patches(repo, only=shard):
+                if stop.is_set():
+                    return
+                batch.append(self._commit_record(commit, repo_url_str))
+                if len(batch) >= COMMIT_INGEST_BATCH_SIZE:
+                    flush(batch)
+                    batch = []
+            if batch:
+                flush(batch)
+
+        def flush(batch: List[Dict[str, Any]]) -> None:
+            if diff_cache is not None:
+                try:
+                    diff_cache.put_many(repo_url_str, [(c["commit_sha"], c["diff_text"]) for c in batch])
+                except Exception as e:
+                    print(f"CommitHistorian: Could not cache diffs: {e}")
+            put_batch(batch)
+
+        async def git_worker(shard: List[str]) -> None:
+            async with git_slots:
+                await asyncio.to_thread(read_shard, shard)
+
+        async def db_writer() -> None:
+            nonlocal stored_count
+            while True:
+                batch = await batches.get()
+                try:
+                    stored = await self._store_commit_batch(project_id, batch)
+                    stored_count += stored  # Not `+= await ...`: that would read stored_count before the await
+                    if COMMIT_EMBED_DIFFS and stored:
+                        try:
+                            await embed_commit_diffs(str(project_id), batch)
+                        except Exception as e_embed:
+                            print(f"CommitHistorian: Could not embed the diffs of {len(batch)} commits: {e_embed}")
+                    await self._save_checkpoint(project_id, last_commit_sha=batch[-1]["commit_sha"],
+                                                commits_stored=commits_skipped + stored_count)
+                    print(f"CommitHistorian: Successfully processed {stored_count} commits so far.")
+                finally:
+                    batches.task_done()
+
+        writers = [asyncio.create_task(db_writer()) for _ in range(db_concurrency)]
+        readers = [
+            asyncio.create_task(git_worker(shas[i:i + COMMIT_GIT_SHARD_SIZE]))
+            for i in range(0, len(shas), COMMIT_GIT_SHARD_SIZE)
+        ]
+        try:
+            await asyncio.gather(*readers)
+            await batches.join()
+        finally:
+            stop.set()
+            for task in readers + writers:
+                task.cancel()
+            await asyncio.gather(*readers, *writers, return_exceptions=True)
+        return stored_count
+
+    async def _save_checkpoint(self, project_id: uuid.UUID, **fields: Any) -> None:
+        """Best effort: a missing checkpoint only costs a longer resume, so failures are logged and ignored."""
+        fields = {k: v for k, v in fields.items() if v is not None or k in ("error", "completed_at")}
+        try:
+            await supabase_service.save_ingestion_checkpoint(str(project_id), **fields)
+        except Exception as e:
+            print(f"CommitHistorian: Could not save ingestion checkpoint for project {project_id}: {e}")
+
+    async def _store_commit_batch(self, project_id: uuid.UUID, commits: List[Dict[str, Any]]) -> int:
+        """Bulk-store a batch of commits; returns how many were stored. A failed batch is logged, not raised."""
+        if not commits:
+            return 0
+        try:
+            stored = await supabase_service.store_commits_bulk(str(project_id), commits)
+            return len(stored)
+        except Exception as e_store:
+            print(f"CommitHistorian: Error storing {len(commits)} commits ({commits[0]['commit_sha'][:7]}..{commits[-1]['commit_sha'][:7]}): {e_store}")
+            return 0
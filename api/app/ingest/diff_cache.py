@@ -0,0 +1,171 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from .repo_cache import RepoMirrorCache
+from ..core.compression import DEFAULT_CODEC, compress_text, decompress_text
+from ..core.config import DIFF_CACHE_ENABLED, DIFF_CACHE_PATH, DIFF_CACHE_MAX_BYTES
+
+EVICTION_BATCH_SIZE = 1000
+EVICTION_LOW_WATERMARK = 0.9  # Evict down to 90% of the budget so every insert doesn't trigger eviction
+
+
+class DiffCache:
+    """
+    Persistent cache of commit diffs backed by a local SQLite file.
+
+    A commit's diff never changes, so entries are keyed by (repo, commit SHA) and never
+    revalidated. Diffs are stored zstd-compressed (zlib when the zstandard package is not
+    installed). The file is size-bounded on the compressed bytes: least recently used entries
+    are evicted first. hits/misses are counted per instance for the hit rate. As in
+    EmbeddingCache, the size is read from the table inside the write transaction, since several
+    processes may share the file. An entry that cannot be decoded counts as a miss.
+
+    Filled by get_commit_diff (webhook pushes) and by CommitHistorian, whose `git log -p`
+    output is stored too, so commits already ingested are never downloaded.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.path = path or DIFF_CACHE_PATH
+        self.max_bytes = max_bytes if max_bytes is not None else DIFF_CACHE_MAX_BYTES
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS diffs (
+                repo TEXT NOT NULL,
+                commit_sha TEXT NOT NULL,
+                codec TEXT NOT NULL,
+                diff BLOB NOT NULL,
+                nbytes INTEGER NOT NULL,
+                raw_bytes INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (repo, commit_sha)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_diffs_last_used ON diffs(last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def repo_key(repo_url: str) -> str:
+        # Same identity as the mirror cache: https://github.com/o/r, .../o/r.git and URLs with credentials agree
+        return RepoMirrorCache.cache_key(repo_url)
+
+    def get(self, repo_url: str, commit_sha: str) -> Optional[str]:
+        """The cached diff of the commit, or None on a miss."""
+        repo = self.repo_key(repo_url)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT codec, diff FROM diffs WHERE repo = ? AND commit_sha = ?", (repo, commit_sha)
+            ).fetchone()
+            diff_text = None
+            if row:
+                try:
+                    diff_text = decompress_text(*row)
+                except Exception as e:
+                    # e.g. zstd written by a process that had zstandard, or a corrupt blob; refetch instead
+                    print(f"DiffCache: could not decode the cached diff of {commit_sha} ({row[0]}): {e}")
+            if diff_text is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE diffs SET last_used = ? WHERE repo = ? AND commit_sha = ?", (time.time(), repo, commit_sha))
+            self._conn.commit()
+            self.hits += 1
+        return diff_text
+
+    def put_many(self, repo_url: str, diffs: Sequence[Tuple[str, Optional[str]]]) -> None:
+        """Store (commit_sha, diff_text) pairs. Empty diffs are skipped; existing entries are kept."""
+        repo = self.repo_key(repo_url)
+        rows = []
+        for commit_sha, diff_text in diffs:
+            if diff_text:
+                codec, blob = compress_text(diff_text)
+                rows.append((repo, commit_sha, codec, blob, len(blob), len(diff_text.encode("utf-8"))))
+        if not rows:
+            return
+        now = time.time()
+        with self._lock:
+            # The first insert takes SQLite's write lock, so the total read below includes
+            # every other process's committed entries and cannot change until we commit
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO diffs (repo, commit_sha, codec, diff, nbytes, raw_bytes, last_used) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(*row, now) for row in rows],
+            )
+            total_bytes = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM diffs").fetchone()[0]
+            if total_bytes > self.max_bytes:
+                self._evict(total_bytes)
+            self._conn.commit()
+
+    def put(self, repo_url: str, commit_sha: str, diff_text: Optional[str]) -> None:
+        self.put_many(repo_url, [(commit_sha, diff_text)])
+
+    def _evict(self, total_bytes: int) -> None:
+        """
+        Drop least-recently-used entries until the cache is under the low watermark.
+        Caller holds the lock and the write transaction, and commits afterwards.
+        """
+        target = int(self.max_bytes * EVICTION_LOW_WATERMARK)
+        evicted = 0
+        while total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT repo, commit_sha, nbytes FROM diffs ORDER BY last_used LIMIT ?",
+                (EVICTION_BATCH_SIZE,),
+            ).fetchall()
+            if not rows:
+                break
+            for repo, commit_sha, nbytes in rows:
+                if total_bytes <= target:
+                    break
+                self._conn.execute("DELETE FROM diffs WHERE repo = ? AND commit_sha = ?", (repo, commit_sha))
+                total_bytes -= nbytes
+                evicted += 1
+        print(f"DiffCache: evicted {evicted} entries, {total_bytes / (1024 * 1024):.1f}MB in use")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, raw_bytes, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(raw_bytes), 0), COALESCE(SUM(nbytes), 0) FROM diffs"
+            ).fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "entries": entries,
+                "bytes": total_bytes,
+                "compression_ratio": (raw_bytes / total_bytes) if total_bytes else 0.0,
+                "codec": DEFAULT_CODEC,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_diff_cache: Optional[DiffCache] = None
+_diff_cache_failed = False
+_diff_cache_lock = threading.Lock()
+
+
+def get_diff_cache() -> Optional[DiffCache]:
+    """Process-wide diff cache, or None when it is disabled or cannot be opened."""
+    global _diff_cache, _diff_cache_failed
+    if not DIFF_CACHE_ENABLED:
+        return None
+    with _diff_cache_lock:
+        if _diff_cache is None and not _diff_cache_failed:
+            try:
+                _diff_cache = DiffCache()
+            except Exception as e:
+                _diff_cache_failed = True
+                print(f"Warning: diff cache unavailable, every diff will be downloaded: {e}")
+        return _diff_cache
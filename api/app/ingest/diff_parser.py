@@ -0,0 +1,159 @@
+"""
+Streaming parser for unified diffs (`git diff`, `git log -p`, GitHub's commit .diff).
+
+iter_diff_hunks() reads the diff line by line from any iterable (a StringIO over the text, a
+file, a git process's stdout) and yields each hunk as soon as it is complete, so a diff is
+never held in memory as a whole. Hunk bodies are delimited by the line counts in their
+`@@` header, so removed lines that look like headers ("--- ...") are not misread.
+"""
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from .git_log import _unquote_path
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@ ?(.*)$")
+_DEV_NULL = "/dev/null"
+
+Hunk = Dict[str, Any]
+
+
+def _strip_prefix(path: str) -> Optional[str]:
+    """Path from a ---/+++ line: None for /dev/null, a/ and b/ prefixes removed."""
+    path = _unquote_path(path.split("\t", 1)[0].rstrip())
+    if path == _DEV_NULL:
+        return None
+    return path[2:] if path[:2] in ("a/", "b/") else path
+
+
+def _git_header_paths(line: str) -> Dict[str, Optional[str]]:
+    # "diff --git a/old b/new". Ambiguous when paths contain " b/"; ---/+++ or rename lines correct it later
+    rest = line[len("diff --git "):].rstrip("\n")
+    if rest.startswith('"'):
+        end = rest.find('" ', 1)
+        old, new = rest[:end + 1], rest[end + 2:]
+    else:
+        old, _, new = rest.partition(" b/")
+        new = "b/" + new
+    return {"old_path": _strip_prefix(old), "new_path": _strip_prefix(new)}
+
+
+def _new_file(**fields: Any) -> Dict[str, Any]:
+    info = {"old_path": None, "new_path": None, "status": "modified", "is_binary": False}
+    info.update(fields)
+    return info
+
+
+def _file_fields(info: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "file_path": info["new_path"] or info["old_path"] or "unknown",
+        "old_path": info["old_path"],
+        "status": info["status"],
+        "is_binary": info["is_binary"],
+    }
+
+
+def iter_diff_hunks(lines: Iterable[str]) -> Iterator[Hunk]:
+    """
+    Yield every hunk of a unified diff, in order, as a dict with:
+        file_path (new path, or the old one for deletions), old_path, status
+        ('added' | 'deleted' | 'modified' | 'renamed'), is_binary,
+        header (the @@ line), section (function context after @@),
+        old_start, old_count, new_start, new_count,
+        lines (the hunk body, each line keeping its ' ', '+', '-' or '\\' prefix, without newline)
+    Files without hunks (binary files, pure renames, mode changes) yield a single entry with
+    header None and no lines, so they are not lost.
+    """
+    info: Optional[Dict[str, Any]] = None
+    emitted = False  # Whether the current file produced anything yet
+    hunk: Optional[Hunk] = None
+    old_left = new_left = 0
+
+    def file_without_hunks() -> Optional[Hunk]:
+        if info is None or emitted:
+            return None
+        return {**_file_fields(info), "header": None, "section": "", "old_start": 0, "old_count": 0,
+                "new_start": 0, "new_count": 0, "lines": []}
+
+    for raw in lines:
+        line = raw[:-1] if raw.endswith("\n") else raw
+
+        if hunk is not None:
+            tag = line[:1]
+            if tag == "\\":
+                hunk["lines"].append(line)  # "\ No newline at end of file"
+                continue
+            if tag == "+" and new_left > 0:
+                new_left -= 1
+            elif tag == "-" and old_left > 0:
+                old_left -= 1
+            elif tag in (" ", "") and old_left > 0 and new_left > 0:
+                old_left -= 1
+                new_left -= 1
+                line = line or " "  # Some tools strip the space of empty context lines
+            else:
+                # Hunk complete (or malformed); this line belongs to what follows
+                yield hunk
+                hunk = None
+            if hunk is not None:
+                hunk["lines"].append(line)
+                continue
+
+        match = _HUNK_HEADER.match(line) if line.startswith("@@") else None
+        if match and info is not None:
+            old_start, old_count, new_start, new_count, section = match.groups()
+            hunk = {
+                **_file_fields(info), "header": line, "section": section.strip(),
+                "old_start": int(old_start), "old_count": int(old_count) if old_count is not None else 1,
+                "new_start": int(new_start), "new_count": int(new_count) if new_count is not None else 1,
+                "lines": [],
+            }
+            old_left, new_left = hunk["old_count"], hunk["new_count"]
+            emitted = True
+            continue
+
+        if line.startswith("diff --git "):
+            pending = file_without_hunks()
+            if pending:
+                yield pending
+            info, emitted = _new_file(**_git_header_paths(line)), False
+        elif line.startswith("--- ") and (info is None or emitted or info.get("has_minus")):
+            # A plain `diff -u` file header (no "diff --git" line)
+            pending = file_without_hunks()
+            if pending:
+                yield pending
+            info, emitted = _new_file(old_path=_strip_prefix(line[4:]), has_minus=True), False
+        elif info is None:
+            continue  # Preamble (e.g. a commit message) before the first file
+        elif line.startswith("--- "):
+            info["old_path"] = _strip_prefix(line[4:])
+            info["has_minus"] = True
+        elif line.startswith("+++ "):
+            info["new_path"] = _strip_prefix(line[4:])
+            if info["old_path"] is None and info.get("has_minus"):
+                info["status"] = "added"
+            if info["new_path"] is None:
+                info["status"] = "deleted"
+        elif line.startswith("new file mode"):
+            info["status"] = "added"
+        elif line.startswith("deleted file mode"):
+            info["status"] = "deleted"
+        elif line.startswith("rename from "):
+            info["old_path"] = _unquote_path(line[len("rename from "):])
+            info["status"] = "renamed"
+        elif line.startswith("rename to "):
+            info["new_path"] = _unquote_path(line[len("rename to "):])
+            info["status"] = "renamed"
+        elif line.startswith("Binary files ") or line.startswith("GIT binary patch"):
+            info["is_binary"] = True
+
+    if hunk is not None:
+        yield hunk
+    pending = file_without_hunks()
+    if pending:
+        yield pending
+
+
+def hunk_new_range(hunk: Hunk) -> List[int]:
+    """[first, last] new-side line numbers covered by the hunk (first == last for pure deletions)."""
+    start = hunk["new_start"]
+    return [start, start + max(hunk["new_count"], 1) - 1]
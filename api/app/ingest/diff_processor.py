@@ -1,3 +1,4 @@
+import asyncio
 import httpx # For making HTTP requests to get diff
 import os
 from typing import Dict, Any, Optional, List
@@ -9,12 +10,17 @@ import uuid
 # from ..routes.webhook import GitHubCommit, GitHubRepository, GitHubPusher # Adjust path as needed
 
 from ..services import supabase_service # Import the Supabase service
+from ..services.github_client import GitHubFetchClient, github_client
+from .diff_cache import get_diff_cache
+from .diff_splitter import embed_commit_diffs
 # Placeholder for LLM utility functions
 # from ..core import llm_utils 
 
 # Import email sending utility and config from the new core.email_utils module
 from ..core.email_utils import send_feature_completion_email, DESIGNATED_EMAIL_ADDRESS
 
+PUSH_DIFF_CONCURRENCY = int(os.getenv("PUSH_DIFF_CONCURRENCY", "8"))  # Diffs fetched in parallel per push
+
 # Environment variables for LLM provider
 # if os.getenv("OPENAI_API_KEY"):
 #     openai.api_key = os.getenv("OPENAI_API_KEY")
@@ -25,19 +31,31 @@ from ..core.email_utils import send_feature_completion_email, DESIGNATED_EMAIL_A
 # However, for background tasks that might run in separate processes, initializing per call can be safer.
 # client = openai.AsyncOpenAI() # if using openai > v1.0.0
 
-async def get_commit_diff(repo_html_url: str, commit_sha: str) -> Optional[str]:
-    """Fetches the diff for a given commit SHA from its .diff URL."""
+async def get_commit_diff(repo_html_url: str, commit_sha: str, client: Optional[GitHubFetchClient] = None) -> Optional[str]:
+    """
+    Fetches the diff for a given commit SHA from its .diff URL, over the shared GitHub client unless
+    `client` is given. Diffs are immutable, so the local diff cache is checked first and filled after.
+    """
     diff_url = f"{repo_html_url}/commit/{commit_sha}.diff"
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(diff_url)
-            response.raise_for_status() # Raise an exception for bad status codes (4xx or 5xx)
-            return response.text
-        except httpx.HTTPStatusError as e:
-            print(f"Error fetching diff from {diff_url}: {e}")
-            # Optionally, handle specific statuses differently, e.g., 404 means commit not found or repo private
-        except httpx.RequestError as e:
-            print(f"Request error fetching diff from {diff_url}: {e}")
+    diff_cache = get_diff_cache()
+    if diff_cache is not None:
+        cached = await asyncio.to_thread(diff_cache.get, repo_html_url, commit_sha)
+        if cached is not None:
+            return cached
+    try:
+        if client is None:
+            async with github_client() as shared_client:
+                diff_text = await shared_client.get_text(diff_url)
+        else:
+            diff_text = await client.get_text(diff_url)
+        if diff_cache is not None:
+            await asyncio.to_thread(diff_cache.put, repo_html_url, commit_sha, diff_text)
+        return diff_text
+    except httpx.HTTPStatusError as e:
+        print(f"Error fetching diff from {diff_url}: {e}")
+        # Optionally, handle specific statuses differently, e.g., 404 means commit not found or repo private
+    except httpx.RequestError as e:
+        print(f"Request error fetching diff from {diff_url}: {e}")
     return None
 
 async def determine_feature_completion_and_name_llm(commit_message: str, diff_text: Optional[str]) -> Optional[str]:
@@ -92,6 +110,43 @@ async def determine_feature_completion_and_name_llm(commit_message: str, diff_te
     print("--- End Placeholder LLM ---")
     return feature_name
 
+async def notify_feature_completion(project_id: str, project_full_name: str, commit_payload: Dict[str, Any], diff_text: Optional[str]):
+    """Check whether a stored commit completes a feature and, if so, send the completion email."""
+    completed_feature_name = None
+    try:
+        commit_message = commit_payload.get("message", "")
+        completed_feature_name = await determine_feature_completion_and_name_llm(commit_message, diff_text)
+
+        # TEMPORARY: Always attempt to send email for testing, using a default feature name if LLM doesn't provide one.
+        # REMOVE/REVERT this block for production to only send emails for actual completed features.
+        if not completed_feature_name:
+            commit_id_short = commit_payload.get('id', 'unknown_commit')[:7]
+            completed_feature_name = f"GitHub Repository Import and Codebase Indexing Feature (commit: {commit_id_short})" # Default for testing
+            print(f"LLM (placeholder) did not identify a completed feature. Using default '{completed_feature_name}' for email testing.")
+        else:
+            print(f"Feature '{completed_feature_name}' deemed complete by LLM (placeholder) for project {project_full_name}.")
+    except Exception as e:
+        print(f"Error during feature completion check (determine_feature_completion_and_name_llm) for {commit_payload['id']}: {e}")
+        raise # Re-raise
+
+    try:
+        if completed_feature_name: # Ensure we have a feature name before trying to send
+            print(f"Proceeding to send feature completion email for '{completed_feature_name}' in project {project_full_name}.")
+            await send_feature_completion_email(
+                project_id=project_id,
+                project_name=project_full_name,
+                feature_name=completed_feature_name,
+                recipient_email=DESIGNATED_EMAIL_ADDRESS
+            )
+        else:
+            # This case might occur if determine_feature_completion_and_name_llm itself errored and completed_feature_name remained None
+            # or if the temporary block logic was changed.
+            print(f"Skipping email for commit {commit_payload['id']} as no feature name was determined (possibly due to an earlier error).")
+    except Exception as e:
+        print(f"Error during send_feature_completion_email for {commit_payload['id']} (feature: '{completed_feature_name}'): {e}")
+        raise # Re-raise
+
+
 async def process_github_commit_data(
     commit_payload: Dict[str, Any], 
     repository_payload: Dict[str, Any],
@@ -213,40 +268,7 @@ async def process_github_commit_data(
 
     # After successfully storing commit, check for feature completion
     # and send email if applicable.
-    completed_feature_name = None
-    project_full_name = repository_payload.get("full_name", "Unknown Project")
-    try:
-        commit_message = commit_payload.get("message", "")
-        completed_feature_name = await determine_feature_completion_and_name_llm(commit_message, diff_text)
-
-        # TEMPORARY: Always attempt to send email for testing, using a default feature name if LLM doesn't provide one.
-        # REMOVE/REVERT this block for production to only send emails for actual completed features.
-        if not completed_feature_name:
-            commit_id_short = commit_payload.get('id', 'unknown_commit')[:7]
-            completed_feature_name = f"GitHub Repository Import and Codebase Indexing Feature (commit: {commit_id_short})" # Default for testing
-            print(f"LLM (placeholder) did not identify a completed feature. Using default '{completed_feature_name}' for email testing.")
-        else:
-            print(f"Feature '{completed_feature_name}' deemed complete by LLM (placeholder) for project {project_full_name}.")
-    except Exception as e:
-        print(f"Error during feature completion check (determine_feature_completion_and_name_llm) for {commit_payload['id']}: {e}")
-        raise # Re-raise
-
-    try:
-        if completed_feature_name: # Ensure we have a feature name before trying to send
-            print(f"Proceeding to send feature completion email for '{completed_feature_name}' in project {project_full_name}.")
-            await send_feature_completion_email(
-                project_id=project_id,
-                project_name=project_full_name,
-                feature_name=completed_feature_name,
-                recipient_email=DESIGNATED_EMAIL_ADDRESS
-            )
-        else:
-            # This case might occur if determine_feature_completion_and_name_llm itself errored and completed_feature_name remained None
-            # or if the temporary block logic was changed.
-            print(f"Skipping email for commit {commit_payload['id']} as no feature name was determined (possibly due to an earlier error).")
-    except Exception as e:
-        print(f"Error during send_feature_completion_email for {commit_payload['id']} (feature: '{completed_feature_name}'): {e}")
-        raise # Re-raise
+    await notify_feature_completion(project_id, repository_payload.get("full_name", "Unknown Project"), commit_payload, diff_text)
 
     # Original logic (commented out for now during temporary always-send test):
     # if completed_feature_name:
@@ -264,6 +286,131 @@ async def process_github_commit_data(
     #     print(f"Error storing commit details for {commit_payload['id']} or during feature completion check/email: {e}")
     # Consider retry mechanisms or dead-letter queues for background tasks
 
+async def _resolve_users(identities: List[Dict[str, Any]]) -> None:
+    """get_or_create_user once per distinct (username, email, name) instead of once per commit."""
+    seen = set()
+    for identity in identities:
+        key = (identity.get("username"), identity.get("email"), identity.get("name"))
+        if key in seen:
+            continue
+        seen.add(key)
+        try:
+            await supabase_service.get_or_create_user(github_username=identity.get("username"), email=identity.get("email"), name=identity.get("name"))
+        except Exception as e:
+            print(f"Warning: Could not get/create user {identity.get('username') or identity.get('name')}: {e}")
+
+
+async def process_github_push(
+    commit_payloads: List[Dict[str, Any]],
+    repository_payload: Dict[str, Any],
+    pusher_payload: Dict[str, Any],
+    compare_url: str
+):
+    """
+    Push-level version of process_github_commit_data.
+
+    The pusher, the project and every distinct author/committer are resolved once per push,
+    the diffs of all commits are fetched concurrently over the shared GitHub client (at most
+    PUSH_DIFF_CONCURRENCY at a time), and all commits are stored with a single bulk write.
+    Their diff hunks are then embedded for commit history search, and feature completion is
+    checked per commit, as before.
+    """
+    if not commit_payloads:
+        return
+    print(f"Processing push of {len(commit_payloads)} commit(s) for repo: {repository_payload.get('full_name')}")
+
+    # 1. Pusher and project, once
+    project_owner_user_id = None
+    pusher_github_username = pusher_payload.get("name")
+    if pusher_github_username:
+        try:
+            pusher_user = await supabase_service.get_or_create_user(github_username=pusher_github_username, email=pusher_payload.get("email"))
+            project_owner_user_id = pusher_user.get("id") if pusher_user else None
+        except Exception as e:
+            print(f"Error getting or creating pusher user {pusher_github_username}: {e}")
+
+    project = await supabase_service.get_or_create_project(
+        github_repo_id=repository_payload["id"],
+        full_name=repository_payload["full_name"],
+        name=repository_payload["name"],
+        html_url=repository_payload.get("html_url"),
+        description=repository_payload.get("description"),
+        private=repository_payload.get("private", False),
+        user_id=project_owner_user_id
+    )
+    if not project or not project.get("id"):
+        raise Exception(f"Could not get or create project for {repository_payload['full_name']}")
+    project_id = project["id"]
+
+    # 2. Distinct authors and committers, once each
+    await _resolve_users([c.get(role) or {} for c in commit_payloads for role in ("author", "committer")])
+
+    # 3. Diffs, concurrently
+    slots = asyncio.Semaphore(PUSH_DIFF_CONCURRENCY)
+    async with github_client() as client:
+
+        async def fetch(commit_payload: Dict[str, Any]) -> Optional[str]:
+            async with slots:
+                diff_text = await get_commit_diff(repository_payload["html_url"], commit_payload["id"], client=client)
+            if diff_text is None:
+                print(f"Warning: Could not fetch diff for commit {commit_payload['id']}. Proceeding without it.")
+            return diff_text
+        diffs = await asyncio.gather(*(fetch(c) for c in commit_payloads))
+
+    # 4. One batched write for all commits and their files
+    records = []
+    for commit_payload, diff_text in zip(commit_payloads, diffs):
+        author_info = commit_payload.get("author") or {}
+        committer_info = commit_payload.get("committer") or {}
+        records.append({
+            "commit_sha": commit_payload["id"],
+            "message": commit_payload.get("message"),
+            "commit_timestamp": commit_payload.get("timestamp"),
+            "compare_url": compare_url, # The compare URL of the whole push
+            "author_name": author_info.get("name"),
+            "author_email": author_info.get("email"),
+            "author_github_username": author_info.get("username"),
+            "committer_name": committer_info.get("name"),
+            "committer_email": committer_info.get("email"),
+            "committer_github_username": committer_info.get("username"),
+            "pusher_name": pusher_payload.get("name"),
+            "pusher_email": pusher_payload.get("email"),
+            "diff_text": diff_text,
+            "raw_commit_payload": commit_payload,
+            "changed_files": [
+                {"file_path": file_path, "status": status_type}
+                for status_type in ("added", "removed", "modified")
+                for file_path in commit_payload.get(status_type, [])
+            ],
+        })
+    stored = await supabase_service.store_commits_bulk(project_id, records)
+    print(f"Stored {len(stored)} commit(s) of the push to {repository_payload.get('full_name')}")
+    diff_cache = get_diff_cache()
+    if diff_cache is not None:
+        cache_stats = diff_cache.stats()
+        print(f"Diff cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%} hit rate), "
+              f"{cache_stats['entries']} diffs, {cache_stats['bytes'] / (1024 * 1024):.1f}MB")
+
+    # 5. Diff chunk embeddings for commit history search. Best effort, like step 6: a failure
+    # here must not undo (or, via a retry, repeat) the work above, so it is only logged.
+    try:
+        await embed_commit_diffs(project_id, [
+            {"commit_sha": c["id"], "commit_id": stored.get(c["id"]), "message": c.get("message"), "diff_text": diff_text}
+            for c, diff_text in zip(commit_payloads, diffs)
+        ])
+    except Exception as e:
+        print(f"Embedding the diffs of the push to {repository_payload.get('full_name')} failed: {e}")
+
+    # 6. Feature completion per commit. A failure here must not undo (or, via a retry, repeat) the
+    # work above, so it is logged per commit.
+    project_full_name = repository_payload.get("full_name", "Unknown Project")
+    for commit_payload, diff_text in zip(commit_payloads, diffs):
+        try:
+            await notify_feature_completion(project_id, project_full_name, commit_payload, diff_text)
+        except Exception as e:
+            print(f"Feature completion notification failed for commit {commit_payload['id']}: {e}")
+
+
 # Example of how you might call this (e.g., from a test or another service)
 # if __name__ == "__main__":
 #     import asyncio
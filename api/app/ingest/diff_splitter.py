@@ -1,109 +1,361 @@
-# from .embeddings import generate_embeddings_for_chunks
-# from ..utils.supabase_client import get_supabase_client # Assuming a utility for this
-import uuid
+import asyncio
+import io
+import os
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
-# Placeholder for Supabase client, would be initialized and passed
-# supabase = None
+from openai import OpenAI, AsyncOpenAI
 
-async def process_github_push(payload: dict, supabase_client: any):
-    """Processes a GitHub push event payload, extracts diffs, chunks, and stores them."""
-    repo_name = payload.get('repository', {}).get('full_name')
+from .diff_parser import Hunk, iter_diff_hunks
+from .embedding_cache import EmbeddingCache
+from .embedding_models import get_model_limits, pack_batches
+from .embedding_scheduler import EmbeddingRequestError, get_embedding_scheduler
+from .tokenization import LineTokens, count_tokens, split_text_by_tokens
+from ..core.config import EMBEDDING_CACHE_ENABLED
+from ..services import supabase_service
+
+DIFF_CHUNK_MAX_TOKENS = int(os.getenv("DIFF_CHUNK_MAX_TOKENS", "1000"))  # Per embedded diff chunk
+HUNK_HEADER_TOKENS = 32  # Room left for the @@ header of a split hunk
+
+# Commit history search: diff chunks embedded into the diff_embeddings table
+DIFF_EMBEDDINGS_ENABLED = os.getenv("DIFF_EMBEDDINGS_ENABLED", "true").lower() == "true"
+DIFF_EMBEDDING_MODEL = os.getenv("DIFF_EMBEDDING_MODEL", "text-embedding-ada-002")  # diff_embeddings.embedding is vector(1536)
+DIFF_EMBED_CONCURRENCY = int(os.getenv("DIFF_EMBED_CONCURRENCY", "4"))  # Embedding requests in flight per push
+DIFF_SEARCH_THRESHOLD = 0.3
+
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_failed = False
+_openai_client: Optional[OpenAI] = None
+
+async def process_github_push(payload: dict, project_id: Optional[str] = None) -> int:
+    """
+    Embed the diffs of a GitHub push event's commits for commit history search.
+
+    The project is looked up by the repository's full name unless `project_id` is given.
+    Diffs come from get_commit_diff, so commits already fetched by the webhook pipeline are
+    served from the local diff cache. Returns the number of diff chunks stored.
+    """
+    # Imported here: diff_processor imports this module
+    from .diff_processor import get_commit_diff
+
+    repository = payload.get('repository') or {}
+    repo_name = repository.get('full_name')
     if not repo_name:
         print("Error: Repository name not found in payload.")
-        return
-
-    print(f"Processing push event for repository: {repo_name}")
-
-    for commit in payload.get('commits', []):
-        commit_sha = commit.get('id')
-        # TODO: Get the actual diff for the commit. 
-        # This might involve calling GitHub API if the diff isn't in the webhook payload
-        # or if it's truncated. For simplicity, we'll assume a diff is available or construct a mock one.
-        # Use githubkit or similar library if making API calls.
-
-        # Mock diff content for now
-        # In a real scenario, you'd parse files from commit data ('added', 'modified', 'removed')
-        # and fetch their diffs or content.
-        mock_diff_text = f"--- a/file1.py\n+++ b/file1.py\n@@ -1,1 +1,1 @@\n-old line\n+new line in {commit_sha[:7]}"
-        
-        print(f"  Commit SHA: {commit_sha}")
-        # TODO: Implement robust diff parsing and splitting logic
-        # For now, we'll treat the whole mock_diff_text as one chunk
-        chunks = split_diff_into_chunks(mock_diff_text) # Placeholder for actual chunking
-
-        if not chunks:
-            print(f"    No chunks generated for commit {commit_sha}.")
-            continue
+        return 0
+    if project_id is None:
+        project = await supabase_service.get_project_by_full_name(repo_name)
+        if not project:
+            print(f"Error: No project found for repository {repo_name}.")
+            return 0
+        project_id = project["id"]
 
-        # TODO: Generate embeddings for these chunks
-        # For now, using placeholder embeddings
-        # chunk_texts = [chunk['text'] for chunk in chunks]
-        # embeddings = await generate_embeddings_for_chunks(chunk_texts)
-        embeddings_placeholder = [[0.1] * 1536 for _ in chunks] # Assuming 1536 dim from OpenAI
-
-        records_to_insert = []
-        for i, chunk_data in enumerate(chunks):
-            records_to_insert.append({
-                "id": str(uuid.uuid4()),
-                "repo": repo_name,
-                "sha": commit_sha,
-                "text": chunk_data['text'],
-                "embedding": embeddings_placeholder[i]  # Use actual embedding
-                # TODO: Add other metadata like file_path, start_line, end_line from chunk_data
-            })
-        
-        if records_to_insert:
+    commits = payload.get('commits') or []
+    print(f"Processing push event for repository: {repo_name} ({len(commits)} commit(s))")
+    repo_html_url = repository.get('html_url') or f"https://github.com/{repo_name}"
+    diffs = await asyncio.gather(*(get_commit_diff(repo_html_url, commit['id']) for commit in commits))
+    return await embed_commit_diffs(str(project_id), [
+        {"commit_sha": commit['id'], "message": commit.get('message'), "diff_text": diff_text}
+        for commit, diff_text in zip(commits, diffs)
+    ])
+
+
+def _get_embedding_cache() -> Optional[EmbeddingCache]:
+    global _embedding_cache, _embedding_cache_failed
+    if not EMBEDDING_CACHE_ENABLED or _embedding_cache_failed:
+        return None
+    if _embedding_cache is None:
+        try:
+            _embedding_cache = EmbeddingCache()
+        except Exception as e:
+            _embedding_cache_failed = True
+            print(f"Warning: embedding cache unavailable, every diff chunk will be sent to OpenAI: {e}")
+    return _embedding_cache
+
+
+async def _embed_texts(texts: List[str], token_counts: List[int], api_key: str) -> List[Optional[List[float]]]:
+    """Embeddings for `texts` (None where a request failed), through the embedding cache and the shared rate limiter."""
+    results: List[Optional[List[float]]] = [None] * len(texts)
+    cache = _get_embedding_cache()
+    if cache is not None:
+        results = await asyncio.to_thread(cache.get_many, DIFF_EMBEDDING_MODEL, texts)
+    missing = [i for i, embedding in enumerate(results) if embedding is None]
+    if not missing:
+        return results
+
+    limits = get_model_limits(DIFF_EMBEDDING_MODEL)
+    batches = pack_batches([token_counts[i] for i in missing], limits['max_tokens_per_request'], limits['max_inputs'])
+    scheduler = get_embedding_scheduler(DIFF_EMBEDDING_MODEL)
+    slots = asyncio.Semaphore(DIFF_EMBED_CONCURRENCY)
+    # Retries and backoff are the scheduler's job; the client must not retry on its own
+    client = AsyncOpenAI(api_key=api_key, max_retries=0)
+
+    async def embed_batch(batch: List[int]) -> None:
+        indices = [missing[j] for j in batch]
+        batch_texts = [texts[i] for i in indices]
+        async with slots:
             try:
-                # TODO: Insert into Supabase
-                # _, error = await supabase_client.table("chunks").insert(records_to_insert).execute()
-                # if error:
-                #     print(f"    Error inserting chunks for commit {commit_sha}: {error}")
-                # else:
-                #     print(f"    Successfully inserted {len(records_to_insert)} chunks for commit {commit_sha}.")
-                print(f"    (Placeholder) Would insert {len(records_to_insert)} chunks for commit {commit_sha}.")
-            except Exception as e:
-                print(f"    Exception during Supabase insert for commit {commit_sha}: {e}")
-        else:
-            print(f"    No records to insert for commit {commit_sha}.")
-
-def split_diff_into_chunks(diff_text: str, max_chunk_size: int = 1000) -> list[dict]:
-    """Placeholder for diff splitting logic.
-    
-    A real implementation would parse the diff format (e.g., unidiff),
-    identify file changes, and then split code within those changes into manageable chunks.
-    It should try to respect logical boundaries (functions, classes).
+                embeddings = await scheduler.embed(client, DIFF_EMBEDDING_MODEL, batch_texts, sum(token_counts[i] for i in indices))
+            except EmbeddingRequestError as e:
+                print(f"    Error embedding {len(batch_texts)} diff chunks: {e}")
+                return
+        for i, embedding in zip(indices, embeddings):
+            results[i] = embedding
+        if cache is not None:
+            await asyncio.to_thread(cache.put_many, DIFF_EMBEDDING_MODEL, batch_texts, embeddings)
+
+    try:
+        await asyncio.gather(*(embed_batch(batch) for batch in batches))
+    finally:
+        await client.close()
+    return results
+
+
+async def embed_commit_diffs(project_id: str, commits: List[Dict[str, Any]]) -> int:
+    """
+    Split each commit's diff into hunk chunks (split_diff_into_chunks), embed them and store
+    them in diff_embeddings, replacing the commit's earlier chunks. Items of `commits`:
+        {'commit_sha', 'diff_text', optional 'commit_id' and 'message'}
+    The first line of the commit message is embedded with every chunk, so a query can match
+    what a change was for as well as what it touched. Returns the number of chunks stored.
     """
-    # Simplistic chunking: treat the whole diff as one chunk if small, or split by lines.
-    # This is NOT a good way to do it for actual semantic meaning.
-    print(f"Splitting diff (length {len(diff_text)}) into chunks.")
-    if not diff_text.strip():
+    if not DIFF_EMBEDDINGS_ENABLED:
+        return 0
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        print("Warning: OPENAI_API_KEY is not set; commit diffs are not embedded.")
+        return 0
+
+    rows: List[Dict[str, Any]] = []
+    texts: List[str] = []
+    token_counts: List[int] = []
+    commit_shas: List[str] = []
+    for commit in commits:
+        if not commit.get("diff_text"):
+            continue
+        commit_shas.append(commit["commit_sha"])
+        summary = (commit.get("message") or "").split("\n", 1)[0].strip()
+        summary_tokens = count_tokens(summary) if summary else 0
+        for chunk in split_diff_into_chunks(commit["diff_text"]):
+            texts.append(f"{summary}\n{chunk['text']}" if summary else chunk['text'])
+            token_counts.append(chunk['tokens'] + summary_tokens)
+            rows.append({
+                "commit_sha": commit["commit_sha"],
+                "commit_id": commit.get("commit_id"),
+                "file_path": chunk['file_path'],
+                "old_path": chunk['old_path'],
+                "change_status": chunk['status'],
+                "start_line": chunk['start_line'],
+                "end_line": chunk['end_line'],
+                "hunk_headers": [h for h in chunk['hunk_headers'] if h],
+                "content": chunk['text'],
+            })
+    if not rows:
+        return 0
+
+    started = time.perf_counter()
+    embeddings = await _embed_texts(texts, token_counts, api_key)
+    # A commit is only replaced once all of its chunks are embedded, so a failed request
+    # never erases chunks that were stored by an earlier run
+    failed_shas = {row["commit_sha"] for row, embedding in zip(rows, embeddings) if embedding is None}
+    complete_shas = [sha for sha in commit_shas if sha not in failed_shas]
+    embedded = []
+    for row, embedding in zip(rows, embeddings):
+        if row["commit_sha"] not in failed_shas:
+            row["embedding"] = embedding
+            embedded.append(row)
+    if failed_shas:
+        print(f"Warning: {len(failed_shas)} commit(s) had diff chunks that failed to embed; their stored chunks are left unchanged.")
+    inserted = await supabase_service.replace_diff_embeddings(project_id, complete_shas, embedded)
+    print(f"Embedded {inserted} of {len(rows)} diff chunks from {len(complete_shas)} of {len(commit_shas)} commit(s) "
+          f"in {time.perf_counter() - started:.1f}s.")
+    return inserted
+
+
+def _embed_query(query: str) -> List[float]:
+    global _openai_client
+    cache = _get_embedding_cache()
+    if cache is not None:
+        cached = cache.get_many(DIFF_EMBEDDING_MODEL, [query])[0]
+        if cached is not None:
+            return cached
+    if _openai_client is None:
+        _openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    embedding = _openai_client.embeddings.create(input=query, model=DIFF_EMBEDDING_MODEL).data[0].embedding
+    if cache is not None:
+        cache.put_many(DIFF_EMBEDDING_MODEL, [query], [embedding])
+    return embedding
+
+
+def search_commit_history_sync(query: str, project_id: Optional[str] = None, limit: int = 10,
+                               similarity_threshold: float = DIFF_SEARCH_THRESHOLD) -> List[Dict[str, Any]]:
+    """
+    Commits whose changes best match a natural-language query, best first:
+        {'project_id', 'commit_id', 'commit_sha', 'message', 'author_name', 'commit_timestamp',
+         'similarity', 'matched_chunks', 'files', 'best_file_path', 'best_start_line', 'best_end_line'}
+    Ranking runs in Postgres (search_commits RPC over the HNSW index), so only the top
+    commits cross the wire. project_id=None searches every project.
+    """
+    query_embedding = _embed_query(query)
+    return supabase_service.search_commits_sync(
+        query_embedding, str(project_id) if project_id is not None else None, limit, similarity_threshold,
+    )
+
+
+async def search_commit_history(query: str, project_id: Optional[str] = None, limit: int = 10,
+                                similarity_threshold: float = DIFF_SEARCH_THRESHOLD) -> List[Dict[str, Any]]:
+    """Async version of search_commit_history_sync (the OpenAI and Supabase clients are synchronous)."""
+    return await asyncio.to_thread(search_commit_history_sync, query, project_id, limit, similarity_threshold)
+
+
+def _file_header(hunk: Hunk) -> str:
+    old = f"a/{hunk['old_path'] or hunk['file_path']}" if hunk["status"] != "added" else "/dev/null"
+    new = f"b/{hunk['file_path']}" if hunk["status"] != "deleted" else "/dev/null"
+    return f"--- {old}\n+++ {new}"
+
+
+def _line_positions(hunk: Hunk) -> List[Tuple[int, int]]:
+    """(old line, new line) at which each body line of the hunk sits."""
+    positions = []
+    old_no, new_no = hunk["old_start"], hunk["new_start"]
+    for line in hunk["lines"]:
+        positions.append((old_no, new_no))
+        tag = line[:1]
+        if tag == " ":
+            old_no += 1
+            new_no += 1
+        elif tag == "-":
+            old_no += 1
+        elif tag == "+":
+            new_no += 1
+    return positions
+
+
+def _piece(hunk: Hunk, lines: List[str], positions: List[Tuple[int, int]], header: Optional[str] = None) -> Dict[str, Any]:
+    """A hunk, or a slice of one, with an @@ header describing exactly its lines."""
+    new_lines = [pos[1] for line, pos in zip(lines, positions) if line[:1] in (" ", "+")]
+    if header is None:
+        old_count = sum(1 for line in lines if line[:1] in (" ", "-"))
+        section = f" {hunk['section']}" if hunk["section"] else ""
+        header = f"@@ -{positions[0][0]},{old_count} +{positions[0][1]},{len(new_lines)} @@{section}"
+    text = "\n".join([header, *lines])
+    return {
+        "text": text,
+        "tokens": count_tokens(text),
+        "header": header,
+        # New-side lines the piece covers; a pure deletion points at where the lines were
+        "start_line": new_lines[0] if new_lines else positions[0][1],
+        "end_line": new_lines[-1] if new_lines else positions[0][1],
+    }
+
+
+def _boundary_rank(lines: List[str], k: int) -> int:
+    """How good a place it is to cut a hunk before lines[k]: 2 = a new top-level statement, 1 = after a blank line."""
+    body = lines[k][1:]
+    if body and not body[0].isspace() and body[0] not in ")]}" and not body.startswith(("else", "elif", "except", "finally", "catch")):
+        return 2
+    if not lines[k - 1][1:].strip():
+        return 1
+    return 0
+
+
+def _split_hunk(hunk: Hunk, max_tokens: int) -> List[Dict[str, Any]]:
+    """Pieces of at most ~max_tokens tokens. Oversized hunks are cut at logical boundaries when possible."""
+    lines = hunk["lines"]
+    if not lines:
+        return []
+    positions = _line_positions(hunk)
+    whole = _piece(hunk, lines, positions, header=hunk["header"])
+    if whole["tokens"] <= max_tokens:
+        return [whole]
+
+    line_tokens = LineTokens(lines)
+    budget = max(1, max_tokens - HUNK_HEADER_TOKENS)
+    pieces = []
+    i = 0
+    while i < len(lines):
+        j = i
+        while j < len(lines) and line_tokens.count(i, j + 1) <= budget:
+            j += 1
+        if j == i:
+            # A single line over the budget: cut the line itself
+            for part, _ in split_text_by_tokens(lines[i], budget):
+                pieces.append(_piece(hunk, [part], [positions[i]]))
+            i += 1
+            continue
+        if j < len(lines):
+            # Prefer the best boundary in the second half of the window, nearest to its end
+            best_k, best_rank = j, 0
+            for k in range(j, i + (j - i) // 2, -1):
+                rank = _boundary_rank(lines, k)
+                if rank > best_rank:
+                    best_k, best_rank = k, rank
+                    if rank == 2:
+                        break
+            j = best_k
+        pieces.append(_piece(hunk, lines[i:j], positions[i:j]))
+        i = j
+    return pieces
+
+
+def _chunk(pieces: List[Dict[str, Any]], hunk: Hunk, file_header: str) -> Dict[str, Any]:
+    return {
+        "text": "\n".join([file_header, *(p["text"] for p in pieces)]),
+        "file_path": hunk["file_path"],
+        "old_path": hunk["old_path"],
+        "status": hunk["status"],
+        "start_line": min(p["start_line"] for p in pieces),
+        "end_line": max(p["end_line"] for p in pieces),
+        "hunk_headers": [p["header"] for p in pieces],
+        "tokens": count_tokens(file_header) + sum(p["tokens"] for p in pieces),
+    }
+
+
+def iter_diff_chunks(lines: Iterable[str], max_tokens: int = DIFF_CHUNK_MAX_TOKENS) -> Iterator[Dict[str, Any]]:
+    """
+    Stream a unified diff (any iterable of lines) into embedding-sized chunks:
+        {'text', 'file_path', 'old_path', 'status', 'start_line', 'end_line', 'hunk_headers', 'tokens'}
+    Every chunk belongs to one file and starts with its ---/+++ header. Consecutive hunks of a
+    file are merged while they fit in max_tokens; larger hunks are split (see _split_hunk).
+    start_line/end_line are the new-side line range covered. Files without textual hunks
+    (binary, pure renames) get one short chunk describing the change.
+    """
+    current: Optional[Hunk] = None  # First hunk of the file being merged
+    file_header = ""
+    pending: List[Dict[str, Any]] = []
+    pending_tokens = 0
+
+    for hunk in iter_diff_hunks(lines):
+        if current is None or hunk["file_path"] != current["file_path"] or hunk["old_path"] != current["old_path"]:
+            if pending:
+                yield _chunk(pending, current, file_header)
+            current, file_header, pending, pending_tokens = hunk, _file_header(hunk), [], 0
+        if hunk["header"] is None:
+            note = "Binary file changed" if hunk["is_binary"] else f"File {hunk['status']}, no textual changes"
+            pending.append({"text": note, "tokens": count_tokens(note), "header": None, "start_line": 0, "end_line": 0})
+            continue
+        budget = max(1, max_tokens - count_tokens(file_header))
+        for piece in _split_hunk(hunk, budget):
+            if pending and pending_tokens + piece["tokens"] > budget:
+                yield _chunk(pending, current, file_header)
+                pending, pending_tokens = [], 0
+            pending.append(piece)
+            pending_tokens += piece["tokens"]
+    if pending:
+        yield _chunk(pending, current, file_header)
+
+
+def split_diff_into_chunks(diff_text: str, max_tokens: int = DIFF_CHUNK_MAX_TOKENS) -> List[Dict[str, Any]]:
+    """Split a unified diff into per-file, hunk-aligned chunks of at most ~max_tokens tokens (see iter_diff_chunks)."""
+    if not diff_text or not diff_text.strip():
         return []
-    
-    # TODO: Implement proper diff parsing and chunking (e.g., by file, then by hunk, then by logical blocks)
-    # For now, just a very naive single chunk:
-    return [{
-        "text": diff_text,
-        "file_path": "unknown_file.py", # Placeholder
-        "start_line": 0, # Placeholder
-        "end_line": diff_text.count('\n') # Placeholder
-    }]
-
-# Example usage (for testing, not part of the main flow directly here)
-# async def main_test():
-#     mock_payload = {
-#         'repository': {'full_name': 'test/repo'},
-#         'commits': [{'id': 'abcdef123456', 'message': 'Test commit'}]
-#     }
-#     # Mock Supabase client
-#     class MockSupabase:
-#         def table(self, name):
-#             class MockTable:
-#                 async def insert(self, records):
-#                     print(f"MockSupabase: Inserting {len(records)} records into {name}")
-#                     return records, None # (data, error)
-#             return MockTable()
-#     await process_github_push(mock_payload, MockSupabase())
+    chunks = list(iter_diff_chunks(io.StringIO(diff_text), max_tokens))
+    print(f"Split diff ({len(diff_text)} chars) into {len(chunks)} chunk(s).")
+    return chunks
 
+# Example usage (embeds the given commits of an already imported project):
 # if __name__ == '__main__':
-#     import asyncio
-#     asyncio.run(main_test()) 
\ No newline at end of file
+#     asyncio.run(process_github_push({
+#         'repository': {'full_name': 'org/repo', 'html_url': 'https://github.com/org/repo'},
+#         'commits': [{'id': '<commit sha>', 'message': 'Add login flow'}],
+#     }))
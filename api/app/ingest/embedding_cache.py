@@ -0,0 +1,148 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import time
+import numpy as np
+from typing import List, Dict, Any, Optional, Sequence
+
+from ..core.config import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_BYTES
+
+LOOKUP_BATCH_SIZE = 500  # Stay below SQLite's bound-parameter limit for `IN (...)` lookups
+EVICTION_BATCH_SIZE = 1000
+EVICTION_LOW_WATERMARK = 0.9  # Evict down to 90% of the budget so every insert doesn't trigger eviction
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed embedding cache backed by a local SQLite file.
+
+    Entries are keyed by (model, sha256(chunk text)) and store the vector as raw float32
+    bytes. The file is size-bounded: once the stored vectors exceed max_bytes the least
+    recently used entries are evicted. hits/misses are counted per instance so callers can
+    report how many embedding API inputs were saved.
+
+    Several processes (API, job worker) may share the file, so the size is re-read from the
+    table in the same write transaction that inserts and evicts, never tracked in memory.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.path = path or EMBEDDING_CACHE_PATH
+        self.max_bytes = max_bytes if max_bytes is not None else EMBEDDING_CACHE_MAX_BYTES
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_sha256 TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                nbytes INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_sha256)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def text_key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Return one embedding (or None on a miss) per input text, in input order."""
+        keys = [self.text_key(text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        now = time.time()
+
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            for i in range(0, len(unique_keys), LOOKUP_BATCH_SIZE):
+                batch = unique_keys[i:i + LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_sha256, vector FROM embeddings WHERE model = ? AND text_sha256 IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_sha256 = ?",
+                    [(now, model, key) for key in found],
+                )
+                self._conn.commit()
+
+            results = [found.get(key) for key in keys]
+            hit_count = sum(1 for r in results if r is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+        return results
+
+    def put_many(self, model: str, texts: Sequence[str], embeddings: Sequence[Sequence[float]]) -> None:
+        now = time.time()
+        rows = []
+        for text, embedding in zip(texts, embeddings):
+            blob = np.asarray(embedding, dtype=np.float32).tobytes()
+            rows.append((model, self.text_key(text), blob, len(blob), now))
+        if not rows:
+            return
+        with self._lock:
+            # The first insert takes SQLite's write lock, so the total read below includes
+            # every other process's committed entries and cannot change until we commit
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, text_sha256, vector, nbytes, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            total_bytes = self._stored_bytes()
+            if total_bytes > self.max_bytes:
+                self._evict(total_bytes)
+            self._conn.commit()
+
+    def _stored_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()[0]
+
+    def _evict(self, total_bytes: int) -> None:
+        """
+        Drop least-recently-used entries until the cache is under the low watermark.
+        Caller holds the lock and the write transaction, and commits afterwards.
+        """
+        target = int(self.max_bytes * EVICTION_LOW_WATERMARK)
+        evicted = 0
+        while total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT model, text_sha256, nbytes FROM embeddings ORDER BY last_used LIMIT ?",
+                (EVICTION_BATCH_SIZE,),
+            ).fetchall()
+            if not rows:
+                break
+            for model, key, nbytes in rows:
+                if total_bytes <= target:
+                    break
+                self._conn.execute("DELETE FROM embeddings WHERE model = ? AND text_sha256 = ?", (model, key))
+                total_bytes -= nbytes
+                evicted += 1
+        print(f"EmbeddingCache: evicted {evicted} entries, {total_bytes / (1024 * 1024):.1f}MB in use")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, total_bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "entries": entries,
+                "bytes": total_bytes,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,60 @@
+import os
+from typing import List, Dict, Any, Sequence
+
+# Per-model request limits of the OpenAI embeddings endpoint.
+#   max_inputs:             texts accepted in one request
+#   max_tokens_per_request: sum of input tokens accepted in one request
+#   max_tokens_per_input:   context length of a single input
+EMBEDDING_MODELS: Dict[str, Dict[str, Any]] = {
+    "text-embedding-ada-002": {"dimensions": 1536, "max_inputs": 2048, "max_tokens_per_request": 300000, "max_tokens_per_input": 8191},
+    "text-embedding-3-small": {"dimensions": 1536, "max_inputs": 2048, "max_tokens_per_request": 300000, "max_tokens_per_input": 8191},
+    "text-embedding-3-large": {"dimensions": 3072, "max_inputs": 2048, "max_tokens_per_request": 300000, "max_tokens_per_input": 8191},
+}
+# Used for models missing from the registry: small enough for any current embeddings model
+DEFAULT_MODEL_LIMITS = {"dimensions": None, "max_inputs": 256, "max_tokens_per_request": 8191, "max_tokens_per_input": 8191}
+
+# count_tokens falls back to a chars/4 estimate when tiktoken is missing, so only fill
+# a request up to this fraction of its real limit.
+TOKEN_BUDGET_HEADROOM = float(os.getenv("EMBEDDING_TOKEN_BUDGET_HEADROOM", "0.8"))
+# Optional hard caps on top of the model limits (0 = use the model limit)
+MAX_INPUTS_OVERRIDE = int(os.getenv("EMBEDDING_MAX_INPUTS_PER_REQUEST", "0"))
+MAX_TOKENS_OVERRIDE = int(os.getenv("EMBEDDING_MAX_TOKENS_PER_REQUEST", "0"))
+
+
+def get_model_limits(model: str) -> Dict[str, Any]:
+    """Request limits for `model`, with the deployment's overrides applied."""
+    limits = dict(EMBEDDING_MODELS.get(model, DEFAULT_MODEL_LIMITS))
+    limits["max_tokens_per_request"] = int(limits["max_tokens_per_request"] * TOKEN_BUDGET_HEADROOM)
+    if MAX_INPUTS_OVERRIDE:
+        limits["max_inputs"] = min(limits["max_inputs"], MAX_INPUTS_OVERRIDE)
+    if MAX_TOKENS_OVERRIDE:
+        limits["max_tokens_per_request"] = min(limits["max_tokens_per_request"], MAX_TOKENS_OVERRIDE)
+    return limits
+
+
+def pack_batches(token_counts: Sequence[int], max_tokens: int, max_inputs: int) -> List[List[int]]:
+    """
+    Group item indices into as few requests as possible (first-fit decreasing).
+
+    Items are placed longest first into the first batch with room for both their tokens and
+    one more input. Each returned batch lists its indices in ascending (original) order and
+    batches are ordered by their first index, so writes follow the input order as closely
+    as the packing allows.
+    """
+    order = sorted(range(len(token_counts)), key=lambda i: token_counts[i], reverse=True)
+    batches: List[List[int]] = []
+    batch_tokens: List[int] = []
+    for i in order:
+        tokens = token_counts[i]
+        for b, used in enumerate(batch_tokens):
+            if used + tokens <= max_tokens and len(batches[b]) < max_inputs:
+                batches[b].append(i)
+                batch_tokens[b] = used + tokens
+                break
+        else:
+            batches.append([i])
+            batch_tokens.append(tokens)
+    for batch in batches:
+        batch.sort()
+    batches.sort(key=lambda batch: batch[0])
+    return batches
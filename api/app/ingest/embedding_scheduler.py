@@ -0,0 +1,199 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import List, Dict, Any, Optional, Sequence
+
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
+
+from ..core.config import (
+    EMBEDDING_RPM_LIMIT, EMBEDDING_TPM_LIMIT, EMBEDDING_MAX_RETRIES,
+    EMBEDDING_BACKOFF_BASE_SECONDS, EMBEDDING_BACKOFF_MAX_SECONDS,
+)
+
+THROUGHPUT_WINDOW_SECONDS = 60.0
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class EmbeddingRequestError(Exception):
+    """An embeddings request failed. `retryable` is False for errors a retry cannot fix (e.g. 400s)."""
+
+    def __init__(self, message: str, retryable: bool):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class TokenBucket:
+    """
+    Continuously refilled budget of `per_minute` units with a burst size of one minute.
+
+    reserve() debits immediately (the balance may go negative) and returns how long the
+    caller must wait before spending. Because the wait is computed under a plain lock the
+    bucket can be shared by several threads and event loops.
+    """
+
+    def __init__(self, per_minute: float):
+        self.per_minute = float(per_minute)
+        self.capacity = float(per_minute)
+        self._available = float(per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._available = min(self.capacity, self._available + (now - self._updated) * self.per_minute / 60.0)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        # A single request larger than the whole budget can still go through once the bucket is full
+        amount = min(float(amount), self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            self._available -= amount
+            if self._available >= 0:
+                return 0.0
+            return -self._available * 60.0 / self.per_minute
+
+    def drain(self) -> None:
+        """Empty the bucket, e.g. after the server says we are over the limit."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._available = min(self._available, 0.0)
+
+
+class EmbeddingScheduler:
+    """
+    Shared gatekeeper for embeddings API calls.
+
+    Every request first reserves one unit of the requests-per-minute bucket and its token
+    count from the tokens-per-minute bucket, so concurrent pipeline workers (and concurrent
+    indexing runs in the same process) together stay under the account limits. Retryable
+    failures (429, 5xx, timeouts, connection errors) are retried with jittered exponential
+    backoff. A `Retry-After` header takes precedence and pauses *all* callers, because a 429
+    means the shared budget is spent, not only this request's.
+    """
+
+    def __init__(self, rpm: int = EMBEDDING_RPM_LIMIT, tpm: int = EMBEDDING_TPM_LIMIT,
+                 max_retries: int = EMBEDDING_MAX_RETRIES,
+                 backoff_base: float = EMBEDDING_BACKOFF_BASE_SECONDS,
+                 backoff_max: float = EMBEDDING_BACKOFF_MAX_SECONDS):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self._window: deque = deque()  # (finished_at, n_tokens) of successful requests
+        self.total_requests = 0
+        self.total_tokens = 0
+        self.retries = 0
+        self.rate_limited = 0
+
+    async def _wait_for_budget(self, n_tokens: int) -> None:
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        delay = max(self.requests.reserve(1), self.tokens.reserve(n_tokens))
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _backoff_delay(self, attempt: int, error: Exception) -> float:
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            return retry_after
+        # Full jitter: uniform in [0, min(max, base * 2^attempt)]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def embed(self, client: AsyncOpenAI, model: str, texts: Sequence[str], n_tokens: int) -> List[List[float]]:
+        """Embed `texts` (whose combined size is `n_tokens`) within the rate limits, retrying transient errors."""
+        attempt = 0
+        while True:
+            await self._wait_for_budget(n_tokens)
+            try:
+                resp = await client.embeddings.create(input=list(texts), model=model)
+            except Exception as e:
+                retryable = _is_retryable(e)
+                delay = self._backoff_delay(attempt, e)
+                if _status_code(e) == 429:
+                    # The shared budget is spent: hold back every caller, not just this one
+                    self.requests.drain()
+                    self.tokens.drain()
+                    with self._lock:
+                        self.rate_limited += 1
+                        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                if not retryable or attempt >= self.max_retries:
+                    raise EmbeddingRequestError(f"{type(e).__name__}: {e}", retryable=retryable) from e
+                with self._lock:
+                    self.retries += 1
+                print(f"      Embedding request failed ({type(e).__name__}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+
+            with self._lock:
+                now = time.monotonic()
+                self.total_requests += 1
+                self.total_tokens += n_tokens
+                self._window.append((now, n_tokens))
+            return [item.embedding for item in resp.data]
+
+    def throughput(self) -> Dict[str, float]:
+        """Requests and tokens per minute over the last minute of successful calls."""
+        with self._lock:
+            cutoff = time.monotonic() - THROUGHPUT_WINDOW_SECONDS
+            while self._window and self._window[0][0] < cutoff:
+                self._window.popleft()
+            return {
+                "requests_per_minute": float(len(self._window)),
+                "tokens_per_minute": float(sum(n for _, n in self._window)),
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.throughput(),
+            "rpm_limit": self.requests.per_minute,
+            "tpm_limit": self.tokens.per_minute,
+            "total_requests": self.total_requests,
+            "total_tokens": self.total_tokens,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+        }
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    return getattr(error, "status_code", None) if isinstance(error, APIStatusError) else None
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (RateLimitError, APITimeoutError, APIConnectionError)):
+        return True
+    status = _status_code(error)
+    return status is not None and status in RETRYABLE_STATUS_CODES
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None  # HTTP-date form; fall back to exponential backoff
+    return None
+
+
+_schedulers: Dict[str, EmbeddingScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_embedding_scheduler(model: str) -> EmbeddingScheduler:
+    """Process-wide scheduler per embedding model, so all indexing runs share one budget."""
+    with _schedulers_lock:
+        if model not in _schedulers:
+            _schedulers[model] = EmbeddingScheduler()
+        return _schedulers[model]
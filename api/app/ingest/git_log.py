@@ -0,0 +1,137 @@
+"""
+Single-pass reader of a repository's history, patches included.
+
+Runs one `git log --raw -p` over the requested revisions and parses its output as it
+streams, so walking N commits costs one git process instead of N diff computations (or,
+as before, N HTTP round-trips to GitHub). Merge commits are diffed against their first
+parent, like GitHub shows them.
+"""
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import git  # gitpython
+
+_RS = b"\x1e"  # Starts and ends each commit header
+_FS = "\x1f"   # Separates the header fields
+_LOG_FORMAT = "%x1e%H%x1f%P%x1f%an%x1f%ae%x1f%aI%x1f%cn%x1f%ce%x1f%cI%x1f%B%x1e"
+_HEADER_FIELDS = ("hexsha", "parents", "author_name", "author_email", "authored_date",
+                  "committer_name", "committer_email", "committed_date", "message")
+
+# --raw status letters -> changed_files status (as stored in commit_files)
+RAW_STATUS = {"A": "added", "C": "added", "D": "deleted", "M": "modified", "R": "renamed", "T": "type_changed"}
+
+
+def _unquote_path(path: str) -> str:
+    """Undo git's C-style quoting of paths with tabs, newlines, quotes or backslashes."""
+    if not (len(path) >= 2 and path[0] == '"' and path[-1] == '"'):
+        return path
+    return path[1:-1].encode("latin-1", "backslashreplace").decode("unicode_escape").encode("latin-1").decode("utf-8", "replace")
+
+
+def _parse_raw_line(line: str) -> Optional[Dict[str, str]]:
+    # ":100644 100644 <sha> <sha> M\tpath" or ":100644 100644 <sha> <sha> R087\told\tnew"
+    meta, _, paths = line.partition("\t")
+    parts = meta.split()
+    if len(parts) < 5 or not paths:
+        return None
+    paths = [_unquote_path(p) for p in paths.split("\t")]
+    return {"file_path": paths[-1], "status": RAW_STATUS.get(parts[4][:1], "modified")}
+
+
+def _parse_commit(header: bytes, body: List[bytes]) -> Dict[str, Any]:
+    fields = header.strip(b"\n")[1:].rstrip(_RS).decode("utf-8", "replace").split(_FS, len(_HEADER_FIELDS) - 1)
+    commit: Dict[str, Any] = dict(zip(_HEADER_FIELDS, fields))
+    commit["parents"] = commit.get("parents", "").split()
+    commit["message"] = commit.get("message", "").strip()
+    commit["summary"] = commit["message"].split("\n", 1)[0]
+
+    changed_files: List[Dict[str, str]] = []
+    stats: Dict[str, Dict[str, int]] = {}
+    patch_start = None
+    file_index = -1
+    in_hunk = False
+    current: Optional[Dict[str, int]] = None
+    for i, raw in enumerate(body):
+        if raw.startswith(b":") and patch_start is None:
+            entry = _parse_raw_line(raw.decode("utf-8", "replace").rstrip("\n"))
+            if entry:
+                changed_files.append(entry)
+            continue
+        if raw.startswith(b"diff --git "):
+            if patch_start is None:
+                patch_start = i
+            # Patch sections come in the same order as the --raw entries
+            file_index += 1
+            in_hunk = False
+            path = changed_files[file_index]["file_path"] if file_index < len(changed_files) else raw.decode("utf-8", "replace").rsplit(" b/", 1)[-1].rstrip("\n")
+            current = stats.setdefault(path, {"insertions": 0, "deletions": 0, "lines": 0})
+            continue
+        if current is None:
+            continue
+        if raw.startswith(b"@@"):
+            in_hunk = True
+        elif in_hunk and raw.startswith(b"+"):
+            current["insertions"] += 1
+            current["lines"] += 1
+        elif in_hunk and raw.startswith(b"-"):
+            current["deletions"] += 1
+            current["lines"] += 1
+
+    commit["changed_files"] = changed_files
+    commit["stats"] = stats
+    commit["diff_text"] = b"".join(body[patch_start:]).decode("utf-8", "replace") if patch_start is not None else None
+    return commit
+
+
+def list_commit_shas(repo: git.Repo, revisions: Sequence[str] = ("--all",)) -> List[str]:
+    """SHAs of every commit reachable from `revisions`, newest first. Cheap: no diffs are computed."""
+    return repo.git.log(*revisions, "--format=%H").split()
+
+
+def iter_commits_with_patches(repo: git.Repo, revisions: Sequence[str] = ("--all",),
+                              only: Optional[Sequence[str]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Yield every commit reachable from `revisions`, newest first, as a dict with:
+        hexsha, parents, author_name, author_email, authored_date, committer_name,
+        committer_email, committed_date, message, summary,
+        changed_files ([{'file_path', 'status'}]), stats ({path: {'insertions', 'deletions', 'lines'}}),
+        diff_text (the unified diff against the first parent, None if the commit changes nothing)
+    Dates are ISO 8601 strings.
+
+    With `only`, exactly those commits are read (no history walk), e.g. the ones a resumed
+    ingestion has not stored yet.
+    """
+    istream = None
+    if only is not None:
+        if not only:
+            return
+        istream = tempfile.TemporaryFile()
+        istream.write(("\n".join(only) + "\n").encode("ascii"))
+        istream.seek(0)
+        revisions = ("--no-walk", "--stdin")
+    command = [
+        "git", "-c", "core.quotePath=false", "log", *revisions,
+        f"--format={_LOG_FORMAT}", "--raw", "-p", "-M", "--diff-merges=first-parent",
+        "--no-color", "--no-ext-diff", "--no-textconv",
+    ]
+    proc = repo.git.execute(command, as_process=True, istream=istream)
+    header: Optional[bytes] = None
+    header_done = False
+    body: List[bytes] = []
+    for line in proc.stdout:
+        if header is not None and not header_done:
+            header += line
+            header_done = header[1:].rstrip(b"\n").endswith(_RS)
+            continue
+        if line.startswith(_RS):
+            if header is not None:
+                yield _parse_commit(header, body)
+            header, body = line, []
+            header_done = line[1:].rstrip(b"\n").endswith(_RS)
+            continue
+        body.append(line)
+    if header is not None:
+        yield _parse_commit(header, body)
+    proc.wait()  # Raises GitCommandError if git failed
+    if istream is not None:
+        istream.close()
@@ -1,9 +1,9 @@
 import os
+import asyncio
 import tempfile
 import shutil
 import git  # gitpython
-import ast
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import numpy as np
 import logging  # Add explicit logging import
 from typing import List, Dict, Any, Set, Optional
@@ -11,22 +11,26 @@ from supabase import create_client, Client # Added Supabase
 from urllib.parse import urlparse # Added for URL parsing
 from postgrest.exceptions import APIError  # Added for handling APIError
 import hashlib  # Added for generating hash-based IDs
+import time
+from collections import defaultdict
+from contextlib import contextmanager, ExitStack
+from concurrent.futures import ProcessPoolExecutor
+
+from .embedding_cache import EmbeddingCache
+from .embedding_scheduler import EmbeddingRequestError, get_embedding_scheduler
+from .embedding_models import get_model_limits, pack_batches
+from .vector_index import LocalVectorIndex
+from .repo_cache import get_repo_cache
+from ..core.config import EMBEDDING_CACHE_ENABLED, EMBEDDING_BATCH_REQUEUES, REPO_CACHE_ENABLED
 # from datetime import datetime as dt # No longer needed here
 # import uuid # No longer needed here for ingest_commit_history args
 
 # NOTE: Requires: pip install gitpython openai numpy tiktoken supabase
-try:
-    import tiktoken
-    enc = tiktoken.encoding_for_model("text-embedding-ada-002")
-    def count_tokens(text):
-        return len(enc.encode(text))
-except ImportError:
-    def count_tokens(text):
-        # Fallback: estimate 1 token per 4 chars
-        return max(1, len(text) // 4)
+from .tokenization import count_tokens, LineTokens, split_text_by_tokens
+from .chunkers import get_chunker
 
 MAX_TOKENS_PER_CHUNK = 2000  # Stay well below 8192
-MAX_TOKENS_PER_BATCH = 7000  # Leave headroom for batch
+SUPABASE_INSERT_BATCH_SIZE = 200  # Rows per insert; an embedding request can return far more than this
 MIN_LINES_PER_CHUNK = 5
 
 # File indexing limits
@@ -71,13 +75,47 @@ IGNORE_DIR_PATTERNS = {
 
 SUPABASE_TABLE_NAME = "code_embeddings"
 
+# Parallel chunking. 1 keeps the original single-process walk; 0 means "one worker per core".
+DEFAULT_CHUNK_WORKERS = int(os.getenv("INDEXER_CHUNK_WORKERS", "1"))
+CHUNK_TASKS_PER_SUBMIT = 16  # Files handed to a worker per round-trip (amortises IPC for small files)
+
+# Incremental re-indexing
+STORED_ROWS_PAGE_SIZE = 1000  # PostgREST caps a single select at 1000 rows by default
+DELETE_PATHS_BATCH_SIZE = 100  # Keeps the `file_path=in.(...)` filter well under URL length limits
+
+# How _clone_repo fetches the repo:
+#   "full"    - complete clone (all history, every blob)
+#   "shallow" - only the HEAD commit (--depth 1)
+#   "sparse"  - HEAD commit without blobs (--filter=blob:none), then a sparse checkout that
+#               excludes ignored directories/files, so their blobs are never downloaded
+#   "mirror"  - worktree of HEAD from the persistent mirror cache shared with CommitHistorian
+#               (app/ingest/repo_cache.py): cloned once, afterwards only `git fetch`
+CLONE_STRATEGIES = ("full", "shallow", "sparse", "mirror")
+DEFAULT_CLONE_STRATEGY = os.getenv("INDEXER_CLONE_STRATEGY", "mirror" if REPO_CACHE_ENABLED else "sparse")
+
+# Embedding pipeline: concurrent OpenAI requests and Supabase inserts, joined by bounded queues
+DEFAULT_EMBED_CONCURRENCY = int(os.getenv("INDEXER_EMBED_CONCURRENCY", "4"))
+DEFAULT_INSERT_CONCURRENCY = int(os.getenv("INDEXER_INSERT_CONCURRENCY", "2"))
+PIPELINE_QUEUE_DEPTH = 2  # Batches buffered per worker before the upstream stage blocks
+
 class RepoIndexer:
     """
     Indexes a GitHub repo: downloads code, chunks it, embeds it, and stores for search.
     Uses OpenAI for embeddings and Supabase for vector storage.
     """
-    def __init__(self, embedding_model="text-embedding-ada-002", openai_api_key=None, supabase_url=None, supabase_key=None, supabase_table_name=None):
+    # Attributes a chunking worker process needs; clients and sockets are never pickled.
+    _CHUNK_WORKER_STATE = ("embedding_model",)
+
+    def __init__(self, embedding_model="text-embedding-ada-002", openai_api_key=None, supabase_url=None, supabase_key=None, supabase_table_name=None, chunk_workers: Optional[int] = None, embedding_cache: Optional[EmbeddingCache] = None, search_mode: str = "rpc", embed_concurrency: Optional[int] = None, insert_concurrency: Optional[int] = None, clone_strategy: Optional[str] = None):
         self.embedding_model = embedding_model
+        self.clone_strategy = clone_strategy or DEFAULT_CLONE_STRATEGY
+        if self.clone_strategy not in CLONE_STRATEGIES:
+            raise ValueError(f"Unknown clone_strategy {self.clone_strategy!r}; expected one of {CLONE_STRATEGIES}")
+        # Number of processes used by _chunk_codebase (None -> INDEXER_CHUNK_WORKERS, 0 -> os.cpu_count())
+        self.chunk_workers = DEFAULT_CHUNK_WORKERS if chunk_workers is None else chunk_workers
+        # In-flight embedding requests / Supabase inserts in _embed_chunks_and_store
+        self.embed_concurrency = max(1, DEFAULT_EMBED_CONCURRENCY if embed_concurrency is None else embed_concurrency)
+        self.insert_concurrency = max(1, DEFAULT_INSERT_CONCURRENCY if insert_concurrency is None else insert_concurrency)
         self.openai_api_key = openai_api_key or os.getenv("OPENAI_API_KEY")
 
         # Instantiate modern OpenAI client (>=1.0)
@@ -90,11 +128,28 @@ class RepoIndexer:
         self.supabase: Client = create_client(_supabase_url, _supabase_key)
         self.supabase_table_name = supabase_table_name or SUPABASE_TABLE_NAME
         self.current_project_id = None # To store the ID of the project being indexed
+        self.search_mode = search_mode # Default strategy for search_code ("rpc", "local" or "client")
+        self._local_indexes: Dict[Optional[str], LocalVectorIndex] = {} # project_id (None = all) -> memory-mapped index ("local" mode)
 
-    def _create_project_entry(self, repo_url: str) -> str:
+        # Content-addressed cache consulted before every embeddings API call
+        if embedding_cache is None and EMBEDDING_CACHE_ENABLED:
+            try:
+                embedding_cache = EmbeddingCache()
+            except Exception as e:
+                print(f"Warning: embedding cache unavailable, every chunk will be sent to OpenAI: {e}")
+        self.embedding_cache = embedding_cache
+
+    def __getstate__(self):
+        # Bound methods such as _chunk_single_file_task are shipped to ProcessPoolExecutor
+        # workers by pickling `self`. Only keep the plain configuration the chunkers read.
+        return {k: v for k, v in self.__dict__.items() if k in self._CHUNK_WORKER_STATE}
+
+    def _create_project_entry(self, repo_url: str, clear_existing_embeddings: bool = True) -> str:
         """
         Creates a new project entry in the 'projects' table for the given repo_url.
         Returns the ID of the newly created project.
+        If the project already exists its ID is returned; its embeddings are deleted only when
+        clear_existing_embeddings is True (incremental indexing keeps them and diffs instead).
         """
         try:
             # Ensure repo_url is a string before parsing
@@ -185,6 +240,10 @@ class RepoIndexer:
                 if query_response.data and len(query_response.data) > 0:
                     existing_project_id = query_response.data[0]['id']
                     print(f"Found existing project with ID: {existing_project_id}")
+
+                    if not clear_existing_embeddings:
+                        print(f"Keeping existing embeddings for project ID: {existing_project_id} (incremental indexing)")
+                        return existing_project_id
                     
                     # Delete all existing embeddings for this project
                     print(f"Deleting existing embeddings for project ID: {existing_project_id}")
@@ -211,79 +270,246 @@ class RepoIndexer:
             traceback.print_exc()
             raise
 
-    def index_repo(self, repo_url: str) -> bool:
+    def index_repo(self, repo_url: str, incremental: bool = False) -> bool:
         """
         Download and index the given GitHub repo.
         Creates a project entry and associates embeddings with it.
+
+        With incremental=True an existing project keeps its embeddings: every file's git blob SHA
+        is compared with the blob_sha stored next to its chunks, and only added/modified files are
+        re-chunked and re-embedded while rows for modified/removed files are deleted.
         """
-        print(f"Starting indexing for repo: {repo_url}")
+        print(f"Starting {'incremental ' if incremental else ''}indexing for repo: {repo_url}")
         try:
             # Create a project entry for this indexing run
-            self.current_project_id = self._create_project_entry(repo_url)
+            self.current_project_id = self._create_project_entry(repo_url, clear_existing_embeddings=not incremental)
             # _create_project_entry will raise an exception if it fails, so no need to check here explicitly.
 
-            temp_dir = tempfile.mkdtemp()
-            print(f"Created temporary directory: {temp_dir}")
             try:
-                print("Cloning repo...")
-                self._clone_repo(repo_url, temp_dir)
-                print("Repo cloned. Starting code chunking...")
-                code_chunks = self._chunk_codebase(temp_dir)
+                with self._checkout(repo_url) as repo_dir:
+                    blob_shas = self._git_blob_shas(repo_dir)
+                    print(f"Repo checked out ({len(blob_shas)} files at HEAD). Starting code chunking...")
+                    tasks = list(self._iter_file_tasks(repo_dir))
+                    if incremental:
+                        tasks = self._sync_changed_files(tasks, blob_shas)
+                        if not tasks:
+                            print(f"Project {self.current_project_id} is already up to date. Nothing to re-embed.")
+                            return True
+                    code_chunks = self._chunk_codebase(repo_dir, tasks=tasks)
+                for chunk in code_chunks:
+                    chunk['metadata']['blob_sha'] = blob_shas.get(chunk['metadata'].get('file'))
                 print(f"Code chunking complete. Found {len(code_chunks)} chunks. Starting embedding and live storing for project ID: {self.current_project_id}...")
                 inserted_count, failed_count = self._embed_chunks_and_store(code_chunks)
                 print(f"Embedding and storing process complete for project {self.current_project_id}. Total inserted: {inserted_count}, Total failed: {failed_count}.")
+                for local_index in (self.get_local_index(self.current_project_id), self.get_local_index(None)):
+                    if local_index.exists():
+                        # Only pulls the rows written by this run and prunes the ones it deleted
+                        local_index.refresh()
                 return True
             except Exception as e:
                 print(f"An error occurred during indexing: {e}")
                 import traceback
                 traceback.print_exc()
                 return False
-            finally:
-                print(f"Cleaning up temporary directory: {temp_dir}")
-                shutil.rmtree(temp_dir)
         except Exception as e:
             print(f"An error occurred during indexing: {e}")
             import traceback
             traceback.print_exc()
             return False
 
-    def _clone_repo(self, repo_url: str, dest_dir: str):
+    @contextmanager
+    def _checkout(self, repo_url: str):
+        """
+        Yield a directory holding the repo's HEAD tree, removed again on exit.
+
+        The "mirror" strategy checks out a worktree of the shared mirror cache; if the mirror
+        cannot be created or updated we fall back to a sparse clone into a temporary directory.
+        """
+        with ExitStack() as stack:
+            repo_dir = None
+            strategy = self.clone_strategy
+            if strategy == "mirror":
+                try:
+                    repo_dir = stack.enter_context(get_repo_cache().worktree(repo_url))
+                except Exception as e:
+                    print(f"Mirror cache checkout failed ({e}); falling back to a sparse clone.")
+                    strategy = "sparse"
+            if repo_dir is None:
+                repo_dir = tempfile.mkdtemp()
+                print(f"Created temporary directory: {repo_dir}")
+                stack.callback(shutil.rmtree, repo_dir, ignore_errors=True)
+                print("Cloning repo...")
+                self._clone_repo(repo_url, repo_dir, strategy=strategy)
+            yield repo_dir
+
+    def _clone_repo(self, repo_url: str, dest_dir: str, strategy: Optional[str] = None):
+        """
+        Clone the GitHub repo to a local directory using the given (or the indexer's) clone strategy.
+        The indexer only reads the HEAD tree, so "shallow" and "sparse" skip history; "sparse"
+        also skips the blobs of everything _iter_file_tasks would ignore anyway. If the server
+        or the local git does not support partial clones we fall back to a full clone.
+        """
+        strategy = strategy or self.clone_strategy
+        started = time.perf_counter()
+        if strategy == "full":
+            git.Repo.clone_from(repo_url, dest_dir)
+        elif strategy == "shallow":
+            git.Repo.clone_from(repo_url, dest_dir, depth=1, single_branch=True)
+        else:
+            try:
+                repo = git.Repo.clone_from(repo_url, dest_dir, depth=1, single_branch=True, filter="blob:none", no_checkout=True)
+                repo.git.config("core.sparseCheckout", "true")
+                with open(os.path.join(repo.git_dir, "info", "sparse-checkout"), "w") as f:
+                    f.write("\n".join(self._sparse_checkout_patterns()) + "\n")
+                # Populates the working tree from HEAD, fetching only the blobs the patterns keep
+                repo.git.read_tree("-mu", "HEAD")
+            except git.GitCommandError as e:
+                print(f"Sparse clone failed ({e}); retrying with a full clone.")
+                shutil.rmtree(dest_dir, ignore_errors=True)
+                os.makedirs(dest_dir, exist_ok=True)
+                git.Repo.clone_from(repo_url, dest_dir)
+                strategy = "full"
+        print(f"Cloned {repo_url} ({strategy}) in {time.perf_counter() - started:.1f}s")
+
+    @staticmethod
+    def _sparse_checkout_patterns() -> List[str]:
         """
-        Clone the GitHub repo to a local directory.
+        Non-cone sparse-checkout patterns mirroring the skip rules of _iter_file_tasks:
+        include everything, then exclude hidden entries, ignored names, ignored extensions and
+        any path component containing an IGNORE_DIR_PATTERNS entry. Git matches these
+        case-sensitively, so the walker still applies its case-insensitive checks afterwards.
         """
-        git.Repo.clone_from(repo_url, dest_dir)
+        patterns = ["/*", "!.*"]
+        patterns += [f"!{name}" for name in sorted(ALWAYS_IGNORE_FILES)]
+        patterns += [f"!*{ext}" for ext in sorted(IGNORE_EXTENSIONS)]
+        patterns += [f"!*{pattern}*" for pattern in sorted(IGNORE_DIR_PATTERNS) if not pattern.startswith('.')]
+        return patterns
+
+    def _git_blob_shas(self, repo_dir: str) -> Dict[str, str]:
+        """Map every file path in the HEAD tree to its git blob SHA (read from tree objects, no file hashing)."""
+        listing = git.Repo(repo_dir).git.ls_tree('-r', '-z', '--full-tree', 'HEAD')
+        blob_shas = {}
+        for entry in listing.split('\0'):
+            if not entry:
+                continue
+            # "<mode> <type> <sha>\t<path>"
+            info, _, path = entry.partition('\t')
+            _mode, obj_type, sha = info.split()
+            if obj_type == 'blob':
+                blob_shas[path] = sha
+        return blob_shas
+
+    def _fetch_stored_blob_shas(self, project_id: str) -> Dict[str, Set[Optional[str]]]:
+        """Return {file_path: {blob_sha, ...}} for every embedding row already stored for the project."""
+        stored: Dict[str, Set[Optional[str]]] = defaultdict(set)
+        start = 0
+        while True:
+            resp = (
+                self.supabase.table(self.supabase_table_name)
+                .select("file_path,blob_sha")
+                .eq("project_id", project_id)
+                .order("id")
+                .range(start, start + STORED_ROWS_PAGE_SIZE - 1)
+                .execute()
+            )
+            rows = getattr(resp, "data", None) or []
+            for row in rows:
+                stored[row.get("file_path")].add(row.get("blob_sha"))
+            if len(rows) < STORED_ROWS_PAGE_SIZE:
+                return stored
+            start += STORED_ROWS_PAGE_SIZE
+
+    def _delete_embeddings_for_files(self, project_id: str, file_paths: List[str]) -> None:
+        for i in range(0, len(file_paths), DELETE_PATHS_BATCH_SIZE):
+            batch = file_paths[i:i + DELETE_PATHS_BATCH_SIZE]
+            delete_response = (
+                self.supabase.table(self.supabase_table_name)
+                .delete()
+                .eq("project_id", project_id)
+                .in_("file_path", batch)
+                .execute()
+            )
+            if hasattr(delete_response, 'error') and delete_response.error:
+                print(f"Warning: Error deleting embeddings for {len(batch)} files: {delete_response.error}")
+
+    def _clear_blob_shas(self, project_id: str, file_paths: List[str]) -> None:
+        """Forget the blob SHA of partially indexed files so the next incremental run rebuilds them."""
+        print(f"{len(file_paths)} files have chunks that failed to embed or store; they will be re-indexed on the next run.")
+        for i in range(0, len(file_paths), DELETE_PATHS_BATCH_SIZE):
+            batch = file_paths[i:i + DELETE_PATHS_BATCH_SIZE]
+            try:
+                (
+                    self.supabase.table(self.supabase_table_name)
+                    .update({"blob_sha": None})
+                    .eq("project_id", project_id)
+                    .in_("file_path", batch)
+                    .execute()
+                )
+            except Exception as e:
+                # Fall back to removing the partial rows; a missing file is re-indexed as added
+                print(f"Warning: could not clear blob_sha for {len(batch)} files ({e}); deleting their rows instead.")
+                self._delete_embeddings_for_files(project_id, batch)
+
+    def _sync_changed_files(self, tasks: List[tuple], blob_shas: Dict[str, str]) -> List[tuple]:
+        """
+        Diff the indexable files at HEAD against what is stored for the current project.
+        Deletes rows for modified and removed files and returns only the tasks that need
+        (re-)chunking: files that are new or whose blob SHA changed.
+        Rows stored before blob_sha existed (NULL) count as modified and are rebuilt once.
+        """
+        stored = self._fetch_stored_blob_shas(self.current_project_id)
+        indexable_paths = {rel_path for _, rel_path, _ in tasks}
+
+        changed_tasks = [task for task in tasks if stored.get(task[1]) != {blob_shas.get(task[1])}]
+        added = sum(1 for task in changed_tasks if task[1] not in stored)
+        stale_paths = sorted(
+            {task[1] for task in changed_tasks if task[1] in stored}
+            | {path for path in stored if path not in indexable_paths}
+        )
+        removed = sum(1 for path in stale_paths if path not in indexable_paths)
+
+        print(f"Incremental diff for project {self.current_project_id}: {added} added, "
+              f"{len(changed_tasks) - added} modified, {removed} removed, "
+              f"{len(tasks) - len(changed_tasks)} unchanged files")
+        if stale_paths:
+            self._delete_embeddings_for_files(self.current_project_id, stale_paths)
+        return changed_tasks
 
     def _chunk_single_file_task(self, task_args: tuple) -> List[Dict[str, Any]]:
-        fpath, rel_path, is_python_file = task_args
+        fpath, rel_path, _ = task_args
         try:
-            if is_python_file:
-                return self._chunk_python_file(fpath, rel_path)
+            chunker = get_chunker(rel_path)
+            if chunker is not None:
+                return self._chunk_structured_file(fpath, rel_path, chunker)
             else:
                 return self._chunk_text_file(fpath, rel_path)
         except Exception as e:
             logging.warning(f"Error chunking file {fpath} in parallel task: {e}", exc_info=True)
             return []
 
-    def _chunk_codebase(self, repo_dir: str) -> List[Dict[str, Any]]:
+    def _timed_chunk_task(self, task_args: tuple) -> tuple:
+        """Worker entry point for parallel chunking: returns (worker_pid, seconds_spent, chunks)."""
+        started = time.perf_counter()
+        chunks = self._chunk_single_file_task(task_args)
+        return os.getpid(), time.perf_counter() - started, chunks
+
+    def _iter_file_tasks(self, repo_dir: str):
         """
-        Walk the repo and chunk code files by function/class (AST) or by lines.
-        Returns a list of dicts: { 'text': ..., 'metadata': ... }
+        Walk the repo and yield (fpath, rel_path, is_structured) for every file that should be chunked.
+        Directories and files are visited in sorted order so the task list (and therefore the
+        chunk order) is deterministic regardless of filesystem ordering.
         """
-        code_chunks = []
         file_count = 0
         skipped_count = 0
-        
+
         for root, dirs, files in os.walk(repo_dir):
-            # Skip directories that match ignore patterns
-            dirs_to_remove = []
-            for d in dirs:
-                if d.startswith('.') or any(pattern in d.lower() for pattern in IGNORE_DIR_PATTERNS):
-                    dirs_to_remove.append(d)
-            
-            for d in dirs_to_remove:
-                dirs.remove(d)
-            
-            for fname in files:
+            # Skip directories that match ignore patterns (in-place so os.walk does not descend)
+            dirs[:] = sorted(
+                d for d in dirs
+                if not (d.startswith('.') or any(pattern in d.lower() for pattern in IGNORE_DIR_PATTERNS))
+            )
+
+            for fname in sorted(files):
                 file_count += 1
                 fpath = os.path.join(root, fname)
                 rel_path = os.path.relpath(fpath, repo_dir)
@@ -317,224 +543,192 @@ class RepoIndexer:
                     continue
                     
                 if file_count % 50 == 0:
-                    print(f"Processing file {file_count} (skipped {skipped_count}): {rel_path}")
-                
-                try:
-                    if fname.endswith('.py'):
-                        code_chunks.extend(self._chunk_python_file(fpath, rel_path))
-                    else:
-                        code_chunks.extend(self._chunk_text_file(fpath, rel_path))
-                except Exception as e:
-                    print(f"Error processing {fpath}: {e}")
-                    skipped_count += 1
-                    
-        print(f"Processed {file_count} files, skipped {skipped_count}, generated {len(code_chunks)} chunks")
+                    print(f"Queued file {file_count} (skipped {skipped_count}): {rel_path}")
+
+                yield fpath, rel_path, get_chunker(rel_path) is not None
+
+        print(f"Walked {file_count} files, skipped {skipped_count}")
+
+    def _chunk_codebase(self, repo_dir: str, tasks: Optional[List[tuple]] = None) -> List[Dict[str, Any]]:
+        """
+        Walk the repo and chunk code files by function/class (AST) or by lines.
+        Returns a list of dicts: { 'text': ..., 'metadata': ... }
+        Pass `tasks` (from _iter_file_tasks) to chunk a pre-filtered subset of files.
+
+        With chunk_workers > 1 (or 0 for one per core) the per-file work is fanned out
+        over a process pool. Results are streamed back in task order, so the output is
+        identical to the single-process walk.
+        """
+        workers = self.chunk_workers if self.chunk_workers > 0 else (os.cpu_count() or 1)
+        if tasks is None:
+            tasks = list(self._iter_file_tasks(repo_dir))
+        if workers <= 1 or len(tasks) < 2:
+            return self._chunk_codebase_serial(tasks)
+        return self._chunk_codebase_parallel(tasks, workers)
+
+    def _chunk_codebase_serial(self, tasks: List[tuple]) -> List[Dict[str, Any]]:
+        code_chunks = []
+        for task_args in tasks:
+            code_chunks.extend(self._chunk_single_file_task(task_args))
+        print(f"Chunked {len(tasks)} files in-process, generated {len(code_chunks)} chunks")
+        return code_chunks
+
+    def _chunk_codebase_parallel(self, tasks: List[tuple], workers: int) -> List[Dict[str, Any]]:
+        code_chunks = []
+        # Per worker: files handled, chunks produced, seconds spent inside the chunkers
+        worker_stats = defaultdict(lambda: [0, 0, 0.0])
+        started = time.perf_counter()
+
+        print(f"Chunking {len(tasks)} files across {workers} worker processes...")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # executor.map yields results in submission order while workers run ahead,
+            # which keeps the chunk order deterministic without buffering every result.
+            results = executor.map(self._timed_chunk_task, tasks, chunksize=CHUNK_TASKS_PER_SUBMIT)
+            for done, (worker_pid, elapsed, chunks) in enumerate(results, start=1):
+                code_chunks.extend(chunks)
+                stats = worker_stats[worker_pid]
+                stats[0] += 1
+                stats[1] += len(chunks)
+                stats[2] += elapsed
+                if done % 500 == 0:
+                    print(f"  Chunked {done}/{len(tasks)} files ({len(code_chunks)} chunks so far)")
+
+        wall = time.perf_counter() - started
+        print(f"Chunked {len(tasks)} files in {wall:.2f}s across {len(worker_stats)} workers, generated {len(code_chunks)} chunks "
+              f"({len(tasks) / wall if wall else 0:.1f} files/s)")
+        for worker_pid, (files, chunks, busy) in sorted(worker_stats.items()):
+            rate = files / busy if busy else 0.0
+            print(f"  Worker {worker_pid}: {files} files, {chunks} chunks, {busy:.2f}s busy ({rate:.1f} files/s)")
         return code_chunks
 
-    def _chunk_python_file(self, fpath: str, rel_path: str) -> List[Dict[str, Any]]:
+    def _chunk_structured_file(self, fpath: str, rel_path: str, chunker) -> List[Dict[str, Any]]:
+        """
+        Chunk a source file along its definitions using the structural chunker registered
+        for its extension (see app/ingest/chunkers.py).
+
+        The file is read, split and tokenized once. Functions become one chunk each; classes
+        (and impls, interfaces, ...) become a header chunk plus one chunk per member, so no
+        line is embedded twice. Top-level code between definitions becomes a 'module' chunk.
+        Members carry their container's qualified name as metadata['parent']. Falls back to
+        line windows if the file cannot be parsed or has no definitions.
+        """
         with open(fpath, 'r', encoding='utf-8', errors='ignore') as f:
-            source = f.read()
-        try:
-            tree = ast.parse(source)
-        except Exception as e:
-            logging.warning(f"AST parse failed for {fpath}, falling back to text chunking: {e}")
+            source = f.read().replace('\u0000', '') # Sanitize null characters
+        definitions = chunker(source)
+        if not definitions:
+            logging.debug(f"No structural chunks found for {fpath}, using text chunking for the whole file.")
             return self._chunk_text_file(fpath, rel_path)
+        line_tokens = LineTokens(source.splitlines())
         chunks = []
-        for node in ast.walk(tree):
-            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
-                start = node.lineno - 1
-                end = getattr(node, 'end_lineno', None) or start + 1 # Ensure end is valid
-                lines = source.splitlines()[start:end]
-                chunk_text = '\n'.join(lines)
-                chunk_text = chunk_text.replace('\u0000', '') # Sanitize null characters
-                # Split large chunks by tokens
-                if count_tokens(chunk_text) > MAX_TOKENS_PER_CHUNK:
-                    logging.debug(f"Python chunk too large ({count_tokens(chunk_text)} tokens), splitting: {rel_path} lines {start+1}-{end}")
-                    split_chunks = self._split_large_chunk(chunk_text, rel_path, start+1, end)
-                    chunks.extend(split_chunks)
-                elif chunk_text.strip(): 
-                    chunks.append({
-                        'text': chunk_text, # Already sanitized
-                        'metadata': {
-                            'file': rel_path,
-                            'type': type(node).__name__,
-                            'name': getattr(node, 'name', None),
-                            'start_line': start + 1,
-                            'end_line': end
-                        }
-                    })
-        if not chunks: 
-            logging.debug(f"No AST chunks found for {fpath}, using text chunking for the whole file.")
+        for definition in definitions:
+            metadata = {
+                'file': rel_path,
+                'type': definition['type'],
+                'name': definition['name'],
+                'parent': definition['parent'],
+                'start_line': definition['start'] + 1,
+                'end_line': definition['end']
+            }
+            self._append_segments(line_tokens, definition['segments'], metadata, rel_path, chunks)
+        if not chunks:
             return self._chunk_text_file(fpath, rel_path)
         return chunks
 
-    def _split_large_chunk(self, chunk_text: str, rel_path: str, original_start_line: int, original_end_line: int) -> List[Dict[str, Any]]:
-        """Recursively splits a chunk of text if it's too large. 
-           First by lines, then by characters as a fallback for very long single lines."""
-        chunk_text = chunk_text.replace('\u0000', '') # Ensure sanitization at entry
-        lines = chunk_text.splitlines()
+    def _append_segments(self, line_tokens: LineTokens, segments: List[tuple], metadata: Dict[str, Any],
+                         rel_path: str, chunks: List[Dict[str, Any]]) -> None:
+        """Emit one chunk for the given line segments, or split them if they exceed the token limit."""
+        chunk_tokens = sum(line_tokens.count(seg_start, seg_end) for seg_start, seg_end in segments) + len(segments) - 1
+        if chunk_tokens > MAX_TOKENS_PER_CHUNK:
+            logging.debug(f"Chunk too large ({chunk_tokens} tokens), splitting: {rel_path} lines {metadata['start_line']}-{metadata['end_line']}")
+            for seg_start, seg_end in segments:
+                for piece in self._split_line_range(line_tokens, seg_start, seg_end, rel_path):
+                    piece['metadata']['name'] = metadata['name']
+                    piece['metadata']['parent'] = metadata['parent']
+                    chunks.append(piece)
+            return
+        chunk_text = '\n'.join(line for seg_start, seg_end in segments for line in line_tokens.lines[seg_start:seg_end])
+        if chunk_text.strip():
+            chunks.append({'text': chunk_text, 'tokens': chunk_tokens, 'metadata': metadata}) # Already sanitized
+
+    def _split_line_range(self, line_tokens: LineTokens, start: int, end: int, rel_path: str, line_number_base: int = 1) -> List[Dict[str, Any]]:
+        """
+        Split lines[start:end] into segments of at most MAX_TOKENS_PER_CHUNK tokens.
+
+        Lines are packed greedily using the precomputed per-line token counts, so the
+        work is linear in the number of lines (nothing is re-encoded while a segment grows).
+        A single line that is too large on its own is split by tokens.
+        `line_number_base` is the file line number of line_tokens.lines[0].
+        """
+        lines = line_tokens.lines
         final_chunks = []
-        current_line_offset = 0 # For tracking line numbers within the current chunk_text
-
-        if not lines: # Should not happen if chunk_text is not empty
-            if chunk_text.strip(): # chunk_text was spaces/newlines only
-                # If original chunk_text had content (even just whitespace), but no lines after splitlines()
-                # This means chunk_text might be purely whitespace or empty.
-                # We can return an empty list or a chunk if it has meaning.
-                # For safety, let's return empty if strip() is empty.
-                return []
-            # If chunk_text had content and splitlines somehow made it empty (e.g. just \n)
-            # And original chunk_text itself is too large by tokens
-            if count_tokens(chunk_text) > MAX_TOKENS_PER_CHUNK:
-                # Fallback to character split for non-line content if it's too large
-                # This is an edge case.
-                pass # Will be handled by the single-line logic below if chunk_text becomes one "line"
-            else: # Small enough, non-empty, but no newlines
-                final_chunks.append({
-                    'text': chunk_text,
-                    'metadata': {
-                        'file': rel_path,
-                        'type': 'whitespace_or_no_newline_chunk',
-                        'start_line': original_start_line,
-                        'end_line': original_end_line
-                    }
-                })
-                return final_chunks
-
-        # Case 1: Multiple lines in current chunk_text - try to split by lines
-        if len(lines) > 1:
-            i = 0
-            n_lines = len(lines)
-            while i < n_lines:
-                sub_lines_buffer = []
-                current_tokens = 0
-                line_idx_in_buffer = i
-                while line_idx_in_buffer < n_lines:
-                    line_to_add = lines[line_idx_in_buffer]
-                    tokens_if_added = count_tokens('\n'.join(sub_lines_buffer + [line_to_add]))
-                    
-                    if sub_lines_buffer and tokens_if_added > MAX_TOKENS_PER_CHUNK:
-                        # Current sub_lines_buffer is as large as it can be without this line
-                        break 
-                    
-                    sub_lines_buffer.append(line_to_add)
-                    current_tokens = tokens_if_added
-                    line_idx_in_buffer += 1
-                    
-                    if current_tokens > MAX_TOKENS_PER_CHUNK: # Added line made it too big
-                        break
-                
-                # sub_lines_buffer is now lines[i : line_idx_in_buffer]
-                # original line numbers for this segment: original_start_line + i to original_start_line + line_idx_in_buffer -1
-                segment_text = '\n'.join(sub_lines_buffer)
-                segment_tokens = count_tokens(segment_text)
-
-                current_segment_start_line = original_start_line + i
-                current_segment_end_line = original_start_line + line_idx_in_buffer - 1
-
-                if segment_tokens > MAX_TOKENS_PER_CHUNK:
-                    # This segment (even if multiple lines) is still too big, recurse
-                    # This recursive call will handle further splitting (e.g. if it becomes a single line again)
-                    final_chunks.extend(self._split_large_chunk(segment_text, rel_path, 
-                                                              current_segment_start_line, current_segment_end_line))
-                elif segment_text.strip():
+        i = start
+        while i < end:
+            j = i + 1
+            while j < end and line_tokens.count(i, j + 1) <= MAX_TOKENS_PER_CHUNK:
+                j += 1
+            segment_start_line = line_number_base + i
+            segment_end_line = line_number_base + j - 1
+            segment_tokens = line_tokens.count(i, j)
+
+            if segment_tokens > MAX_TOKENS_PER_CHUNK:
+                # One line is over the limit by itself (minified code, data blobs, ...)
+                for piece, piece_tokens in split_text_by_tokens(lines[i], MAX_TOKENS_PER_CHUNK):
+                    if piece.strip():
+                        final_chunks.append({
+                            'text': piece,
+                            'tokens': piece_tokens,
+                            'metadata': {
+                                'file': rel_path,
+                                'type': 'char_split_segment',
+                                'start_line': segment_start_line, # Line numbers are for the original line
+                                'end_line': segment_end_line,
+                                'comment': f'Original content from line {segment_start_line} split by characters'
+                            }
+                        })
+            else:
+                segment_text = '\n'.join(lines[i:j])
+                if segment_text.strip():
                     final_chunks.append({
                         'text': segment_text,
+                        'tokens': segment_tokens,
                         'metadata': {
                             'file': rel_path,
                             'type': 'line_split_segment',
-                            'start_line': current_segment_start_line,
-                            'end_line': current_segment_end_line
+                            'start_line': segment_start_line,
+                            'end_line': segment_end_line
                         }
                     })
-                i = line_idx_in_buffer # Move to the next segment
-            return final_chunks
-
-        # Case 2: Single line in current chunk_text (or original chunk_text had no newlines)
-        # chunk_text is effectively lines[0] here if len(lines) == 1, or original chunk_text
-        single_line_text = chunk_text 
-        if count_tokens(single_line_text) > MAX_TOKENS_PER_CHUNK:
-            # print(f"  Info: Single line/no-newline text too large ({count_tokens(single_line_text)} tokens). Splitting by chars. File: {rel_path}, Original lines: {original_start_line}-{original_end_line}")
-            char_split_chunks = []
-            current_pos = 0
-            while current_pos < len(single_line_text):
-                # Estimate slice end based on remaining tokens needed (avg 3 chars/token for safety)
-                estimated_char_len = MAX_TOKENS_PER_CHUNK * 3 
-                slice_end = min(current_pos + estimated_char_len, len(single_line_text))
-                sub_text_piece = single_line_text[current_pos:slice_end]
-                
-                # Refine sub_text_piece to fit token limit by reducing its end
-                while count_tokens(sub_text_piece) > MAX_TOKENS_PER_CHUNK and len(sub_text_piece) > 1:
-                    # Reduce by 10% or at least 1 char, from the end
-                    reduction = max(1, int(len(sub_text_piece) * 0.1))
-                    sub_text_piece = sub_text_piece[:-reduction]
-                
-                # If it became empty after reduction, try to advance past this point or break
-                if not sub_text_piece.strip() and len(sub_text_piece) > 0 : # Was some non-empty string that became all whitespace
-                     current_pos += len(sub_text_piece) # Skip this whitespace part
-                     if current_pos >= len(single_line_text): break
-                     continue
-                elif not sub_text_piece: # Became truly empty string
-                    if slice_end >= len(single_line_text): break # Reached end of original string
-                    # This can happen if initial estimated_char_len is too small and reduction makes it empty.
-                    # Try to advance current_pos by a bit to avoid infinite loop if stuck.
-                    current_pos = slice_end if slice_end > current_pos else current_pos + 1
-                    if current_pos >= len(single_line_text): break
-                    continue
-
-                char_split_chunks.append({
-                    'text': sub_text_piece,
-                    'metadata': {
-                        'file': rel_path,
-                        'type': 'char_split_segment',
-                        'start_line': original_start_line, # Line numbers are for the original block
-                        'end_line': original_end_line,
-                        'comment': f'Original content from lines {original_start_line}-{original_end_line} split by characters'
-                    }
-                })
-                current_pos += len(sub_text_piece)
-                if current_pos >= len(single_line_text) or not sub_text_piece.strip():
-                    break # Exit if done or last piece was whitespace
-            return char_split_chunks
-        elif single_line_text.strip(): # Single line and small enough
-            final_chunks.append({
-                'text': single_line_text,
-                'metadata': {
-                    'file': rel_path,
-                    'type': 'single_line_small_chunk',
-                    'start_line': original_start_line,
-                    'end_line': original_end_line
-                }
-            })
-            return final_chunks
-        
-        return [] # Should be covered by other returns, but as a fallback.
+            i = j # Move to the next segment
+        return final_chunks
 
     def _chunk_text_file(self, fpath: str, rel_path: str, chunk_size: int = 15, overlap: int = 3) -> List[Dict[str, Any]]:
         with open(fpath, 'r', encoding='utf-8', errors='ignore') as f:
-            lines = f.readlines()
+            raw_lines = [line.replace('\u0000', '') for line in f.readlines()] # Sanitize null characters
+        line_tokens = LineTokens([line.rstrip('\n') for line in raw_lines])
+        lines = line_tokens.lines
         chunks = []
         i = 0
         n = len(lines)
         if n == 0: return []
 
         while i < n:
-            chunk_lines = lines[i:i+chunk_size]
-            chunk_text = ''.join(chunk_lines)
-            chunk_text = chunk_text.replace('\u0000', '') # Sanitize null characters
-            if count_tokens(chunk_text) > MAX_TOKENS_PER_CHUNK:
-                split_chunks = self._split_large_chunk(chunk_text, rel_path, i+1, min(i+chunk_size, n)) # chunk_text is sanitized
-                chunks.extend(split_chunks)
-            elif chunk_text.strip():  
-                chunks.append({
-                    'text': chunk_text, # Already sanitized
-                    'metadata': {
-                        'file': rel_path,
-                        'type': 'text',
-                        'start_line': i + 1,
-                        'end_line': min(i + chunk_size, n)
-                    }
-                })
+            end = min(i + chunk_size, n)
+            chunk_tokens = line_tokens.count(i, end)
+            if chunk_tokens > MAX_TOKENS_PER_CHUNK:
+                chunks.extend(self._split_line_range(line_tokens, i, end, rel_path))
+            else:
+                chunk_text = ''.join(raw_lines[i:end])
+                if chunk_text.strip():
+                    chunks.append({
+                        'text': chunk_text, # Already sanitized
+                        'tokens': chunk_tokens,
+                        'metadata': {
+                            'file': rel_path,
+                            'type': 'text',
+                            'start_line': i + 1,
+                            'end_line': end
+                        }
+                    })
             
             next_i = i + chunk_size - overlap
             if next_i <= i and n > i : # Ensure progress
@@ -543,7 +737,23 @@ class RepoIndexer:
         return chunks
 
     def _embed_chunks_and_store(self, code_chunks: List[Dict[str, Any]]) -> tuple[int, int]:
-        """Embeds chunks and stores them directly to Supabase in batches as they are processed."""
+        """
+        Embeds chunks and stores them to Supabase through a concurrent pipeline.
+        Chunks whose (model, text) is already in the embedding cache are stored without an
+        OpenAI call; only cache misses are batched and sent to the embeddings API.
+
+        Token-budgeted batches flow through two bounded queues: `embed_concurrency` workers
+        call the embeddings API while `insert_concurrency` workers write the resulting rows,
+        so OpenAI round-trips and DB writes overlap. When either stage falls behind, the
+        queue in front of it fills up and the upstream stage waits (backpressure).
+        API calls go through the process-wide EmbeddingScheduler, which keeps all workers
+        under the account's RPM/TPM limits and retries transient errors; a batch whose
+        retries run out is put back on the queue rather than dropped.
+
+        Rows carry their file's blob_sha, which marks the file as indexed for incremental runs.
+        If any chunk of a file fails to embed or store, the blob_sha of its stored rows is
+        cleared afterwards, so the next run treats the file as modified and rebuilds it.
+        """
         
         if not self.current_project_id:
             print("Error: current_project_id is not set. Cannot store embeddings without a project ID.")
@@ -555,133 +765,205 @@ class RepoIndexer:
         valid_items_to_process = []
         for chunk_doc in code_chunks:
             text = chunk_doc['text']
-            if count_tokens(text) > MAX_TOKENS_PER_CHUNK: # Primary check from chunking should catch this
-                print(f"  Warning (pre-batch): Chunk too large for embedding ({count_tokens(text)} tokens). File: {chunk_doc['metadata'].get('file')}, Lines: {chunk_doc['metadata'].get('start_line')}-{chunk_doc['metadata'].get('end_line')}. Skipping.")
+            # Chunkers attach the count computed while splitting; only count chunks that lack it
+            tokens = chunk_doc.get('tokens') or count_tokens(text)
+            if tokens > MAX_TOKENS_PER_CHUNK: # Primary check from chunking should catch this
+                print(f"  Warning (pre-batch): Chunk too large for embedding ({tokens} tokens). File: {chunk_doc['metadata'].get('file')}, Lines: {chunk_doc['metadata'].get('start_line')}-{chunk_doc['metadata'].get('end_line')}. Skipping.")
                 continue
             if not text.strip():
                 continue
-            valid_items_to_process.append({'text': text, 'metadata_obj': chunk_doc['metadata']})
+            valid_items_to_process.append({'text': text, 'metadata_obj': chunk_doc['metadata'], 'tokens': tokens})
 
-        total_inserted_count = 0
-        total_failed_count = 0
-        
-        openai_batch_texts = [] # Texts for the current OpenAI API call
-        openai_batch_original_metadata = [] # Corresponding metadata objects for openai_batch_texts
-        openai_batch_token_count = 0
+        # Serve what we can from the embedding cache before touching the API
+        items_to_embed = valid_items_to_process
+        cached_records = []
+        if self.embedding_cache is not None and valid_items_to_process:
+            cached_embeddings = self.embedding_cache.get_many(self.embedding_model, [item['text'] for item in valid_items_to_process])
+            items_to_embed = []
+            for item, embedding in zip(valid_items_to_process, cached_embeddings):
+                if embedding is None:
+                    items_to_embed.append(item)
+                else:
+                    cached_records.append(self._build_embedding_record(item['text'], item['metadata_obj'], embedding))
+            print(f"Embedding cache: {len(cached_records)} hits, {len(items_to_embed)} misses for {len(valid_items_to_process)} chunks.")
+
+        print(f"Starting live embedding and storing for {len(items_to_embed)} processable chunks "
+              f"({self.embed_concurrency} embedding workers, {self.insert_concurrency} insert workers).")
+        start = time.perf_counter()
+        failed_files: Set[str] = set()
+        total_inserted_count, total_failed_count = asyncio.run(
+            self._run_embedding_pipeline(self._iter_embedding_batches(items_to_embed), cached_records, failed_files)
+        )
+        if failed_files:
+            self._clear_blob_shas(self.current_project_id, sorted(failed_files))
+        scheduler_stats = get_embedding_scheduler(self.embedding_model).stats()
+        print(f"Embedding pipeline finished in {time.perf_counter() - start:.1f}s. "
+              f"Scheduler: {scheduler_stats['total_requests']} requests, {scheduler_stats['retries']} retries "
+              f"({scheduler_stats['rate_limited']} rate-limited), "
+              f"{scheduler_stats['tokens_per_minute']:.0f}/{scheduler_stats['tpm_limit']:.0f} tokens/min over the last minute")
+
+        if self.embedding_cache is not None:
+            cache_stats = self.embedding_cache.stats()
+            print(f"Embedding cache totals: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+                  f"({cache_stats['hit_rate']:.1%} of inputs served without an API call), "
+                  f"{cache_stats['entries']} entries, {cache_stats['bytes'] / (1024 * 1024):.1f}MB")
+
+        return total_inserted_count, total_failed_count
+
+    def _iter_embedding_batches(self, items: List[Dict[str, Any]]):
+        """
+        Yield (texts, metadatas, token_count) batches sized by the embedding model's limits.
+
+        Items are bin-packed by token length so each request is as full as the model
+        allows; within a batch they keep their original relative order.
+        """
+        limits = get_model_limits(self.embedding_model)
+        batches = pack_batches([item['tokens'] for item in items], limits['max_tokens_per_request'], limits['max_inputs'])
+        if batches:
+            print(f"Packed {len(items)} chunks into {len(batches)} embedding requests "
+                  f"(≤{limits['max_inputs']} inputs, ≤{limits['max_tokens_per_request']} tokens each).")
+        for batch in batches:
+            yield (
+                [items[i]['text'] for i in batch],
+                [items[i]['metadata_obj'] for i in batch],
+                sum(items[i]['tokens'] for i in batch),
+            )
 
-        print(f"Starting live embedding and storing for {len(valid_items_to_process)} processable chunks.")
+    async def _run_embedding_pipeline(self, batches, cached_records: List[Dict[str, Any]], failed_files: Set[str]) -> tuple[int, int]:
+        """Producer -> embed workers -> insert workers. Returns (inserted, failed); paths of files with failed chunks are added to failed_files."""
+        # The embed queue itself is unbounded so workers can always requeue a batch; the
+        # producer is throttled by `embed_slots`, held by each batch until it is inserted or given up on.
+        embed_queue: asyncio.Queue = asyncio.Queue()
+        embed_slots = asyncio.Semaphore(self.embed_concurrency * PIPELINE_QUEUE_DEPTH)
+        insert_queue: asyncio.Queue = asyncio.Queue(maxsize=self.insert_concurrency * PIPELINE_QUEUE_DEPTH)
+        totals = {'inserted': 0, 'failed': 0, 'batches': 0}
+        scheduler = get_embedding_scheduler(self.embedding_model)
+        # Retries and backoff are the scheduler's job; the client must not retry on its own
+        oai_client = AsyncOpenAI(api_key=self.openai_api_key, max_retries=0)
 
-        for idx, item_to_process in enumerate(valid_items_to_process):
-            current_text = item_to_process['text']
-            current_metadata = item_to_process['metadata_obj']
-            current_tokens = count_tokens(current_text) # Already checked <= MAX_TOKENS_PER_CHUNK
+        async def produce():
+            # Rows served from the cache skip the embedding stage entirely
+            for i in range(0, len(cached_records), SUPABASE_INSERT_BATCH_SIZE):
+                await insert_queue.put(cached_records[i:i + SUPABASE_INSERT_BATCH_SIZE])
+            for texts, metadatas, n_tokens in batches:
+                await embed_slots.acquire()
+                embed_queue.put_nowait((texts, metadatas, n_tokens, 0))
 
-            if idx > 0 and idx % 50 == 0: # Log progress every 50 main items
-                print(f"  Processed {idx}/{len(valid_items_to_process)} items for OpenAI batching. Current Supabase inserts: {total_inserted_count}")
+        async def embed_worker():
+            while True:
+                texts, metadatas, n_tokens, requeues = await embed_queue.get()
+                try:
+                    embeddings = await scheduler.embed(oai_client, self.embedding_model, texts, n_tokens)
+                    records = await self._records_for_embeddings(texts, metadatas, embeddings)
+                except EmbeddingRequestError as e:
+                    if e.retryable and requeues < EMBEDDING_BATCH_REQUEUES:
+                        print(f"    Embedding batch of {len(texts)} texts exhausted its retries ({e}); requeueing ({requeues + 1}/{EMBEDDING_BATCH_REQUEUES}).")
+                        embed_queue.put_nowait((texts, metadatas, n_tokens, requeues + 1))
+                    else:
+                        print(f"    Error during OpenAI API call for a batch of {len(texts)} texts: {e}")
+                        totals['failed'] += len(texts)
+                        failed_files.update(meta['file'] for meta in metadatas if meta.get('file'))
+                        embed_slots.release()
+                except Exception as e:
+                    print(f"    Error while embedding a batch of {len(texts)} texts: {e}")
+                    totals['failed'] += len(texts)
+                    failed_files.update(meta['file'] for meta in metadatas if meta.get('file'))
+                    embed_slots.release()
+                else:
+                    for i in range(0, len(records), SUPABASE_INSERT_BATCH_SIZE):
+                        await insert_queue.put(records[i:i + SUPABASE_INSERT_BATCH_SIZE])
+                    embed_slots.release()
+                finally:
+                    embed_queue.task_done()
 
-            # If adding current_text exceeds OpenAI batch limits, process existing openai_batch_texts first
-            if openai_batch_texts and (openai_batch_token_count + current_tokens > MAX_TOKENS_PER_BATCH or len(openai_batch_texts) >= 20):
-                print(f"    OpenAI batch full ({len(openai_batch_texts)} texts, {openai_batch_token_count} tokens). Sending to OpenAI...")
+        async def insert_worker():
+            while True:
+                records = await insert_queue.get()
                 try:
-                    resp = self._oai_client.embeddings.create(input=openai_batch_texts, model=self.embedding_model)
-                    print(f"      Received {len(resp.data)} embeddings from OpenAI.")
-                    
-                    records_for_supabase_batch = []
-                    for j, emb_data in enumerate(resp.data):
-                        embedding_list = np.array(emb_data.embedding, dtype=np.float32).tolist()
-                        original_meta = openai_batch_original_metadata[j]
-                        original_text = openai_batch_texts[j]
-                        records_for_supabase_batch.append({
-                            'project_id': self.current_project_id,
-                            'content': original_text,
-                            'embedding': embedding_list,
-                            'file_path': original_meta.get('file'),
-                            'symbol_type': original_meta.get('type'),
-                            'symbol_name': original_meta.get('name'),
-                            'start_line': original_meta.get('start_line'),
-                            'end_line': original_meta.get('end_line')
-                        })
-                    
-                    if records_for_supabase_batch:
-                        print(f"        Attempting to insert {len(records_for_supabase_batch)} records into Supabase...")
-                        db_response = self.supabase.table(self.supabase_table_name).insert(records_for_supabase_batch).execute()
-                        db_data = getattr(db_response, 'data', None)
-                        db_error = getattr(db_response, 'error', None)
-                        # Using more robust response checking from previous _store_embeddings
-                        if db_data and not db_error:
-                            actual_inserted = len(db_data)
-                            total_inserted_count += actual_inserted
-                            print(f"          Successfully inserted {actual_inserted} records.")
-                        elif hasattr(db_response, 'count') and db_response.count is not None and not db_error:
-                            actual_inserted = db_response.count
-                            total_inserted_count += actual_inserted
-                            print(f"          Successfully inserted {actual_inserted} records (via count).")
-                        elif db_error:
-                            total_failed_count += len(records_for_supabase_batch)
-                            print(f"          Failed to insert Supabase batch. Error: {db_error}")
-                        else: # Ambiguous success/failure
-                            total_inserted_count += len(records_for_supabase_batch) # Assume success if no error
-                            print(f"          Supabase batch processed (assumed success). Count: {len(records_for_supabase_batch)}")
-                except Exception as e_openai:
-                    print(f"    Error during OpenAI API call or Supabase insert for a batch: {e_openai}")
-                    total_failed_count += len(openai_batch_texts)
-                
-                # Reset OpenAI batch
-                openai_batch_texts = []
-                openai_batch_original_metadata = []
-                openai_batch_token_count = 0
-
-            # Add current item to OpenAI batch
-            openai_batch_texts.append(current_text)
-            openai_batch_original_metadata.append(current_metadata)
-            openai_batch_token_count += current_tokens
-
-        # Process the final remaining OpenAI batch (if any)
-        if openai_batch_texts:
-            print(f"    Processing final OpenAI batch ({len(openai_batch_texts)} texts, {openai_batch_token_count} tokens). Sending to OpenAI...")
+                    # supabase-py is synchronous; run it off the event loop so inserts overlap
+                    inserted, failed = await asyncio.to_thread(self._insert_embedding_records, records)
+                except Exception as e:
+                    print(f"    Error while storing a batch of {len(records)} records: {e}")
+                    inserted, failed = 0, len(records)
+                finally:
+                    insert_queue.task_done()
+                if failed:
+                    failed_files.update(record['file_path'] for record in records if record.get('file_path'))
+                totals['inserted'] += inserted
+                totals['failed'] += failed
+                totals['batches'] += 1
+                if totals['batches'] % 10 == 0:
+                    print(f"  Stored {totals['batches']} batches so far. Supabase inserts: {totals['inserted']}, failed: {totals['failed']}")
+
+        workers = [asyncio.create_task(embed_worker()) for _ in range(self.embed_concurrency)]
+        workers += [asyncio.create_task(insert_worker()) for _ in range(self.insert_concurrency)]
+        try:
+            await produce()
+            # Requeued batches are counted by the queue, so join() waits for them too
+            await embed_queue.join()
+            await insert_queue.join()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await oai_client.close()
+        return totals['inserted'], totals['failed']
+
+    async def _records_for_embeddings(self, texts: List[str], metadatas: List[Dict[str, Any]], embeddings: List[List[float]]) -> List[Dict[str, Any]]:
+        """Remember freshly computed vectors in the cache and build the rows to insert."""
+        print(f"      Received {len(embeddings)} embeddings from OpenAI.")
+        if self.embedding_cache is not None:
             try:
-                resp = self._oai_client.embeddings.create(input=openai_batch_texts, model=self.embedding_model)
-                print(f"      Received {len(resp.data)} embeddings from OpenAI for final batch.")
-                records_for_supabase_batch = []
-                for j, emb_data in enumerate(resp.data):
-                    embedding_list = np.array(emb_data.embedding, dtype=np.float32).tolist()
-                    original_meta = openai_batch_original_metadata[j]
-                    original_text = openai_batch_texts[j]
-                    records_for_supabase_batch.append({
-                        'project_id': self.current_project_id,
-                        'content': original_text,
-                        'embedding': embedding_list,
-                        'file_path': original_meta.get('file'),
-                        'symbol_type': original_meta.get('type'),
-                        'symbol_name': original_meta.get('name'),
-                        'start_line': original_meta.get('start_line'),
-                        'end_line': original_meta.get('end_line')
-                    })
-                
-                if records_for_supabase_batch:
-                    print(f"        Attempting to insert {len(records_for_supabase_batch)} records from final batch into Supabase...")
-                    db_response = self.supabase.table(self.supabase_table_name).insert(records_for_supabase_batch).execute()
-                    db_data = getattr(db_response, 'data', None)
-                    db_error = getattr(db_response, 'error', None)
-                    if db_data and not db_error:
-                        actual_inserted = len(db_data)
-                        total_inserted_count += actual_inserted
-                        print(f"          Successfully inserted {actual_inserted} records (final batch).")
-                    elif hasattr(db_response, 'count') and db_response.count is not None and not db_error:
-                        actual_inserted = db_response.count
-                        total_inserted_count += actual_inserted
-                        print(f"          Successfully inserted {actual_inserted} records (final batch, via count).")
-                    elif db_error:
-                        total_failed_count += len(records_for_supabase_batch)
-                        print(f"          Failed to insert final Supabase batch. Error: {db_error}")
-                    else:
-                        total_inserted_count += len(records_for_supabase_batch)
-                        print(f"          Final Supabase batch processed (assumed success). Count: {len(records_for_supabase_batch)}")
-            except Exception as e_openai_final:
-                print(f"    Error during final OpenAI API call or Supabase insert: {e_openai_final}")
-                total_failed_count += len(openai_batch_texts)
+                await asyncio.to_thread(self.embedding_cache.put_many, self.embedding_model, texts, embeddings)
+            except Exception as e_cache:
+                print(f"    Warning: could not write embeddings to cache: {e_cache}")
+        return [
+            self._build_embedding_record(text, meta, embedding)
+            for text, meta, embedding in zip(texts, metadatas, embeddings)
+        ]
 
-        return total_inserted_count, total_failed_count
+    def _build_embedding_record(self, text: str, metadata: Dict[str, Any], embedding: List[float]) -> Dict[str, Any]:
+        return {
+            'project_id': self.current_project_id,
+            'content': text,
+            'embedding': np.array(embedding, dtype=np.float32).tolist(),
+            'file_path': metadata.get('file'),
+            'symbol_type': metadata.get('type'),
+            'symbol_name': metadata.get('name'),
+            'parent_symbol': metadata.get('parent'),
+            'start_line': metadata.get('start_line'),
+            'end_line': metadata.get('end_line'),
+            'blob_sha': metadata.get('blob_sha')
+        }
+
+
+    def _insert_embedding_records(self, records_for_supabase_batch: List[Dict[str, Any]]) -> tuple[int, int]:
+        """Insert a batch of embedding rows. Returns (inserted, failed)."""
+        if not records_for_supabase_batch:
+            return 0, 0
+        print(f"        Attempting to insert {len(records_for_supabase_batch)} records into Supabase...")
+        try:
+            db_response = self.supabase.table(self.supabase_table_name).insert(records_for_supabase_batch).execute()
+        except Exception as e_insert:
+            print(f"          Failed to insert Supabase batch. Error: {e_insert}")
+            return 0, len(records_for_supabase_batch)
+        db_data = getattr(db_response, 'data', None)
+        db_error = getattr(db_response, 'error', None)
+        # Using more robust response checking from previous _store_embeddings
+        if db_data and not db_error:
+            actual_inserted = len(db_data)
+            print(f"          Successfully inserted {actual_inserted} records.")
+            return actual_inserted, 0
+        elif hasattr(db_response, 'count') and db_response.count is not None and not db_error:
+            actual_inserted = db_response.count
+            print(f"          Successfully inserted {actual_inserted} records (via count).")
+            return actual_inserted, 0
+        elif db_error:
+            print(f"          Failed to insert Supabase batch. Error: {db_error}")
+            return 0, len(records_for_supabase_batch)
+        else: # Ambiguous success/failure
+            print(f"          Supabase batch processed (assumed success). Count: {len(records_for_supabase_batch)}")
+            return len(records_for_supabase_batch), 0
 
     def _to_pgvector_literal(self, embedding: List[float]) -> str:
         """Convert a list of floats to a PostgreSQL vector literal used by pgvector."""
@@ -696,20 +978,25 @@ class RepoIndexer:
         limit: int = 10,
         similarity_threshold: float = 0.5,
         max_server_rows: int = 2500,
+        search_mode: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        """Semantic code search that *always* works, even if PostgREST cannot order by
-        pgvector operators.
+        """Semantic code search over the stored embeddings.
 
         Strategy
         ---------
         1. Embed the natural-language *query* with OpenAI.
-        2. Pull a bounded set of candidate rows from Supabase which **includes the raw
-           embedding** column (up to ``max_server_rows``).
-        3. Compute cosine similarity (1 ‑ cosine distance) in Python/NumPy – this is
-           lightweight for a few thousand vectors and completely sidesteps any quirks
-           of the PostgREST URL grammar.
-        4. Return the top-``limit`` matches (optionally filtered by
-           ``similarity_threshold``).
+        2. ``search_mode="rpc"`` (default): call the ``match_code_embeddings`` SQL
+           function, which orders by pgvector's ``<=>`` operator using the HNSW index
+           and returns only the top-``limit`` rows (no embedding column).
+           ``search_mode="local"``: rank against the project's memory-mapped
+           ``LocalVectorIndex`` (built on first use, refreshed incrementally); no
+           per-query database round-trip. Cross-project searches (``project_id=None``)
+           go through an IVF/PQ approximate index over all projects' vectors, with the
+           best candidates re-scored exactly.
+        3. ``search_mode="client"``: pull a bounded set of candidate rows including the
+           raw embedding and rank them in NumPy (see ``_search_code_client_side``).
+           This is also the fallback when the RPC is unavailable, e.g. the migration
+           has not been applied yet.
 
         Parameters
         ----------
@@ -724,20 +1011,102 @@ class RepoIndexer:
             Minimum cosine-similarity required (0-1).  Results below this value are
             discarded *after* ranking.
         max_server_rows: int
-            Hard cap on how many rows we pull from Supabase for local ranking. The
-            default (~2.5k) keeps memory usage modest (<50 MB) while being plenty for
-            typical repos.  Increase if you store far more than that per project and
-            need higher recall.
+            Only used by the client-side mode: hard cap on how many rows we pull from
+            Supabase for local ranking.
+        search_mode: str | None
+            "rpc", "local" or "client". Defaults to the indexer's ``search_mode``.
         """
 
+        mode = search_mode or self.search_mode
         try:
             # 1) Embed the query text -----------------------------------------
-            emb_resp = self._oai_client.embeddings.create(input=query, model=self.embedding_model)
-            query_vec = np.asarray(emb_resp.data[0].embedding, dtype=np.float32)
+            query_vec = self._embed_query(query)
 
+            if mode == "local":
+                try:
+                    local_index = self.get_local_index(project_id)
+                    local_index.ensure_fresh()
+                    top = local_index.search(
+                        query_vec, limit=limit, similarity_threshold=similarity_threshold,
+                        use_ann=project_id is None,
+                    )
+                    print(f"Search (local index{', ANN' if project_id is None else ''}) returned {len(top)} top matches (≥{similarity_threshold})")
+                    return top
+                except Exception as e_local:
+                    print(f"Local vector index unavailable ({e_local}); falling back to the RPC search")
+            if mode in ("rpc", "local"):
+                try:
+                    return self._search_code_rpc(query_vec, project_id, limit, similarity_threshold)
+                except Exception as e_rpc:
+                    print(f"match_code_embeddings RPC failed ({e_rpc}); falling back to client-side ranking")
+            elif mode != "client":
+                raise ValueError(f"Unknown search_mode: {mode!r}")
+
+            return self._search_code_client_side(query_vec, project_id, limit, similarity_threshold, max_server_rows)
+
+        except Exception as e:
+            print(f"Error during code search: {e}")
+            import traceback
+            traceback.print_exc()
+            return []
+
+    def _embed_query(self, query: str) -> np.ndarray:
+        """Embed a search query, reusing the embedding cache for repeated queries."""
+        if self.embedding_cache is not None:
+            cached = self.embedding_cache.get_many(self.embedding_model, [query])[0]
+            if cached is not None:
+                return np.asarray(cached, dtype=np.float32)
+        emb_resp = self._oai_client.embeddings.create(input=query, model=self.embedding_model)
+        embedding = emb_resp.data[0].embedding
+        if self.embedding_cache is not None:
+            self.embedding_cache.put_many(self.embedding_model, [query], [embedding])
+        return np.asarray(embedding, dtype=np.float32)
+
+    def get_local_index(self, project_id: Optional[str]) -> LocalVectorIndex:
+        """Return the (lazily created) local vector index for a project, or for all projects when None."""
+        key = str(project_id) if project_id is not None else None
+        if key not in self._local_indexes:
+            self._local_indexes[key] = LocalVectorIndex(self.supabase, key, self.supabase_table_name)
+        return self._local_indexes[key]
+
+    def _search_code_rpc(
+        self,
+        query_vec: np.ndarray,
+        project_id: Optional[int],
+        limit: int,
+        similarity_threshold: float,
+    ) -> List[Dict[str, Any]]:
+        """Top-k search executed inside Postgres; only the matching rows cross the wire."""
+        resp = self.supabase.rpc(
+            "match_code_embeddings",
+            {
+                "query_embedding": self._to_pgvector_literal(query_vec.tolist()),
+                "project_id": str(project_id) if project_id is not None else None,
+                "match_count": limit,
+                "threshold": similarity_threshold,
+            },
+        ).execute()
+        if getattr(resp, "error", None):
+            raise Exception(resp.error)
+        top: List[Dict[str, Any]] = getattr(resp, "data", None) or []
+        print(f"Search (rpc) returned {len(top)} top matches (≥{similarity_threshold})")
+        return top
+
+    def _search_code_client_side(
+        self,
+        query_vec: np.ndarray,
+        project_id: Optional[int],
+        limit: int,
+        similarity_threshold: float,
+        max_server_rows: int,
+    ) -> List[Dict[str, Any]]:
+        """Rank candidates in NumPy. Works even if PostgREST cannot order by pgvector operators,
+        but only sees the first ``max_server_rows`` rows of the project."""
+
+        try:
             # 2) Download candidate rows from Supabase ------------------------
             select_cols = (
-                "content,file_path,symbol_type,symbol_name,start_line,end_line,"
+                "content,file_path,symbol_type,symbol_name,parent_symbol,start_line,end_line,"
                 "project_id,embedding"
             )
 
@@ -947,6 +1316,3 @@ class RepoIndexer:
             import traceback
             traceback.print_exc()
             return []
-
-    # Note: The search functionality (if you had one using FAISS) would also need to be rewritten
-    # to query Supabase using its vector search capabilities (e.g., using a stored procedure/function). 
\ No newline at end of file
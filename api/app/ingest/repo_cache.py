@@ -0,0 +1,248 @@
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import git  # gitpython
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only coordinate threads of this process
+    fcntl = None
+
+from ..core.config import REPO_CACHE_DIR, REPO_CACHE_MAX_BYTES
+
+LAST_USED_FILE = "buildie-last-used"
+SIZE_FILE = "buildie-size-bytes"  # Mirror size recorded after each clone/fetch, so eviction never walks the mirrors
+MIRROR_FETCH_REFSPECS = ("+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*")  # Skip GitHub's refs/pull/*
+
+
+class _FileLock:
+    """flock()-based lock on a sidecar file. Each instance opens its own descriptor, so it
+    also excludes other threads of the same process, not only other processes."""
+
+    _thread_locks: Dict[str, threading.Lock] = {}
+    _thread_locks_guard = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def acquire(self, shared: bool = False, blocking: bool = True) -> bool:
+        if fcntl is None:
+            if shared:
+                return True
+            with self._thread_locks_guard:
+                lock = self._thread_locks.setdefault(self.path, threading.Lock())
+            if not lock.acquire(blocking):
+                return False
+            self._fd = -1
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        flags = (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | (0 if blocking else fcntl.LOCK_NB)
+        try:
+            fcntl.flock(fd, flags)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        if fcntl is None:
+            if self._fd == -1:
+                self._thread_locks[self.path].release()
+        else:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+        self._fd = None
+
+
+class RepoMirrorCache:
+    """
+    On-disk cache of bare mirrors, one per repo URL, shared by RepoIndexer and CommitHistorian.
+
+    The first use of a repo clones it once (bare). Later uses only `git fetch` what is new.
+    Callers either read the bare repo directly (`mirror()`, e.g. to walk history) or get a
+    throw-away detached worktree of a ref (`worktree()`, e.g. to read the files at HEAD);
+    neither touches the network beyond the fetch.
+
+    Locking, per repo:
+      - `<key>.lock` (exclusive) serialises clone/fetch/worktree bookkeeping.
+      - `<key>.use` (shared) is held for as long as a caller uses the mirror; eviction only
+        removes mirrors whose `.use` lock it can take exclusively, i.e. idle ones.
+    Mirrors are evicted least-recently-used first once the cache exceeds max_bytes. Each
+    mirror's size is measured when it is cloned or fetched and stored next to it, so the
+    eviction check after every use only reads one small file per mirror.
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.root = root or REPO_CACHE_DIR
+        self.max_bytes = REPO_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def cache_key(repo_url: str) -> str:
+        parsed = urlparse(repo_url)
+        # Key on host + path only, so credentials embedded in the URL never end up on disk
+        identity = f"{parsed.hostname or ''}{parsed.path}" if parsed.scheme else repo_url
+        identity = identity.rstrip("/").removesuffix(".git")
+        slug = re.sub(r"[^A-Za-z0-9._-]+", "_", identity).strip("_")[-80:]
+        digest = hashlib.sha256(identity.encode("utf-8")).hexdigest()[:12]
+        return f"{slug}-{digest}"
+
+    def _mirror_dir(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.git")
+
+    def _sync(self, repo_url: str, key: str, refresh: bool) -> git.Repo:
+        """Clone or fetch the mirror. Caller holds the repo's exclusive lock."""
+        mirror_dir = self._mirror_dir(key)
+        started = time.perf_counter()
+        if not os.path.exists(os.path.join(mirror_dir, "HEAD")):
+            shutil.rmtree(mirror_dir, ignore_errors=True)
+            tmp_dir = tempfile.mkdtemp(prefix=f"{key}.", suffix=".tmp", dir=self.root)
+            try:
+                repo = git.Repo.clone_from(repo_url, tmp_dir, bare=True)
+                repo.git.config("--replace-all", "remote.origin.fetch", MIRROR_FETCH_REFSPECS[0])
+                for refspec in MIRROR_FETCH_REFSPECS[1:]:
+                    repo.git.config("--add", "remote.origin.fetch", refspec)
+                os.rename(tmp_dir, mirror_dir)  # Readers never see a half-cloned mirror
+            except Exception:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                raise
+            print(f"RepoMirrorCache: cloned {key} in {time.perf_counter() - started:.1f}s")
+            self._record_size(mirror_dir)
+        elif refresh:
+            try:
+                git.Repo(mirror_dir).git.fetch("--prune", "origin")
+                print(f"RepoMirrorCache: fetched {key} in {time.perf_counter() - started:.1f}s")
+            except git.GitCommandError as e:
+                print(f"RepoMirrorCache: fetch failed for {key}, using the cached mirror as-is: {e}")
+            self._record_size(mirror_dir)
+        elif not os.path.exists(os.path.join(mirror_dir, SIZE_FILE)):
+            self._record_size(mirror_dir)
+        with open(os.path.join(mirror_dir, LAST_USED_FILE), "w") as f:
+            f.write(str(time.time()))
+        return git.Repo(mirror_dir)
+
+    @contextmanager
+    def mirror(self, repo_url: str, refresh: bool = True) -> Iterator[git.Repo]:
+        """Yield the up-to-date bare mirror of repo_url, protected from eviction while in use."""
+        key = self.cache_key(repo_url)
+        in_use = _FileLock(os.path.join(self.root, f"{key}.use"))
+        in_use.acquire(shared=True)
+        try:
+            lock = _FileLock(os.path.join(self.root, f"{key}.lock"))
+            lock.acquire()
+            try:
+                repo = self._sync(repo_url, key, refresh)
+            finally:
+                lock.release()
+            yield repo
+        finally:
+            in_use.release()
+        self.evict(keep=key)
+
+    @contextmanager
+    def worktree(self, repo_url: str, ref: str = "HEAD", refresh: bool = True) -> Iterator[str]:
+        """Yield the path of a detached worktree of `ref`, checked out from the mirror and removed afterwards."""
+        key = self.cache_key(repo_url)
+        with self.mirror(repo_url, refresh=refresh) as repo:
+            worktree_dir = tempfile.mkdtemp(prefix="buildie-worktree-")
+            lock = _FileLock(os.path.join(self.root, f"{key}.lock"))
+            lock.acquire()
+            try:
+                repo.git.worktree("add", "--detach", worktree_dir, ref)
+            except Exception:
+                shutil.rmtree(worktree_dir, ignore_errors=True)
+                raise
+            finally:
+                lock.release()
+            try:
+                yield worktree_dir
+            finally:
+                lock.acquire()
+                try:
+                    repo.git.worktree("remove", "--force", worktree_dir)
+                except git.GitCommandError as e:
+                    print(f"RepoMirrorCache: could not remove worktree {worktree_dir}: {e}")
+                finally:
+                    shutil.rmtree(worktree_dir, ignore_errors=True)
+                    repo.git.worktree("prune")
+                    lock.release()
+
+    @staticmethod
+    def _dir_size(path: str) -> int:
+        size = 0
+        for dirpath, _dirs, files in os.walk(path):
+            for fname in files:
+                try:
+                    size += os.path.getsize(os.path.join(dirpath, fname))
+                except OSError:
+                    pass
+        return size
+
+    def _record_size(self, mirror_dir: str) -> None:
+        """Measure one mirror and store the result next to it. Caller holds the repo's exclusive lock."""
+        with open(os.path.join(mirror_dir, SIZE_FILE), "w") as f:
+            f.write(str(self._dir_size(mirror_dir)))
+
+    def _entries(self) -> List[Tuple[str, float, int]]:
+        """(key, last_used, size_bytes) for every mirror in the cache, from the files recorded by _sync."""
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith(".git"):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                with open(os.path.join(path, LAST_USED_FILE)) as f:
+                    last_used = float(f.read().strip() or 0)
+            except (OSError, ValueError):
+                last_used = 0.0
+            try:
+                with open(os.path.join(path, SIZE_FILE)) as f:
+                    size = int(f.read().strip() or 0)
+            except (OSError, ValueError):
+                size = self._dir_size(path)  # Mirror cloned before sizes were recorded
+            entries.append((name[:-len(".git")], last_used, size))
+        return entries
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """Remove least recently used, idle mirrors until the cache fits in max_bytes."""
+        entries = self._entries()
+        total = sum(size for _, _, size in entries)
+        for key, _last_used, size in sorted(entries, key=lambda entry: entry[1]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            in_use = _FileLock(os.path.join(self.root, f"{key}.use"))
+            if not in_use.acquire(blocking=False):
+                continue  # Someone is reading it right now
+            try:
+                shutil.rmtree(self._mirror_dir(key), ignore_errors=True)
+                total -= size
+                print(f"RepoMirrorCache: evicted {key} ({size / (1024 * 1024):.1f}MB)")
+            finally:
+                in_use.release()
+
+
+_repo_cache: Optional[RepoMirrorCache] = None
+_repo_cache_lock = threading.Lock()
+
+
+def get_repo_cache() -> RepoMirrorCache:
+    """Process-wide mirror cache."""
+    global _repo_cache
+    with _repo_cache_lock:
+        if _repo_cache is None:
+            _repo_cache = RepoMirrorCache()
+        return _repo_cache
@@ -0,0 +1,151 @@
+"""
+Tests for the NumPy IVF/PQ index (app/ingest/ann_index.py) against exact search, and for its
+use by the cross-project LocalVectorIndex.
+
+Run from api/ with `python -m pytest app/ingest/test_ann_index.py`.
+"""
+import os
+import types
+
+import numpy as np
+import pytest
+
+from app.ingest import vector_index
+from app.ingest.ann_index import IVFPQIndex, default_n_lists, exact_top_k
+
+
+def clustered(n, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, n // 100), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), size=n)] + 0.3 * rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def recall(index, corpus, queries, k=10, **search_kwargs):
+    hits = 0
+    for query in queries:
+        truth = set(exact_top_k(corpus, query, k).tolist())
+        ids, _ = index.search(query, k=k, **search_kwargs)
+        hits += len(truth.intersection(ids.tolist()))
+    return hits / (k * len(queries))
+
+
+@pytest.fixture(scope="module")
+def data():
+    vectors = clustered(4000, 32)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), size=50, replace=False)] + 0.05 * rng.normal(size=(50, 32)).astype(np.float32)
+    return vectors, queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def test_ivf_flat_probing_every_list_is_exact(data):
+    vectors, queries = data
+    index = IVFPQIndex(n_lists=32, pq_subvectors=0, nprobe=32)
+    index.add(vectors)
+    assert recall(index, vectors, queries) == 1.0
+    ids, scores = index.search(queries[0], k=5)
+    np.testing.assert_allclose(scores, vectors[ids].dot(queries[0]), rtol=1e-5)
+    assert list(scores) == sorted(scores, reverse=True)
+
+
+def test_ivf_pq_recall_improves_with_nprobe_and_reranking(data):
+    vectors, queries = data
+    index = IVFPQIndex(n_lists=default_n_lists(len(vectors)), pq_subvectors=8, nprobe=4)
+    index.add(vectors)
+    assert index.codes.shape == (len(vectors), 8) and index.codes.dtype == np.uint8
+
+    narrow = recall(index, vectors, queries, nprobe=1)
+    wide = recall(index, vectors, queries, nprobe=32)
+    reranked = recall(index, vectors, queries, nprobe=32, vectors=vectors, rerank=200)
+    assert narrow <= wide <= reranked
+    assert reranked >= 0.95
+    # Re-ranked scores are the exact inner products
+    ids, scores = index.search(queries[0], k=10, nprobe=32, vectors=vectors, rerank=200)
+    np.testing.assert_allclose(scores, vectors[ids].dot(queries[0]), rtol=1e-5)
+
+
+def test_saved_index_loads_memory_mapped_with_the_same_results(data, tmp_path):
+    vectors, queries = data
+    index = IVFPQIndex(n_lists=16, pq_subvectors=4, nprobe=8)
+    index.add(vectors)
+    index.save(str(tmp_path))
+    loaded = IVFPQIndex.load(str(tmp_path))
+    assert isinstance(loaded.codes, np.memmap)
+    for query in queries[:5]:
+        expected_ids, expected_scores = index.search(query, k=10)
+        ids, scores = loaded.search(query, k=10)
+        np.testing.assert_array_equal(ids, expected_ids)
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-6)
+
+
+class FakeEmbeddingsTable:
+    """Just enough of the PostgREST query builder for LocalVectorIndex's keyset pagination."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.after = 0
+        self.page = None
+        self.count = None
+
+    def select(self, columns, count=None):
+        self.count = count
+        return self
+
+    @property
+    def not_(self):
+        return self
+
+    def is_(self, column, value):
+        return self
+
+    def eq(self, column, value):
+        return self
+
+    def gt(self, column, value):
+        self.after = value
+        return self
+
+    def order(self, column):
+        return self
+
+    def limit(self, n):
+        self.page = n
+        return self
+
+    def execute(self):
+        rows = [row for row in self.rows if row["id"] > self.after]
+        return types.SimpleNamespace(data=rows[:self.page], count=len(rows) if self.count else None)
+
+
+def test_cross_project_index_searches_exactly_until_its_ann_index_is_built(data, tmp_path, monkeypatch):
+    vectors, queries = data
+    monkeypatch.setattr(vector_index, "ANN_PQ_SUBVECTORS", 8)
+    rows = [{"id": i + 1, "project_id": f"p{i % 3}", "content": f"chunk {i}", "file_path": "f.py", "symbol_type": None,
+             "symbol_name": None, "parent_symbol": None, "start_line": 1, "end_line": 2, "embedding": vectors[i].tolist()}
+            for i in range(len(vectors))]
+    supabase = types.SimpleNamespace(table=lambda name: FakeEmbeddingsTable(rows))
+    index = vector_index.LocalVectorIndex(supabase, None, "code_embeddings", index_dir=str(tmp_path))
+    assert index.build_ann
+
+    # Hold the background build back to see the exact-scan fallback
+    started = []
+    monkeypatch.setattr(index, "_start_ann_build", lambda: started.append(index._loaded_generation))
+    index.build()
+    assert started and index._get_ann() is None
+    exact = index.search(queries[0], limit=5, similarity_threshold=0, use_ann=True)
+    assert [r["id"] - 1 for r in exact] == exact_top_k(vectors, queries[0], 5).tolist()
+
+    monkeypatch.undo()
+    monkeypatch.setattr(vector_index, "ANN_PQ_SUBVECTORS", 8)
+    index._start_ann_build()
+    index._ann_thread.join(timeout=60)
+    ann_dir = os.path.join(index.dir, index._loaded_generation, "ann")
+    assert os.path.exists(os.path.join(ann_dir, "ann.json"))
+    assert index._get_ann() is not None
+    approximate = index.search(queries[0], limit=5, similarity_threshold=0, use_ann=True)
+    assert [r["id"] for r in approximate] == [r["id"] for r in exact]
+
+    # Per-project indexes never train one
+    project = vector_index.LocalVectorIndex(supabase, "p0", "code_embeddings", index_dir=str(tmp_path))
+    project.build()
+    assert not project.build_ann and project._ann_thread is None
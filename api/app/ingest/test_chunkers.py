@@ -0,0 +1,257 @@
+"""
+Unit tests for the structural chunkers (app/ingest/chunkers.py).
+
+Run from api/ with `python -m pytest app/ingest/test_chunkers.py`. The tree-sitter tests are
+skipped for languages whose grammar (chunkers dependency group) is not installed.
+"""
+import textwrap
+
+import pytest
+
+from app.ingest.chunkers import TreeSitterChunker, chunk_python, get_chunker
+
+
+def by_name(definitions):
+    return {(d["parent"], d["name"]): d for d in definitions}
+
+
+def segment_lines(definition):
+    return [line for start, end in definition["segments"] for line in range(start, end)]
+
+
+def assert_each_line_once(source, definitions):
+    """No line is embedded twice, and every non-blank line is embedded."""
+    lines = source.splitlines()
+    covered = [line for d in definitions for line in segment_lines(d)]
+    assert len(covered) == len(set(covered))
+    assert {i for i, line in enumerate(lines) if line.strip()} <= set(covered)
+
+
+PYTHON_SOURCE = textwrap.dedent('''\
+    """Module docstring."""
+    import os
+
+    LIMIT = 10
+
+
+    @decorator
+    def top(a):
+        def helper():
+            return a
+        return helper()
+
+
+    class Outer:
+        """Outer docstring."""
+        attr = 1
+
+        def method(self):
+            return self.attr
+
+        class Inner:
+            kind = "inner"
+
+            async def deep(self):
+                return 2
+
+        @property
+        def prop(self):
+            return 3
+
+
+    if os.name == "nt":
+        def windows_only():
+            pass
+
+    register(top)
+    ''')
+
+
+def test_python_definitions_are_nested_by_qualified_parent():
+    definitions = chunk_python(PYTHON_SOURCE)
+    names = by_name(definitions)
+    assert set(names) == {
+        (None, None), (None, "top"), (None, "Outer"), ("Outer", "method"), ("Outer", "Inner"),
+        ("Outer.Inner", "deep"), ("Outer", "prop"), (None, "windows_only"),
+    }
+    assert names[(None, "top")]["type"] == "FunctionDef"
+    assert names[("Outer.Inner", "deep")]["type"] == "AsyncFunctionDef"
+    # Decorators belong to the definition they decorate
+    lines = PYTHON_SOURCE.splitlines()
+    assert lines[names[(None, "top")]["start"]] == "@decorator"
+    assert lines[names[("Outer", "prop")]["start"]].strip() == "@property"
+
+
+def test_python_class_headers_exclude_member_bodies():
+    definitions = chunk_python(PYTHON_SOURCE)
+    names = by_name(definitions)
+    lines = PYTHON_SOURCE.splitlines()
+    outer = [lines[i] for i in segment_lines(names[(None, "Outer")])]
+    assert "class Outer:" in outer and "    attr = 1" in outer
+    assert not any("return" in line or "def " in line or "kind" in line for line in outer)
+    inner = [lines[i].strip() for i in segment_lines(names[("Outer", "Inner")])]
+    assert inner[:2] == ["class Inner:", 'kind = "inner"']
+    assert "return 2" not in inner
+    # Nested helpers stay inside their function instead of becoming definitions
+    top = [lines[i] for i in segment_lines(names[(None, "top")])]
+    assert "    def helper():" in top
+    assert_each_line_once(PYTHON_SOURCE, definitions)
+
+
+def test_python_module_level_code_becomes_one_module_chunk():
+    definitions = chunk_python(PYTHON_SOURCE)
+    module = definitions[0]
+    assert module["type"] == "module" and module["name"] is None
+    lines = PYTHON_SOURCE.splitlines()
+    module_lines = [lines[i] for i in segment_lines(module)]
+    assert module_lines[:2] == ['"""Module docstring."""', "import os"]
+    assert "LIMIT = 10" in module_lines
+    assert 'if os.name == "nt":' in module_lines
+    assert module_lines[-1] == "register(top)"
+    # Blank lines at the edges of each gap are trimmed
+    assert all(lines[start].strip() and lines[end - 1].strip() for start, end in module["segments"])
+
+
+def test_python_without_definitions_or_with_syntax_errors_falls_back():
+    assert chunk_python("import os\nprint(os.name)\n") == []
+    assert chunk_python("def broken(:\n    pass\n") is None
+    # Only definitions, nothing else: no module chunk
+    definitions = chunk_python("def only():\n    return 1\n")
+    assert [d["type"] for d in definitions] == ["FunctionDef"]
+
+
+def test_chunker_registry_is_keyed_by_extension():
+    assert get_chunker("pkg/Module.PY") is chunk_python
+    assert get_chunker("notes.txt") is None
+
+
+def tree_sitter_chunker(path):
+    chunker = get_chunker(path)
+    if not isinstance(chunker, TreeSitterChunker):
+        pytest.skip(f"no tree-sitter grammar installed for {path}")
+    return chunker
+
+
+TYPESCRIPT_SOURCE = textwrap.dedent('''\
+    import { x } from "y";
+
+    /** Service docs */
+    export class Service {
+      private n = 1;
+
+      // handles things
+      handle(req: Request): number {
+        return this.n;
+      }
+    }
+
+    export interface Shape {
+      area(): number;
+    }
+
+    export const handler = async (e: Event) => {
+      return e;
+    };
+
+    const CONFIG = { a: 1 };
+    ''')
+
+
+def test_tree_sitter_typescript_classes_methods_and_function_bindings():
+    definitions = tree_sitter_chunker("src/service.ts")(TYPESCRIPT_SOURCE)
+    names = by_name(definitions)
+    assert set(names) == {(None, None), (None, "Service"), ("Service", "handle"), (None, "Shape"), (None, "handler")}
+    lines = TYPESCRIPT_SOURCE.splitlines()
+    # Doc comments and `export` belong to the definition
+    assert lines[names[(None, "Service")]["start"]] == "/** Service docs */"
+    assert lines[names[("Service", "handle")]["start"]].strip() == "// handles things"
+    service = [lines[i].strip() for i in segment_lines(names[(None, "Service")])]
+    assert "private n = 1;" in service and "return this.n;" not in service
+    # A const bound to an arrow function is a definition; a plain object constant is module code
+    module = [lines[i] for i in segment_lines(definitions[0])]
+    assert module == ['import { x } from "y";', "const CONFIG = { a: 1 };"]
+    assert_each_line_once(TYPESCRIPT_SOURCE, definitions)
+
+
+GO_SOURCE = textwrap.dedent('''\
+    package main
+
+    import "fmt"
+
+    type Server struct {
+        port int
+    }
+
+    // Start starts.
+    func (s *Server) Start() {
+        fmt.Println(s.port)
+    }
+
+    func main() {
+        (&Server{}).Start()
+    }
+    ''')
+
+
+def test_tree_sitter_go_methods_take_their_receiver_as_parent():
+    definitions = tree_sitter_chunker("cmd/main.go")(GO_SOURCE)
+    names = by_name(definitions)
+    assert set(names) == {(None, None), (None, "Server"), ("Server", "Start"), (None, "main")}
+    assert names[("Server", "Start")]["start"] == GO_SOURCE.splitlines().index("// Start starts.")
+    assert_each_line_once(GO_SOURCE, definitions)
+
+
+RUST_SOURCE = textwrap.dedent('''\
+    use std::fmt;
+
+    struct Point { x: i32 }
+
+    impl Point {
+        fn new() -> Self { Point { x: 0 } }
+
+        fn norm(&self) -> i32 {
+            self.x
+        }
+    }
+    ''')
+
+
+def test_tree_sitter_rust_impl_members_are_split_out():
+    definitions = tree_sitter_chunker("src/lib.rs")(RUST_SOURCE)
+    names = by_name(definitions)
+    assert set(names) == {(None, None), (None, "Point"), ("Point", "new"), ("Point", "norm")}
+    impl = next(d for d in definitions if d["type"] == "impl_item")
+    lines = RUST_SOURCE.splitlines()
+    assert [lines[i] for i in segment_lines(impl) if lines[i].strip()] == ["impl Point {", "}"]
+    assert_each_line_once(RUST_SOURCE, definitions)
+
+
+JAVA_SOURCE = textwrap.dedent('''\
+    package a;
+
+    public class A {
+        private int x;
+
+        public A() { x = 1; }
+
+        public int get() {
+            return x;
+        }
+
+        static class B {
+            void run() {}
+        }
+    }
+    ''')
+
+
+def test_tree_sitter_java_nested_classes_qualify_their_members():
+    definitions = tree_sitter_chunker("src/A.java")(JAVA_SOURCE)
+    names = by_name(definitions)
+    assert set(names) == {(None, None), (None, "A"), ("A", "A"), ("A", "get"), ("A", "B"), ("A.B", "run")}
+    assert names[("A", "A")]["type"] == "constructor_declaration"
+    assert_each_line_once(JAVA_SOURCE, definitions)
+
+
+def test_tree_sitter_file_without_definitions_falls_back_to_line_windows():
+    assert tree_sitter_chunker("config.js")("const a = 1;\nmodule.exports = { a };\n") == []
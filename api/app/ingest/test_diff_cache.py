@@ -0,0 +1,75 @@
+"""
+Tests for the SQLite commit diff cache (app/ingest/diff_cache.py), on a temporary file.
+
+Run from api/ with `python -m pytest app/ingest/test_diff_cache.py`.
+"""
+import itertools
+import random
+import types
+
+import pytest
+
+from app.ingest import diff_cache
+from app.ingest.diff_cache import DiffCache
+
+REPO = "https://github.com/octo/widgets"
+
+
+def diff_for(sha, lines=200):
+    rng = random.Random(sha)
+    body = "".join(f"+{rng.getrandbits(64):016x} {rng.getrandbits(64):016x}\n" for _ in range(lines))
+    return f"diff --git a/{sha}.py b/{sha}.py\n--- a/{sha}.py\n+++ b/{sha}.py\n@@ -0,0 +1,{lines} @@\n{body}"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Strictly increasing time.time(), so LRU order is deterministic."""
+    ticks = itertools.count(1)
+    monkeypatch.setattr(diff_cache, "time", types.SimpleNamespace(time=lambda: float(next(ticks))))
+
+
+def test_round_trip_across_url_spellings(tmp_path, clock):
+    cache = DiffCache(path=str(tmp_path / "diffs.sqlite3"), max_bytes=10 * 1024 * 1024)
+    cache.put_many(REPO, [("aaa", diff_for("aaa")), ("empty", ""), ("none", None)])
+    assert cache.get(REPO + ".git", "aaa") == diff_for("aaa")
+    assert cache.get("https://token@github.com/octo/widgets", "aaa") == diff_for("aaa")
+    # Empty diffs are not stored, and other repos do not share entries
+    assert cache.get(REPO, "empty") is None and cache.get("https://github.com/octo/other", "aaa") is None
+    # Existing entries are kept: a commit's diff never changes
+    cache.put(REPO, "aaa", "something else")
+    assert cache.get(REPO, "aaa") == diff_for("aaa")
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (3, 2, 1)
+    assert 0 < stats["bytes"] < len(diff_for("aaa")) and stats["compression_ratio"] > 1
+
+
+def test_least_recently_used_diffs_are_evicted_below_the_low_watermark(tmp_path, clock):
+    cache = DiffCache(path=str(tmp_path / "diffs.sqlite3"), max_bytes=10 * 1024 * 1024)
+    for sha in "abcde":
+        cache.put(REPO, sha, diff_for(sha))
+    entry_bytes = cache.stats()["bytes"] / 5
+    # Room for about five and a half diffs
+    cache.max_bytes = int(entry_bytes * 5.5)
+    cache.get(REPO, "a")  # a becomes the most recently used
+    cache.put(REPO, "f", diff_for("f"))
+
+    present = {sha for sha in "abcdef" if cache.get(REPO, sha) is not None}
+    assert {"a", "f"} <= present and "b" not in present
+    assert cache.stats()["bytes"] <= int(cache.max_bytes * diff_cache.EVICTION_LOW_WATERMARK)
+
+
+def test_undecodable_entries_count_as_misses(tmp_path, clock):
+    path = str(tmp_path / "diffs.sqlite3")
+    cache = DiffCache(path=path, max_bytes=10 * 1024 * 1024)
+    cache.put(REPO, "good", diff_for("good"))
+    # e.g. written by a process with a codec this one lacks, or a corrupt blob
+    cache._conn.execute(
+        "INSERT INTO diffs (repo, commit_sha, codec, diff, nbytes, raw_bytes, last_used) VALUES (?, ?, 'zstd', ?, 3, 3, 0)",
+        (DiffCache.repo_key(REPO), "bad", b"\x00\x01\x02"),
+    )
+    cache._conn.commit()
+
+    assert cache.get(REPO, "bad") is None
+    assert cache.get(REPO, "good") == diff_for("good")
+    assert (cache.hits, cache.misses) == (1, 1)
@@ -0,0 +1,226 @@
+"""
+Unit tests for the unified diff parser and the hunk-aligned diff chunker.
+
+Run from api/ with `python -m pytest app/ingest/test_diff_splitter.py`.
+"""
+import io
+import os
+
+# diff_splitter imports supabase_service, which needs these set to import; no request is made
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+
+from app.ingest.diff_parser import hunk_new_range, iter_diff_hunks  # noqa: E402
+from app.ingest.diff_splitter import _split_hunk, split_diff_into_chunks  # noqa: E402
+from app.ingest.tokenization import count_tokens  # noqa: E402
+
+
+def parse(diff_text):
+    return list(iter_diff_hunks(io.StringIO(diff_text)))
+
+
+def changed_lines(hunks):
+    added = sum(1 for h in hunks for line in h["lines"] if line.startswith("+"))
+    removed = sum(1 for h in hunks for line in h["lines"] if line.startswith("-"))
+    return added, removed
+
+
+def test_header_lookalike_body_lines_stay_in_the_hunk():
+    # A removed "-- old rule" line and an added "++ new rule" line look like ---/+++ file headers
+    diff = (
+        "diff --git a/notes.md b/notes.md\n"
+        "index 1111111..2222222 100644\n"
+        "--- a/notes.md\n"
+        "+++ b/notes.md\n"
+        "@@ -1,3 +1,3 @@\n"
+        " title\n"
+        "--- old rule\n"
+        "+++ new rule\n"
+        " end\n"
+        "diff --git a/b.txt b/b.txt\n"
+        "--- a/b.txt\n"
+        "+++ b/b.txt\n"
+        "@@ -1 +1 @@\n"
+        "-x\n"
+        "+y\n"
+    )
+    hunks = parse(diff)
+    assert [h["file_path"] for h in hunks] == ["notes.md", "b.txt"]
+    assert hunks[0]["lines"] == [" title", "--- old rule", "+++ new rule", " end"]
+    assert hunks[0]["status"] == "modified"
+    assert changed_lines(hunks) == (2, 2)
+
+
+def test_rename_with_changes_and_pure_rename():
+    diff = (
+        "diff --git a/old.py b/new.py\n"
+        "similarity index 90%\n"
+        "rename from old.py\n"
+        "rename to new.py\n"
+        "--- a/old.py\n"
+        "+++ b/new.py\n"
+        "@@ -1 +1 @@\n"
+        "-x = 1\n"
+        "+x = 2\n"
+        "diff --git a/a/one.txt b/a/two.txt\n"
+        "similarity index 100%\n"
+        "rename from a/one.txt\n"
+        "rename to a/two.txt\n"
+    )
+    renamed, pure = parse(diff)
+    assert (renamed["status"], renamed["old_path"], renamed["file_path"]) == ("renamed", "old.py", "new.py")
+    assert renamed["lines"] == ["-x = 1", "+x = 2"]
+    assert (pure["status"], pure["old_path"], pure["file_path"]) == ("renamed", "a/one.txt", "a/two.txt")
+    assert pure["header"] is None and pure["lines"] == []
+
+
+def test_binary_file_yields_one_entry_without_lines():
+    diff = (
+        "diff --git a/img.png b/img.png\n"
+        "new file mode 100644\n"
+        "index 0000000..3333333\n"
+        "Binary files /dev/null and b/img.png differ\n"
+    )
+    (hunk,) = parse(diff)
+    assert hunk["is_binary"] and hunk["status"] == "added"
+    assert hunk["file_path"] == "img.png" and hunk["header"] is None
+
+    (chunk,) = split_diff_into_chunks(diff)
+    assert chunk["file_path"] == "img.png"
+    assert "Binary file changed" in chunk["text"]
+
+
+def test_dev_null_marks_added_and_deleted_files():
+    diff = (
+        "--- /dev/null\n"
+        "+++ b/added.py\n"
+        "@@ -0,0 +1,2 @@\n"
+        "+a\n"
+        "+b\n"
+        "--- a/gone.py\n"
+        "+++ /dev/null\n"
+        "@@ -1,2 +0,0 @@\n"
+        "-a\n"
+        "-b\n"
+    )
+    added, deleted = parse(diff)
+    assert (added["status"], added["file_path"], added["old_path"]) == ("added", "added.py", None)
+    assert (deleted["status"], deleted["file_path"]) == ("deleted", "gone.py")
+    assert hunk_new_range(added) == [1, 2]
+    # A pure deletion points at where the lines were
+    assert hunk_new_range(deleted) == [0, 0]
+
+
+def test_empty_context_lines_and_missing_newline_marker():
+    # Some tools strip the single space of empty context lines
+    diff = (
+        "diff --git a/f.py b/f.py\n"
+        "--- a/f.py\n"
+        "+++ b/f.py\n"
+        "@@ -1,4 +1,4 @@\n"
+        " def f():\n"
+        "\n"
+        "-    return 1\n"
+        "+    return 2\n"
+        " # end\n"
+        "\\ No newline at end of file\n"
+        "diff --git a/g.py b/g.py\n"
+        "--- a/g.py\n"
+        "+++ b/g.py\n"
+        "@@ -1 +1 @@\n"
+        "-1\n"
+        "+2\n"
+    )
+    f_hunk, g_hunk = parse(diff)
+    assert f_hunk["lines"] == [" def f():", " ", "-    return 1", "+    return 2", " # end", "\\ No newline at end of file"]
+    assert g_hunk["file_path"] == "g.py"
+
+
+def test_commit_message_preamble_is_skipped():
+    diff = (
+        "commit 0123456789abcdef\n"
+        "Author: Someone <someone@example.com>\n"
+        "\n"
+        "    --- not a file header\n"
+        "\n"
+        "diff --git a/x b/x\n"
+        "--- a/x\n"
+        "+++ b/x\n"
+        "@@ -1 +1 @@\n"
+        "-old\n"
+        "+new\n"
+    )
+    (hunk,) = parse(diff)
+    assert hunk["file_path"] == "x"
+
+
+def _function_hunk(functions: int, body_lines: int) -> dict:
+    lines = []
+    for n in range(functions):
+        lines.append(f"+def handler_{n}(request, response):")
+        lines += [f"+    value_{i} = compute_something(request, {i}, 'padding text')" for i in range(body_lines)]
+        lines.append("+")
+    return {
+        "file_path": "app.py", "old_path": "app.py", "status": "modified", "is_binary": False,
+        "header": f"@@ -0,0 +1,{len(lines)} @@", "section": "",
+        "old_start": 0, "old_count": 0, "new_start": 1, "new_count": len(lines), "lines": lines,
+    }
+
+
+def test_split_hunk_respects_budget_and_cuts_at_definitions():
+    hunk = _function_hunk(functions=6, body_lines=12)
+    pieces = _split_hunk(hunk, max_tokens=300)
+    assert len(pieces) > 1
+    assert all(piece["tokens"] <= 300 for piece in pieces)
+    # Pieces cover every line once, in order, each under its own @@ header
+    bodies = [line for piece in pieces for line in piece["text"].split("\n")[1:]]
+    assert bodies == hunk["lines"]
+    assert all(piece["text"].startswith("@@ ") for piece in pieces)
+    # Every cut after the first piece lands on a new top-level definition
+    assert all(piece["text"].split("\n")[1].startswith("+def ") for piece in pieces[1:])
+    # Line ranges are contiguous on the new side
+    assert pieces[0]["start_line"] == 1
+    assert pieces[-1]["end_line"] == len(hunk["lines"])
+    for before, after in zip(pieces, pieces[1:]):
+        assert after["start_line"] == before["end_line"] + 1
+
+
+def test_chunks_stay_within_budget_and_merge_small_hunks_per_file():
+    small_hunks = "".join(
+        f"@@ -{n * 10 + 1},1 +{n * 10 + 1},1 @@\n-old {n}\n+new {n}\n" for n in range(3)
+    )
+    big_body = "".join(f"+line {i} of a long added block with some words in it\n" for i in range(400))
+    diff = (
+        "diff --git a/small.py b/small.py\n--- a/small.py\n+++ b/small.py\n" + small_hunks
+        + "diff --git a/big.py b/big.py\nnew file mode 100644\n--- /dev/null\n+++ b/big.py\n"
+        + "@@ -0,0 +1,400 @@\n" + big_body
+    )
+    chunks = split_diff_into_chunks(diff, max_tokens=500)
+
+    small = [c for c in chunks if c["file_path"] == "small.py"]
+    assert len(small) == 1 and len(small[0]["hunk_headers"]) == 3
+    assert (small[0]["start_line"], small[0]["end_line"]) == (1, 21)
+
+    big = [c for c in chunks if c["file_path"] == "big.py"]
+    assert len(big) > 1
+    assert all(c["status"] == "added" and c["text"].startswith("--- /dev/null\n+++ b/big.py") for c in big)
+    assert (big[0]["start_line"], big[-1]["end_line"]) == (1, 400)
+
+    for chunk in chunks:
+        assert chunk["tokens"] <= 500
+        assert count_tokens(chunk["text"]) <= 500
+    added = sum(1 for c in chunks for line in c["text"].split("\n") if line.startswith("+") and not line.startswith("+++ "))
+    assert added == 403
+
+
+def test_single_line_over_budget_is_cut():
+    long_line = "+" + " ".join(f"word{i}" for i in range(2000))
+    hunk = {
+        "file_path": "data.js", "old_path": "data.js", "status": "modified", "is_binary": False,
+        "header": "@@ -1,0 +1,1 @@", "section": "", "old_start": 1, "old_count": 0,
+        "new_start": 1, "new_count": 1, "lines": [long_line],
+    }
+    pieces = _split_hunk(hunk, max_tokens=200)
+    assert len(pieces) > 1
+    assert all(piece["tokens"] <= 200 for piece in pieces)
+    assert all((piece["start_line"], piece["end_line"]) == (1, 1) for piece in pieces)
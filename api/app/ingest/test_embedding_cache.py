@@ -0,0 +1,68 @@
+"""
+Tests for the SQLite embedding cache (app/ingest/embedding_cache.py), on a temporary file.
+
+Run from api/ with `python -m pytest app/ingest/test_embedding_cache.py`.
+"""
+import itertools
+import types
+
+import pytest
+
+from app.ingest import embedding_cache
+from app.ingest.embedding_cache import EmbeddingCache
+
+MODEL = "text-embedding-3-small"
+VECTOR_BYTES = 4 * 4  # Four float32s per test embedding
+
+
+def vec(n):
+    return [float(n), 0.5, -1.0, 2.0]
+
+
+def put_one_by_one(cache, keys, start=0):
+    # One put per entry: entries stored together share a last_used timestamp
+    for n, key in enumerate(keys, start):
+        cache.put_many(MODEL, [key], [vec(n)])
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Strictly increasing time.time(), so LRU order is deterministic."""
+    ticks = itertools.count(1)
+    monkeypatch.setattr(embedding_cache, "time", types.SimpleNamespace(time=lambda: float(next(ticks))))
+
+
+def test_round_trip_and_hit_counting(tmp_path, clock):
+    cache = EmbeddingCache(path=str(tmp_path / "embeddings.sqlite3"), max_bytes=10_000)
+    assert cache.get_many(MODEL, ["a", "b"]) == [None, None]
+    cache.put_many(MODEL, ["a", "b"], [vec(1), vec(2)])
+    assert cache.get_many(MODEL, ["b", "missing", "a", "b"]) == [vec(2), None, vec(1), vec(2)]
+    # Entries are per model
+    assert cache.get_many("text-embedding-3-large", ["a"]) == [None]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"], stats["bytes"]) == (3, 4, 2, 2 * VECTOR_BYTES)
+
+
+def test_least_recently_used_entries_are_evicted_below_the_low_watermark(tmp_path, clock):
+    # Room for 6 vectors; eviction goes down to 90 bytes, i.e. 5 vectors
+    cache = EmbeddingCache(path=str(tmp_path / "embeddings.sqlite3"), max_bytes=6 * VECTOR_BYTES + 4)
+    put_one_by_one(cache, "abcde")
+    cache.get_many(MODEL, ["a"])  # a becomes the most recently used
+    cache.put_many(MODEL, ["f", "g"], [vec(5), vec(6)])
+
+    present = dict(zip("abcdefg", cache.get_many(MODEL, list("abcdefg"))))
+    assert [key for key, value in present.items() if value is None] == ["b", "c"]
+    assert cache.stats()["bytes"] == 5 * VECTOR_BYTES
+
+
+def test_eviction_counts_entries_written_by_other_processes(tmp_path, clock):
+    path = str(tmp_path / "embeddings.sqlite3")
+    max_bytes = 4 * VECTOR_BYTES
+    api, worker = EmbeddingCache(path=path, max_bytes=max_bytes), EmbeddingCache(path=path, max_bytes=max_bytes)
+    put_one_by_one(api, "abc")
+    put_one_by_one(worker, "de", start=3)
+    # The worker counted the API's entries in the shared file and evicted the oldest ones
+    assert worker.stats()["bytes"] <= max_bytes
+    assert api.get_many(MODEL, list("abcde")) == [None, None, vec(2), vec(3), vec(4)]
+    api.close()
+    worker.close()
@@ -0,0 +1,76 @@
+"""
+Unit tests for embedding request sizing (app/ingest/embedding_models.py).
+
+Run from api/ with `python -m pytest app/ingest/test_embedding_models.py`.
+"""
+import random
+
+from app.ingest import embedding_models
+from app.ingest.embedding_models import get_model_limits, pack_batches
+
+
+def assert_valid_packing(batches, token_counts, max_tokens, max_inputs):
+    flat = [i for batch in batches for i in batch]
+    assert sorted(flat) == list(range(len(token_counts)))
+    for batch in batches:
+        assert batch == sorted(batch)
+        assert len(batch) <= max_inputs
+        # Only an input that is over the budget on its own may exceed it, alone in its request
+        assert sum(token_counts[i] for i in batch) <= max_tokens or len(batch) == 1
+    assert [batch[0] for batch in batches] == sorted(batch[0] for batch in batches)
+
+
+def test_first_fit_decreasing_fills_requests_tightly():
+    token_counts = [6, 4, 5, 5, 3, 7]  # 30 tokens: three full requests of 10
+    batches = pack_batches(token_counts, max_tokens=10, max_inputs=10)
+    assert len(batches) == 3
+    assert all(sum(token_counts[i] for i in batch) == 10 for batch in batches)
+    assert_valid_packing(batches, token_counts, 10, 10)
+
+
+def test_input_count_limit_is_respected():
+    token_counts = [1] * 25
+    batches = pack_batches(token_counts, max_tokens=1000, max_inputs=10)
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    assert batches[0] == list(range(10))
+
+
+def test_oversize_single_input_gets_its_own_request():
+    token_counts = [3, 50, 4, 2]
+    batches = pack_batches(token_counts, max_tokens=10, max_inputs=10)
+    assert [1] in batches
+    assert len(batches) == 2
+    assert_valid_packing(batches, token_counts, 10, 10)
+
+
+def test_random_inputs_pack_within_limits():
+    rng = random.Random(0)
+    for _ in range(50):
+        token_counts = [rng.randint(1, 400) for _ in range(rng.randint(0, 300))]
+        batches = pack_batches(token_counts, max_tokens=1000, max_inputs=16)
+        assert_valid_packing(batches, token_counts, 1000, 16)
+        # Close to the fewest requests possible (first-fit decreasing uses at most ~11/9 of the optimum)
+        lower_bound = max(-(-sum(token_counts) // 1000), -(-len(token_counts) // 16))
+        assert len(batches) <= 11 * lower_bound // 9 + 1
+
+
+def test_empty_input():
+    assert pack_batches([], max_tokens=10, max_inputs=10) == []
+
+
+def test_model_limits_apply_headroom_and_overrides(monkeypatch):
+    monkeypatch.setattr(embedding_models, "TOKEN_BUDGET_HEADROOM", 0.5)
+    monkeypatch.setattr(embedding_models, "MAX_INPUTS_OVERRIDE", 0)
+    monkeypatch.setattr(embedding_models, "MAX_TOKENS_OVERRIDE", 0)
+    limits = get_model_limits("text-embedding-3-small")
+    assert limits["max_tokens_per_request"] == 150000 and limits["max_inputs"] == 2048
+    # The registry itself is not modified
+    assert embedding_models.EMBEDDING_MODELS["text-embedding-3-small"]["max_tokens_per_request"] == 300000
+
+    unknown = get_model_limits("some-future-model")
+    assert unknown["max_inputs"] == 256 and unknown["max_tokens_per_request"] == 4095
+
+    monkeypatch.setattr(embedding_models, "MAX_INPUTS_OVERRIDE", 100)
+    monkeypatch.setattr(embedding_models, "MAX_TOKENS_OVERRIDE", 20000)
+    limits = get_model_limits("text-embedding-3-large")
+    assert (limits["max_inputs"], limits["max_tokens_per_request"]) == (100, 20000)
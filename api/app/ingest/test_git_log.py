@@ -0,0 +1,118 @@
+"""
+Unit tests for the single-pass `git log --raw -p` reader (app/ingest/git_log.py), run against a
+throwaway repository.
+
+Run from api/ with `python -m pytest app/ingest/test_git_log.py`.
+"""
+import git
+import pytest
+
+from app.ingest.git_log import iter_commits_with_patches, list_commit_shas
+
+
+def commit_all(repo, message, *args):
+    repo.git.add("-A")
+    repo.git.commit("-q", "-m", message, *args)
+    return repo.head.commit.hexsha
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = git.Repo.init(tmp_path, initial_branch="main")
+    with repo.config_writer() as config:
+        config.set_value("user", "name", "Test Author")
+        config.set_value("user", "email", "author@example.com")
+        config.set_value("commit", "gpgsign", "false")
+    return repo
+
+
+def write(repo, path, content, mode="w"):
+    full = repo.working_tree_dir + "/" + path
+    with open(full, mode) as f:
+        f.write(content)
+
+
+def test_added_modified_deleted_files_and_line_stats(repo):
+    write(repo, "a.py", "one\ntwo\nthree\n")
+    write(repo, "gone.txt", "bye\n")
+    first = commit_all(repo, "Initial commit\n\nWith a body line.")
+    write(repo, "a.py", "one\n2\nthree\nfour\n")
+    repo.git.rm("-q", "gone.txt")
+    second = commit_all(repo, "Edit a.py")
+
+    commits = list(iter_commits_with_patches(repo))
+    assert [c["hexsha"] for c in commits] == [second, first] == list_commit_shas(repo)
+
+    latest, initial = commits
+    assert initial["parents"] == [] and latest["parents"] == [first]
+    assert initial["message"] == "Initial commit\n\nWith a body line." and initial["summary"] == "Initial commit"
+    assert (latest["author_name"], latest["author_email"]) == ("Test Author", "author@example.com")
+    assert initial["changed_files"] == [{"file_path": "a.py", "status": "added"}, {"file_path": "gone.txt", "status": "added"}]
+    assert latest["changed_files"] == [{"file_path": "a.py", "status": "modified"}, {"file_path": "gone.txt", "status": "deleted"}]
+    assert latest["stats"] == {
+        "a.py": {"insertions": 2, "deletions": 1, "lines": 3},
+        "gone.txt": {"insertions": 0, "deletions": 1, "lines": 1},
+    }
+    assert latest["diff_text"].startswith("diff --git a/a.py b/a.py\n")
+    assert "+four\n" in latest["diff_text"] and "-bye\n" in latest["diff_text"]
+
+
+def test_rename_binary_and_empty_commits(repo):
+    body = "".join(f"line {i}\n" for i in range(20))
+    write(repo, "old name.py", body)
+    commit_all(repo, "Add file")
+    repo.git.mv("old name.py", "new name.py")
+    renamed_sha = commit_all(repo, "Rename with a space")
+    write(repo, "logo.png", b"\x89PNG\r\n\x1a\n\x00\x01\x02", mode="wb")
+    binary_sha = commit_all(repo, "Add binary")
+    repo.git.commit("-q", "--allow-empty", "-m", "Empty commit\n\ndiff --git a/fake b/fake\n:100644 100644 0 0 M\tfake")
+    empty_sha = repo.head.commit.hexsha
+
+    commits = {c["hexsha"]: c for c in iter_commits_with_patches(repo)}
+
+    renamed = commits[renamed_sha]
+    assert renamed["changed_files"] == [{"file_path": "new name.py", "status": "renamed"}]
+    assert "rename from old name.py" in renamed["diff_text"]
+
+    binary = commits[binary_sha]
+    assert binary["changed_files"] == [{"file_path": "logo.png", "status": "added"}]
+    assert "Binary files" in binary["diff_text"]
+    assert binary["stats"]["logo.png"] == {"insertions": 0, "deletions": 0, "lines": 0}
+
+    # Header-lookalike lines in a message stay in the message
+    empty = commits[empty_sha]
+    assert empty["changed_files"] == [] and empty["stats"] == {} and empty["diff_text"] is None
+    assert empty["message"].endswith(":100644 100644 0 0 M\tfake")
+
+
+def test_merge_commits_are_diffed_against_their_first_parent(repo):
+    write(repo, "base.txt", "base\n")
+    commit_all(repo, "Base")
+    repo.git.checkout("-q", "-b", "feature")
+    write(repo, "feature.txt", "feature\n")
+    feature_sha = commit_all(repo, "Feature work")
+    repo.git.checkout("-q", "main")
+    write(repo, "main.txt", "main\n")
+    main_sha = commit_all(repo, "Main work")
+    repo.git.merge("-q", "--no-ff", "-m", "Merge feature", "feature")
+    merge_sha = repo.head.commit.hexsha
+
+    commits = {c["hexsha"]: c for c in iter_commits_with_patches(repo)}
+    merge = commits[merge_sha]
+    assert merge["parents"] == [main_sha, feature_sha]
+    # What the merge brought into main, like GitHub shows it
+    assert merge["changed_files"] == [{"file_path": "feature.txt", "status": "added"}]
+    assert "+feature\n" in merge["diff_text"] and "main.txt" not in merge["diff_text"]
+
+
+def test_only_reads_exactly_the_requested_commits(repo):
+    shas = []
+    for n in range(4):
+        write(repo, "counter.txt", f"{n}\n")
+        shas.append(commit_all(repo, f"Commit {n}"))
+
+    picked = [shas[2], shas[0]]
+    commits = list(iter_commits_with_patches(repo, only=picked))
+    assert sorted(c["hexsha"] for c in commits) == sorted(picked)
+    assert all(c["diff_text"] for c in commits)
+    assert list(iter_commits_with_patches(repo, only=[])) == []
@@ -1,5 +1,6 @@
 import os
-from indexer import RepoIndexer
+# indexer.py uses package-relative imports; run from api/ with `python -m app.ingest.test_search`
+from app.ingest.indexer import RepoIndexer
 
 # Sample feature change information
 feature_summary = "after form submission, user can now see a thank you message appear right after"
@@ -0,0 +1,49 @@
+from itertools import accumulate
+from typing import List, Tuple
+
+# NOTE: tiktoken is optional; without it token counts are estimated from character counts.
+try:
+    import tiktoken
+    enc = tiktoken.encoding_for_model("text-embedding-ada-002")
+    def count_tokens(text):
+        return len(enc.encode(text))
+except ImportError:
+    enc = None
+    def count_tokens(text):
+        # Fallback: estimate 1 token per 4 chars
+        return max(1, len(text) // 4)
+
+
+class LineTokens:
+    """
+    A block of lines, each tokenized exactly once, with prefix sums over per-line counts.
+
+    count(i, j) gives the tokens of '\\n'.join(lines[i:j]) in O(1). Each line is counted
+    together with its newline, and BPE merges across line boundaries are ignored. The
+    result is a slight overestimate, which is the safe direction for size limits.
+    """
+
+    def __init__(self, lines: List[str]):
+        self.lines = lines
+        self._prefix = [0, *accumulate(count_tokens(line) + 1 for line in lines)]
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def count(self, start: int, end: int) -> int:
+        if end <= start:
+            return 0
+        # The last line of a span has no trailing newline
+        return self._prefix[end] - self._prefix[start] - 1
+
+
+def split_text_by_tokens(text: str, max_tokens: int) -> List[Tuple[str, int]]:
+    """Cut a single oversized piece of text into consecutive (piece, tokens) parts of at most max_tokens tokens."""
+    if enc is not None:
+        token_ids = enc.encode(text)
+        return [
+            (enc.decode(token_ids[i:i + max_tokens]), len(token_ids[i:i + max_tokens]))
+            for i in range(0, len(token_ids), max_tokens)
+        ]
+    step = max_tokens * 4  # Exact for the chars/4 estimate above
+    return [(text[i:i + step], count_tokens(text[i:i + step])) for i in range(0, len(text), step)]
@@ -0,0 +1,420 @@
+import os
+import json
+import shutil
+import threading
+import time
+import numpy as np
+from typing import List, Dict, Any, Optional
+
+from supabase import Client
+
+from .ann_index import IVFPQIndex, default_n_lists
+from ..core.config import (
+    VECTOR_INDEX_DIR, VECTOR_INDEX_DTYPE, VECTOR_INDEX_REFRESH_SECONDS,
+    ANN_N_LISTS, ANN_PQ_SUBVECTORS, ANN_NPROBE, ANN_RERANK,
+)
+
+FETCH_PAGE_SIZE = 1000  # PostgREST caps a single select at 1000 rows by default
+SCORE_BLOCK_ROWS = 65536  # float16 matrices are upcast block by block instead of all at once
+INDEX_FORMAT_VERSION = 3  # Bump when the on-disk layout changes; older generations are rebuilt
+ALL_PROJECTS_KEY = "_all"
+
+# Compact, fixed-width per-row metadata. String columns are indexes into strings.json and the
+# chunk text lives in content.bin, so the whole array can be memory-mapped.
+META_DTYPE = np.dtype([
+    ("id", "<i8"),
+    ("project_id", "<i4"),
+    ("file_path", "<i4"),
+    ("symbol_type", "<i4"),
+    ("symbol_name", "<i4"),
+    ("parent_symbol", "<i4"),
+    ("start_line", "<i4"),
+    ("end_line", "<i4"),
+    ("content_offset", "<i8"),
+    ("content_length", "<i4"),
+])
+NO_STRING = -1
+
+
+class LocalVectorIndex:
+    """
+    In-process vector index for one project, built from the `code_embeddings` rows.
+
+    On disk (under VECTOR_INDEX_DIR/<project_id>/) each generation of the index is a
+    directory holding:
+      - vectors.npy  contiguous (N, D) float32/float16 matrix of L2-normalised embeddings
+      - meta.npy     (N,) META_DTYPE array
+      - strings.json interned file paths / symbol types / symbol names
+      - content.bin  UTF-8 chunk text, addressed by content_offset/content_length
+    manifest.json points at the current generation and is swapped atomically, so readers
+    never see a half-written index. Arrays are opened with np.load(mmap_mode='r').
+
+    A query is one matrix-vector product plus argpartition top-k; no network round-trip.
+    refresh() only downloads rows with ids above the last indexed id and prunes rows that
+    were deleted server-side (e.g. by incremental re-indexing).
+
+    With project_id=None the index spans every project. search(use_ann=True) then goes
+    through an IVF/PQ index of the generation's vectors (stored in its ann/ directory)
+    instead of scanning the whole matrix. With build_ann (the default for the cross-project
+    index) that index is trained in a background thread as soon as a generation is written
+    or loaded, so no query pays for k-means and PQ encoding; until ann/ann.json exists,
+    searches use the exact scan.
+    """
+
+    def __init__(self, supabase: Client, project_id: Optional[str], table_name: str, index_dir: Optional[str] = None, dtype: Optional[str] = None,
+                 build_ann: Optional[bool] = None):
+        self.supabase = supabase
+        self.project_id = str(project_id) if project_id is not None else None
+        self.table_name = table_name
+        self.dir = os.path.join(index_dir or VECTOR_INDEX_DIR, self.project_id or ALL_PROJECTS_KEY)
+        self.dtype = np.dtype(dtype or VECTOR_INDEX_DTYPE)
+        self._lock = threading.Lock()
+        self._loaded_generation = None
+        self._last_refresh = 0.0
+        self.vectors: Optional[np.ndarray] = None
+        self.meta: Optional[np.ndarray] = None
+        self.strings: List[str] = []
+        self.content: Optional[np.ndarray] = None
+        self._ann: Optional[IVFPQIndex] = None
+        self.build_ann = self.project_id is None if build_ann is None else build_ann
+        self._ann_thread: Optional[threading.Thread] = None
+
+    # -- Persistence -------------------------------------------------------------------
+
+    @property
+    def _manifest_path(self) -> str:
+        return os.path.join(self.dir, "manifest.json")
+
+    def exists(self) -> bool:
+        return os.path.exists(self._manifest_path)
+
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._manifest_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def load(self) -> bool:
+        """Memory-map the current generation. Returns False if no index has been built yet."""
+        manifest = self._read_manifest()
+        if manifest is None or manifest.get("format") != INDEX_FORMAT_VERSION:
+            return False
+        if manifest["generation"] == self._loaded_generation:
+            return True
+        gen_dir = os.path.join(self.dir, manifest["generation"])
+        self.vectors = np.load(os.path.join(gen_dir, "vectors.npy"), mmap_mode="r")
+        self.meta = np.load(os.path.join(gen_dir, "meta.npy"), mmap_mode="r")
+        with open(os.path.join(gen_dir, "strings.json"), "r") as f:
+            self.strings = json.load(f)
+        content_path = os.path.join(gen_dir, "content.bin")
+        self.content = np.memmap(content_path, dtype=np.uint8, mode="r") if os.path.getsize(content_path) else np.zeros(0, dtype=np.uint8)
+        self._loaded_generation = manifest["generation"]
+        self._last_refresh = manifest.get("refreshed_at", 0.0)
+        self._ann = None
+        if self.build_ann:
+            self._start_ann_build()
+        return True
+
+    def _write_generation(self, vectors: np.ndarray, rows: List[Dict[str, Any]]) -> None:
+        """Write a complete new generation and atomically point the manifest at it."""
+        generation = f"gen-{time.time_ns()}"
+        gen_dir = os.path.join(self.dir, generation)
+        os.makedirs(gen_dir, exist_ok=True)
+
+        string_ids: Dict[str, int] = {}
+        strings: List[str] = []
+
+        def intern(value: Optional[str]) -> int:
+            if value is None:
+                return NO_STRING
+            if value not in string_ids:
+                string_ids[value] = len(strings)
+                strings.append(value)
+            return string_ids[value]
+
+        meta = np.zeros(len(rows), dtype=META_DTYPE)
+        offset = 0
+        with open(os.path.join(gen_dir, "content.bin"), "wb") as content_file:
+            for i, row in enumerate(rows):
+                encoded = (row.get("content") or "").encode("utf-8")
+                content_file.write(encoded)
+                meta[i] = (
+                    row["id"],
+                    intern(row.get("project_id")),
+                    intern(row.get("file_path")),
+                    intern(row.get("symbol_type")),
+                    intern(row.get("symbol_name")),
+                    intern(row.get("parent_symbol")),
+                    row.get("start_line") or 0,
+                    row.get("end_line") or 0,
+                    offset,
+                    len(encoded),
+                )
+                offset += len(encoded)
+
+        np.save(os.path.join(gen_dir, "vectors.npy"), np.ascontiguousarray(vectors, dtype=self.dtype))
+        np.save(os.path.join(gen_dir, "meta.npy"), meta)
+        with open(os.path.join(gen_dir, "strings.json"), "w") as f:
+            json.dump(strings, f)
+
+        previous = self._read_manifest()
+        manifest = {
+            "format": INDEX_FORMAT_VERSION,
+            "generation": generation,
+            "project_id": self.project_id,
+            "count": len(rows),
+            "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+            "dtype": self.dtype.name,
+            "max_id": int(meta["id"].max()) if len(rows) else 0,
+            "refreshed_at": time.time(),
+        }
+        tmp_manifest = self._manifest_path + ".tmp"
+        with open(tmp_manifest, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_manifest, self._manifest_path)
+
+        # Open memory maps of the old generation stay valid after unlink (POSIX semantics)
+        if previous and previous["generation"] != generation:
+            shutil.rmtree(os.path.join(self.dir, previous["generation"]), ignore_errors=True)
+        self._loaded_generation = None
+        self.load()
+
+    # -- Building from Supabase ------------------------------------------------------
+
+    def _scoped(self, query):
+        """Restrict a query to the indexed rows: the project's (if any) that have an embedding."""
+        query = query.not_.is_("embedding", "null")
+        return query.eq("project_id", self.project_id) if self.project_id is not None else query
+
+    def _fetch_rows_after(self, after_id: int) -> List[Dict[str, Any]]:
+        """Keyset-paginate every row of the project with id > after_id, embeddings included."""
+        rows: List[Dict[str, Any]] = []
+        last_id = after_id
+        while True:
+            resp = (
+                self._scoped(
+                    self.supabase.table(self.table_name)
+                    .select("id,project_id,content,file_path,symbol_type,symbol_name,parent_symbol,start_line,end_line,embedding")
+                )
+                .gt("id", last_id)
+                .order("id")
+                .limit(FETCH_PAGE_SIZE)
+                .execute()
+            )
+            page = getattr(resp, "data", None) or []
+            rows.extend(page)
+            if len(page) < FETCH_PAGE_SIZE:
+                return rows
+            last_id = page[-1]["id"]
+
+    def _fetch_all_ids(self) -> np.ndarray:
+        ids: List[int] = []
+        last_id = 0
+        while True:
+            resp = (
+                self._scoped(self.supabase.table(self.table_name).select("id"))
+                .gt("id", last_id)
+                .order("id")
+                .limit(FETCH_PAGE_SIZE)
+                .execute()
+            )
+            page = getattr(resp, "data", None) or []
+            ids.extend(row["id"] for row in page)
+            if len(page) < FETCH_PAGE_SIZE:
+                return np.asarray(ids, dtype=np.int64)
+            last_id = page[-1]["id"]
+
+    def _count_server_rows(self) -> int:
+        resp = self._scoped(self.supabase.table(self.table_name).select("id", count="exact")).limit(1).execute()
+        return resp.count or 0
+
+    @staticmethod
+    def _normalised_matrix(rows: List[Dict[str, Any]]) -> np.ndarray:
+        # pgvector values come back from PostgREST as "[...]" text; parse them once here
+        parsed = [json.loads(r["embedding"]) if isinstance(r["embedding"], str) else r["embedding"] for r in rows]
+        matrix = np.asarray(parsed, dtype=np.float32)
+        if matrix.ndim != 2:
+            return matrix.reshape(0, 0)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def _existing_rows(self, keep: np.ndarray) -> List[Dict[str, Any]]:
+        """Rebuild row dicts for the kept positions of the loaded generation (no network)."""
+        rows = []
+        for m in self.meta[keep]:
+            rows.append({
+                "id": int(m["id"]),
+                "project_id": self._string(m["project_id"]),
+                "file_path": self._string(m["file_path"]),
+                "symbol_type": self._string(m["symbol_type"]),
+                "symbol_name": self._string(m["symbol_name"]),
+                "parent_symbol": self._string(m["parent_symbol"]),
+                "start_line": int(m["start_line"]),
+                "end_line": int(m["end_line"]),
+                "content": self._content(m),
+            })
+        return rows
+
+    def build(self) -> None:
+        """Download every embedding row for the project and write a fresh index."""
+        with self._lock:
+            started = time.perf_counter()
+            rows = self._fetch_rows_after(0)
+            self._write_generation(self._normalised_matrix(rows), rows)
+            print(f"LocalVectorIndex: built index for project {self.project_id or 'ALL'} with {len(rows)} rows in {time.perf_counter() - started:.2f}s")
+
+    def refresh(self) -> None:
+        """Bring the index up to date: append new rows, drop rows deleted server-side."""
+        if not self.load():
+            self.build()
+            return
+        with self._lock:
+            manifest = self._read_manifest()
+            new_rows = self._fetch_rows_after(manifest["max_id"])
+            server_count = self._count_server_rows()
+
+            keep = np.arange(len(self.meta))
+            if server_count != len(self.meta) + len(new_rows):
+                live_ids = self._fetch_all_ids()
+                keep = np.nonzero(np.isin(self.meta["id"], live_ids))[0]
+
+            if not new_rows and len(keep) == len(self.meta):
+                self._last_refresh = time.time()
+                return
+
+            removed = len(self.meta) - len(keep)
+            rows = self._existing_rows(keep) + new_rows
+            parts = []
+            if len(keep):
+                parts.append(np.asarray(self.vectors[keep], dtype=np.float32))
+            if new_rows:
+                parts.append(self._normalised_matrix(new_rows))
+            vectors = np.vstack(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+            self._write_generation(vectors, rows)
+            print(f"LocalVectorIndex: refreshed project {self.project_id or 'ALL'}: +{len(new_rows)} rows, -{removed} removed, {len(rows)} total")
+
+    def ensure_fresh(self, max_age_seconds: Optional[int] = None) -> None:
+        max_age = VECTOR_INDEX_REFRESH_SECONDS if max_age_seconds is None else max_age_seconds
+        if not self.load():
+            self.build()
+        elif time.time() - self._last_refresh > max_age:
+            self.refresh()
+
+    # -- Querying ----------------------------------------------------------------------
+
+    def _string(self, idx: int) -> Optional[str]:
+        return None if idx == NO_STRING else self.strings[idx]
+
+    def _content(self, m) -> str:
+        start = int(m["content_offset"])
+        return bytes(self.content[start:start + int(m["content_length"])]).decode("utf-8", errors="replace")
+
+    def _scores(self, query_vec: np.ndarray) -> np.ndarray:
+        if self.vectors.dtype == np.float32:
+            return self.vectors.dot(query_vec)
+        scores = np.empty(len(self.vectors), dtype=np.float32)
+        for start in range(0, len(self.vectors), SCORE_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block.dot(query_vec)
+        return scores
+
+    def _ann_dir(self, generation: str) -> str:
+        return os.path.join(self.dir, generation, "ann")
+
+    def _start_ann_build(self) -> None:
+        """Train the loaded generation's IVF/PQ index in a background thread, unless it exists or is being built."""
+        generation, vectors = self._loaded_generation, self.vectors
+        if vectors is None or vectors.ndim != 2 or len(vectors) == 0:
+            return
+        if os.path.exists(os.path.join(self._ann_dir(generation), "ann.json")):
+            return
+        if self._ann_thread is not None and self._ann_thread.is_alive():
+            # One build at a time; the next load()/refresh() picks up the newest generation
+            return
+        self._ann_thread = threading.Thread(
+            target=self._build_ann, args=(generation, vectors), name=f"ann-build-{generation}", daemon=True
+        )
+        self._ann_thread.start()
+
+    def _build_ann(self, generation: str, vectors: np.ndarray) -> None:
+        started = time.perf_counter()
+        ann_dir = self._ann_dir(generation)
+        tmp_dir = f"{ann_dir}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            dim = vectors.shape[1]
+            pq_subvectors = ANN_PQ_SUBVECTORS if ANN_PQ_SUBVECTORS and dim % ANN_PQ_SUBVECTORS == 0 else 0
+            ann = IVFPQIndex(
+                n_lists=ANN_N_LISTS or default_n_lists(len(vectors)),
+                pq_subvectors=pq_subvectors,
+                nprobe=ANN_NPROBE,
+            )
+            ann.add(vectors)  # ids are row positions in this generation
+            # Written aside and renamed, so ann/ only ever holds a complete index
+            ann.save(tmp_dir)
+            try:
+                os.rename(tmp_dir, ann_dir)
+            except OSError:
+                shutil.rmtree(tmp_dir, ignore_errors=True) # Another process got there first
+            manifest = self._read_manifest()
+            if manifest is None or manifest["generation"] != generation:
+                # Superseded while training; its directory may already be gone
+                shutil.rmtree(os.path.join(self.dir, generation), ignore_errors=True)
+                return
+            print(f"LocalVectorIndex: built ANN index for project {self.project_id or 'ALL'} ({len(vectors)} rows) in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            print(f"LocalVectorIndex: ANN build for project {self.project_id or 'ALL'} failed, searches keep using the exact scan: {e}")
+
+    def _get_ann(self) -> Optional[IVFPQIndex]:
+        """IVF/PQ index of the loaded generation, or None while it is not built yet."""
+        if self._ann is None:
+            ann_dir = self._ann_dir(self._loaded_generation)
+            if os.path.exists(os.path.join(ann_dir, "ann.json")):
+                self._ann = IVFPQIndex.load(ann_dir)
+            else:
+                self._start_ann_build()
+        return self._ann
+
+    def _result_row(self, i: int, similarity: float) -> Dict[str, Any]:
+        m = self.meta[i]
+        return {
+            "id": int(m["id"]),
+            "project_id": self._string(m["project_id"]),
+            "content": self._content(m),
+            "file_path": self._string(m["file_path"]),
+            "symbol_type": self._string(m["symbol_type"]),
+            "symbol_name": self._string(m["symbol_name"]),
+            "parent_symbol": self._string(m["parent_symbol"]),
+            "start_line": int(m["start_line"]),
+            "end_line": int(m["end_line"]),
+            "similarity": similarity,
+        }
+
+    def search(self, query_vec: np.ndarray, limit: int = 10, similarity_threshold: float = 0.5,
+               use_ann: bool = False, nprobe: Optional[int] = None) -> List[Dict[str, Any]]:
+        if not self.load() or len(self.meta) == 0:
+            return []
+        query = np.asarray(query_vec, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query = query / norm
+
+        ann = self._get_ann() if use_ann else None
+        if ann is not None:
+            top_idx, top_scores = ann.search(query, k=limit, nprobe=nprobe, vectors=self.vectors, rerank=ANN_RERANK)
+        else:
+            scores = self._scores(query)
+            k = min(limit, len(scores))
+            top_idx = np.argpartition(-scores, k - 1)[:k]
+            top_idx = top_idx[np.argsort(-scores[top_idx])]
+            top_scores = scores[top_idx]
+
+        results = []
+        for i, similarity in zip(top_idx, top_scores):
+            if similarity < similarity_threshold:
+                break
+            results.append(self._result_row(int(i), float(similarity)))
+        return results
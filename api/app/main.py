@@ -8,7 +8,8 @@ from pydantic import BaseModel, Field
 from typing import List, Optional
 
 # TODO: Import routers
-from .routes import auth, webhook, projects, twitter_routes #, generate, events # Uncommented webhook
+from .routes import auth, webhook, projects, twitter_routes, jobs #, generate, events # Uncommented webhook
+from .services.github_client import start_github_client, close_github_client
 # TODO: Import Phoenix for Arize logging if global setup is needed
 # import phoenix as px
 
@@ -44,6 +45,7 @@ app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(webhook.router, prefix="/webhook", tags=["webhook"]) # Uncommented this line
 app.include_router(projects.router, prefix="/projects", tags=["projects"])
 app.include_router(twitter_routes.router, tags=["Twitter"])
+app.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
 # TODO: app.include_router(generate.router, prefix="/generate", tags=["generate"])
 # TODO: app.include_router(events.router, prefix="/events", tags=["events"])
 
@@ -85,6 +87,7 @@ async def startup_event():
     # else:
     #     # app.state.supabase = create_client(supabase_url, supabase_key)
     #     print("Supabase client initialized (placeholder).")
+    await start_github_client()
     print("FastAPI application startup complete.")
 
 @app.on_event("shutdown")
@@ -93,6 +96,7 @@ async def shutdown_event():
     # if hasattr(app.state, 'supabase') and app.state.supabase:
     #     # await app.state.supabase.auth.sign_out() # Example cleanup
     #     print("Supabase client shutdown (placeholder).")
+    await close_github_client()
     print("FastAPI application shutdown.")
 
 @app.get("/health", tags=["Health"])
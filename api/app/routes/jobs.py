@@ -0,0 +1,23 @@
+from fastapi import APIRouter, HTTPException
+
+from ..services.job_queue import queue_stats
+
+router = APIRouter()
+
+
+@router.get("/stats")
+async def job_queue_stats():
+    """
+    Depth and lag of the durable job queue, per job kind: queued (incl. waiting for a retry),
+    due, running, failed, done in the last hour, and how long the oldest due job has waited.
+    """
+    try:
+        kinds = await queue_stats()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Could not read job queue stats: {e}")
+    return {
+        "kinds": kinds,
+        "queued": sum(k.get("queued") or 0 for k in kinds),
+        "running": sum(k.get("running") or 0 for k in kinds),
+        "max_lag_seconds": max((k.get("oldest_due_lag_seconds") or 0 for k in kinds), default=0),
+    }
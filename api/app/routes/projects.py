@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Query
+from fastapi.responses import PlainTextResponse
 import asyncio # For mocking delay
 import uuid # For generating mock IDs
 import os # Added os for env vars
@@ -8,6 +9,8 @@ from typing import List # Added List
 from app.schemas.project import ProjectCreate, ProjectRead, CommitRead, CommitListResponse # Added CommitListResponse
 from app.ingest.indexer import RepoIndexer # Added RepoIndexer
 from app.ingest.commit_historian import CommitHistorian # Import new class
+from app.services.supabase_service import get_commit_diffs
+from app.ingest.diff_splitter import search_commit_history
 from supabase import create_client, Client # Keep this for create_client and Client
 from postgrest.exceptions import APIError # Correct import for APIError
 
@@ -86,8 +89,9 @@ async def create_project(
     try:
         print(f"Attempting to create project entry for: {project_data.html_url}")
         # This will create the project in the 'projects' table and return its ID
-        # or find the existing one and clear its embeddings.
-        project_id = indexer._create_project_entry(repo_url=project_data.html_url)
+        # or find the existing one. Existing embeddings are kept: the background
+        # index run below is incremental and only re-embeds changed files.
+        project_id = indexer._create_project_entry(repo_url=project_data.html_url, clear_existing_embeddings=False)
         print(f"Project entry created/retrieved with ID: {project_id}")
     except Exception as e:
         import traceback
@@ -102,7 +106,7 @@ async def create_project(
     # `indexer.index_repo` sets `self.current_project_id` from `_create_project_entry`.
     # So, calling `indexer.index_repo` directly in the background should be fine.
     
-    background_tasks.add_task(indexer.index_repo, repo_url=project_data.html_url)
+    background_tasks.add_task(indexer.index_repo, repo_url=project_data.html_url, incremental=True)
     # Use CommitHistorian for ingesting commit history
     background_tasks.add_task(commit_historian.ingest_commit_history, project_id=project_id, repo_url=project_data.html_url)
 
@@ -242,7 +246,7 @@ async def get_project_commits(
         # Fetch commits with pagination
         commits_response = await asyncio.to_thread(
             supabase_client.table("commits")
-            .select("id, commit_sha, message, author_name, commit_timestamp") # Select specific columns
+            .select("id, commit_sha, message, author_name, commit_timestamp, diff_size_bytes") # Select specific columns, never the diff
             .eq("project_id", str(project_id))
             .order("commit_timestamp", desc=True)
             .range(skip, skip + limit - 1) # Supabase uses range for pagination: range(from, to) inclusive
@@ -272,6 +276,47 @@ async def get_project_commits(
         # traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"An error occurred while fetching commit data: {str(e)}")
 
+@router.get("/{project_id}/commits/search")
+async def search_project_commits(
+    project_id: uuid.UUID,
+    q: str = Query(..., min_length=2, description="Natural-language description of the change, e.g. 'login flow'"),
+    limit: int = Query(10, ge=1, le=50),
+    threshold: float = Query(0.3, ge=0.0, le=1.0),
+):
+    """
+    Commits of the project ranked by how well their diffs match `q`. Each result carries the
+    best matching file and new-side line range, the number of matching chunks and the files
+    they are in.
+    """
+    try:
+        results = await search_commit_history(q, str(project_id), limit=limit, similarity_threshold=threshold)
+    except Exception as e:
+        print(f"An error occurred while searching commits of project {project_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"An error occurred while searching commits: {str(e)}")
+    return {"query": q, "results": results}
+
+@router.get("/{project_id}/commits/{commit_sha}/diff", response_class=PlainTextResponse)
+async def get_project_commit_diff(project_id: uuid.UUID, commit_sha: str):
+    """
+    The unified diff of one commit, as plain text. Diffs are stored compressed outside the
+    commits table and only loaded here, when someone actually looks at one.
+    """
+    if not supabase_client:
+        raise HTTPException(status_code=503, detail="Database service is not configured or available.")
+    try:
+        commit = await asyncio.to_thread(lambda: supabase_client.table("commits").select("id").eq("project_id", str(project_id)).eq("commit_sha", commit_sha).limit(1).execute())
+        if not commit.data:
+            raise HTTPException(status_code=404, detail=f"Commit {commit_sha} not found for project {project_id}.")
+        diff_text = (await get_commit_diffs([commit.data[0]["id"]])).get(commit.data[0]["id"])
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"An error occurred while fetching the diff of commit {commit_sha} for project {project_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"An error occurred while fetching the diff: {str(e)}")
+    if diff_text is None:
+        raise HTTPException(status_code=404, detail=f"No diff stored for commit {commit_sha}.")
+    return PlainTextResponse(diff_text, media_type="text/x-diff")
+
 # And a route to get a specific project
 # @router.get("/{project_id}", response_model=ProjectRead)
 # async def get_project(
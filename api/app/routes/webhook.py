@@ -6,9 +6,11 @@ import hashlib
 import os
 
 # TODO: Import ingest functions
-from ..ingest.diff_processor import process_github_commit_data
+from ..ingest.diff_processor import process_github_push
 # TODO: Import Supabase client/service
 from ..services.supabase_service import store_raw_event_data
+from ..services.job_queue import new_job, enqueue_jobs, GITHUB_RAW_EVENT_JOB, GITHUB_PUSH_JOB
+from ..core.config import JOB_QUEUE_ENABLED
 
 router = APIRouter()
 
@@ -109,6 +111,8 @@ async def github_webhook(
         
         print(f"Processing push event for repo: {repo_name} by {pusher_name}. Commits: {num_commits}")
 
+        repository_payload = push_event.repository.model_dump(mode='json') # Ensure JSON serializable
+        pusher_payload = push_event.pusher.model_dump(mode='json')
         for commit in push_event.commits:
             print(f"  Commit ID: {commit.id}")
             print(f"  Message: {commit.message}")
@@ -116,35 +120,43 @@ async def github_webhook(
             print(f"  Author: {commit.author.name}")
             print(f"  Modified files: {commit.modified}")
 
-            # The logic for feature completion detection (previously is_feature_complete)
-            # and subsequent call to send_feature_completion_email should now be handled
-            # within the 'process_github_commit_data' function.
-            # 'process_github_commit_data' would use an LLM to determine if a feature
-            # is complete based on commit.message and other relevant data.
-            # If complete, it would then call:
-            #
-            # await send_feature_completion_email(
-            #     project_name=push_event.repository.full_name,
-            #     feature_name="GitHub Repository Import and Codebase Indexing Feature",
-            #     recipient_email=DESIGNATED_EMAIL_ADDRESS
-            # )
-            #
-            # This keeps the webhook handler cleaner and centralizes the complex processing.
-
-            # TODO: M1.4 - Store commit data in Supabase
+        # Feature completion detection (and the completion email) happens inside
+        # 'process_github_push', which keeps this handler small. The whole push is one unit
+        # of work: project and users are resolved once and all commits stored in one write.
+        push_payload = {
+            "commit_payloads": [commit.model_dump(mode='json') for commit in push_event.commits], # Ensure JSON serializable
+            "repository_payload": repository_payload,
+            "pusher_payload": pusher_payload,
+            "compare_url": str(push_event.compare),
+        }
+
+        if JOB_QUEUE_ENABLED:
+            # Durable path: the work is persisted and run by `python -m app.workers.job_worker`
+            # processes, with retries and per-repository ordering.
+            try:
+                jobs = [new_job(
+                    GITHUB_RAW_EVENT_JOB,
+                    {"event_type": x_github_event, "delivery_id": x_github_delivery, "repo_full_name": repo_name,
+                     "entity_ids": [commit.id for commit in push_event.commits], "payload": raw_payload},
+                    queue_key=f"raw:{repo_name}",
+                    dedupe_key=f"{x_github_delivery}:raw" if x_github_delivery else None,
+                )]
+                if push_event.commits:
+                    jobs.append(new_job(GITHUB_PUSH_JOB, push_payload, queue_key=repo_name,
+                                        dedupe_key=f"{x_github_delivery}:push" if x_github_delivery else None))
+                queued = await enqueue_jobs(jobs)
+                print(f"Queued {queued} job(s) for push event on {repo_name}")
+                return {"message": f"Push event for {repo_name} received; {num_commits} commit(s) queued for processing"}
+            except Exception as e:
+                print(f"Could not enqueue jobs for {repo_name}, processing in-process instead: {e}")
+
+        # Fallback: in-process background tasks (lost on restart, no retries)
+        for commit in push_event.commits:
             # For now, let's store the raw event for later processing or audit
-            background_tasks.add_task(store_raw_event_data, x_github_event, x_github_delivery, push_event.repository.full_name, commit.id, raw_payload) # Example call
-            
-            # TODO: M1.3 - Trigger diff processing for this commit
-            # This function would handle fetching diff, LLM calls, and structured data storage
-            background_tasks.add_task(
-                process_github_commit_data,
-                commit_payload=commit.model_dump(mode='json'), # Ensure JSON serializable
-                repository_payload=push_event.repository.model_dump(mode='json'), # Ensure JSON serializable
-                compare_url=str(push_event.compare),
-                pusher_payload=push_event.pusher.model_dump(mode='json') # Ensure JSON serializable
-            )
-            
+            background_tasks.add_task(store_raw_event_data, x_github_event, x_github_delivery, repo_name, commit.id, raw_payload)
+        if push_event.commits:
+            background_tasks.add_task(process_github_push, **push_payload)
+
         print(f"Finished initial processing of push event for {repo_name}")
         return {"message": f"Push event for {repo_name} received and processing started for {num_commits} commit(s)"}
     
@@ -33,6 +33,7 @@ class CommitRead(BaseModel):
     author_name: Optional[str] = None
     # author_avatar_url: Optional[str] = None # Need a way to get this, maybe later
     commit_timestamp: datetime # Will be formatted as string by FastAPI automatically
+    diff_size_bytes: Optional[int] = None # The diff itself is loaded separately (GET .../commits/{sha}/diff)
     # For frontend mapping:
     # 'author' on frontend could be author_name
     # 'date' on frontend is commit_timestamp
@@ -0,0 +1,141 @@
+"""
+Application-scoped HTTP client for fetching from GitHub (commit .diff files and similar).
+
+One pooled httpx.AsyncClient is shared by every request instead of a new client (and TCP +
+TLS handshake) per diff. Connections are kept alive, HTTP/2 is used through the `h2` package
+(declared as httpx[http2]; plain HTTP/1.1 if it is missing), every request has timeouts, concurrent
+requests per host are capped, and responses carrying an ETag / Last-Modified are kept in a
+small LRU so repeated fetches become conditional requests answered with 304.
+
+main.py and the job worker start the client when their event loop starts and close it on
+shutdown. Callers use it through github_client(), which falls back to a temporary client,
+closed on exit, on any other event loop (scripts using asyncio.run, threads).
+"""
+import asyncio
+import os
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx; installed with httpx[http2])
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+GITHUB_HTTP_MAX_CONNECTIONS = int(os.getenv("GITHUB_HTTP_MAX_CONNECTIONS", "20"))
+GITHUB_HTTP_MAX_PER_HOST = int(os.getenv("GITHUB_HTTP_MAX_PER_HOST", "8"))
+GITHUB_HTTP_TIMEOUT_SECONDS = float(os.getenv("GITHUB_HTTP_TIMEOUT_SECONDS", "30"))
+GITHUB_HTTP_CACHE_MAX_BYTES = int(os.getenv("GITHUB_HTTP_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+class GitHubFetchClient:
+    def __init__(self, max_connections: int = GITHUB_HTTP_MAX_CONNECTIONS, max_per_host: int = GITHUB_HTTP_MAX_PER_HOST,
+                 timeout: float = GITHUB_HTTP_TIMEOUT_SECONDS, cache_max_bytes: int = GITHUB_HTTP_CACHE_MAX_BYTES):
+        self.client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections, keepalive_expiry=60),
+            timeout=httpx.Timeout(timeout, connect=10.0),
+            headers={"User-Agent": "buildie"},
+            follow_redirects=True,
+        )
+        self.max_per_host = max_per_host
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        # url -> (validators, body); LRU bounded by total body size
+        self._cache: OrderedDict[str, Tuple[Dict[str, str], str]] = OrderedDict()
+        self._cache_bytes = 0
+        self.cache_max_bytes = cache_max_bytes
+        self.requests = 0
+        self.not_modified = 0
+
+    def _slots(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc
+        if host not in self._host_slots:
+            self._host_slots[host] = asyncio.Semaphore(self.max_per_host)
+        return self._host_slots[host]
+
+    def _remember(self, url: str, response: httpx.Response) -> None:
+        validators = {}
+        if response.headers.get("etag"):
+            validators["If-None-Match"] = response.headers["etag"]
+        if response.headers.get("last-modified"):
+            validators["If-Modified-Since"] = response.headers["last-modified"]
+        if not validators:
+            return
+        body = response.text
+        if url in self._cache:
+            self._cache_bytes -= len(self._cache.pop(url)[1])
+        if len(body) > self.cache_max_bytes:
+            return
+        self._cache[url] = (validators, body)
+        self._cache_bytes += len(body)
+        while self._cache_bytes > self.cache_max_bytes:
+            _, (_, evicted) = self._cache.popitem(last=False)
+            self._cache_bytes -= len(evicted)
+
+    async def get_text(self, url: str) -> str:
+        """GET `url` and return its body, revalidating a cached copy when we have one. Raises httpx errors."""
+        cached = self._cache.get(url)
+        async with self._slots(url):
+            response = await self.client.get(url, headers=cached[0] if cached else None)
+        self.requests += 1
+        if response.status_code == 304 and cached:
+            self.not_modified += 1
+            self._cache.move_to_end(url)
+            return cached[1]
+        response.raise_for_status()
+        self._remember(url, response)
+        return response.text
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "requests": self.requests,
+            "not_modified": self.not_modified,
+            "cached_urls": len(self._cache),
+            "cached_bytes": self._cache_bytes,
+        }
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+_github_client: Optional[GitHubFetchClient] = None
+_github_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+async def start_github_client() -> GitHubFetchClient:
+    global _github_client, _github_client_loop
+    if _github_client is None:
+        _github_client = GitHubFetchClient()
+        _github_client_loop = asyncio.get_running_loop()
+        print(f"GitHub fetch client started (HTTP/2: {HTTP2_AVAILABLE}, max {GITHUB_HTTP_MAX_PER_HOST} requests per host).")
+    return _github_client
+
+
+async def close_github_client() -> None:
+    global _github_client, _github_client_loop
+    if _github_client is not None:
+        print(f"GitHub fetch client closed. {_github_client.stats()}")
+        await _github_client.aclose()
+    _github_client = None
+    _github_client_loop = None
+
+
+@asynccontextmanager
+async def github_client() -> AsyncIterator[GitHubFetchClient]:
+    """
+    The shared client when it was started on the running event loop. httpx clients are bound to
+    their loop, so any other loop gets a temporary client that is closed on exit; the shared
+    one is never replaced while its own loop may still be using it.
+    """
+    if _github_client is not None and _github_client_loop is asyncio.get_running_loop():
+        yield _github_client
+        return
+    client = GitHubFetchClient()
+    try:
+        yield client
+    finally:
+        await client.aclose()
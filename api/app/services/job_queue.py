@@ -0,0 +1,125 @@
+"""
+Durable job queue on the Supabase `jobs` table (migration 20250605000000_create_job_queue.sql).
+
+The API only enqueues; `python -m app.workers.job_worker` processes claim jobs through the
+`claim_jobs` RPC (FOR UPDATE SKIP LOCKED), run the handler registered for the job's kind
+and mark it done, or re-queue it with exponential backoff until max_attempts is reached.
+Jobs sharing a queue_key (the repository) run one at a time in enqueue order.
+
+The Supabase client is synchronous, so every call runs in a worker thread.
+"""
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .supabase_service import supabase
+from ..core.config import (
+    JOB_MAX_ATTEMPTS, JOB_LOCK_TIMEOUT_SECONDS, JOB_RETRY_BASE_SECONDS, JOB_RETRY_MAX_SECONDS,
+)
+
+JOBS_TABLE = "jobs"
+
+# Job kinds enqueued by the GitHub webhook
+GITHUB_RAW_EVENT_JOB = "github.raw_event"
+GITHUB_PUSH_JOB = "github.push"
+GITHUB_PUSH_COMMIT_JOB = "github.push_commit"  # Single commit; still handled for jobs queued before push-level processing
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Any]]
+_JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+
+def register_job_handler(kind: str, handler: JobHandler) -> None:
+    _JOB_HANDLERS[kind] = handler
+
+
+def get_job_handler(kind: str) -> Optional[JobHandler]:
+    return _JOB_HANDLERS.get(kind)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def new_job(kind: str, payload: Dict[str, Any], queue_key: str, dedupe_key: Optional[str] = None,
+            max_attempts: Optional[int] = None, delay_seconds: float = 0) -> Dict[str, Any]:
+    """Row for enqueue_jobs()."""
+    return {
+        "kind": kind,
+        "payload": payload,
+        "queue_key": queue_key,
+        "dedupe_key": dedupe_key,
+        "max_attempts": max_attempts or JOB_MAX_ATTEMPTS,
+        "run_after": (_now() + timedelta(seconds=delay_seconds)).isoformat(),
+    }
+
+
+async def enqueue_jobs(jobs: List[Dict[str, Any]]) -> int:
+    """Insert jobs (see new_job) in one request. Jobs whose dedupe_key is already queued are skipped."""
+    if not jobs:
+        return 0
+    response = await asyncio.to_thread(
+        lambda: supabase.table(JOBS_TABLE).upsert(jobs, on_conflict="dedupe_key", ignore_duplicates=True).execute()
+    )
+    return len(response.data or [])
+
+
+async def claim_jobs(worker_id: str, limit: int) -> List[Dict[str, Any]]:
+    response = await asyncio.to_thread(
+        lambda: supabase.rpc("claim_jobs", {
+            "p_worker": worker_id, "p_limit": limit, "p_lock_timeout_seconds": JOB_LOCK_TIMEOUT_SECONDS,
+        }).execute()
+    )
+    return response.data or []
+
+
+async def heartbeat_jobs(worker_id: str, job_ids: List[int]) -> None:
+    """Refresh the locks of long-running jobs so they are not reclaimed as abandoned."""
+    if not job_ids:
+        return
+    await asyncio.to_thread(
+        lambda: supabase.table(JOBS_TABLE).update({"locked_at": _now().isoformat()})
+        .in_("id", job_ids).eq("locked_by", worker_id).eq("status", "running").execute()
+    )
+
+
+# complete_job/fail_job only touch the job while this worker still holds it: a job whose lock
+# expired may already have been reclaimed by another worker.
+async def complete_job(job: Dict[str, Any]) -> None:
+    await asyncio.to_thread(
+        lambda: supabase.table(JOBS_TABLE).update({
+            "status": "done", "finished_at": _now().isoformat(), "locked_by": None, "locked_at": None, "last_error": None,
+        }).eq("id", job["id"]).eq("locked_by", job["locked_by"]).execute()
+    )
+
+
+def retry_delay_seconds(attempts: int) -> float:
+    """Full-jitter exponential backoff for the given attempt number (1-based)."""
+    return random.uniform(0, min(JOB_RETRY_MAX_SECONDS, JOB_RETRY_BASE_SECONDS * (2 ** max(0, attempts - 1))))
+
+
+async def fail_job(job: Dict[str, Any], error: str) -> bool:
+    """Re-queue the job with backoff, or mark it failed once its attempts are used up. Returns True if it will be retried."""
+    retry = job.get("attempts", 0) < job.get("max_attempts", JOB_MAX_ATTEMPTS)
+    update: Dict[str, Any] = {"locked_by": None, "locked_at": None, "last_error": error[:4000]}
+    if retry:
+        update.update(status="queued", run_after=(_now() + timedelta(seconds=retry_delay_seconds(job.get("attempts", 1)))).isoformat())
+    else:
+        update.update(status="failed", finished_at=_now().isoformat())
+    await asyncio.to_thread(
+        lambda: supabase.table(JOBS_TABLE).update(update).eq("id", job["id"]).eq("locked_by", job["locked_by"]).execute()
+    )
+    return retry
+
+
+async def purge_finished_jobs(older_than_days: int) -> None:
+    cutoff = (_now() - timedelta(days=older_than_days)).isoformat()
+    await asyncio.to_thread(
+        lambda: supabase.table(JOBS_TABLE).delete().in_("status", ["done", "failed"]).lt("finished_at", cutoff).execute()
+    )
+
+
+async def queue_stats() -> List[Dict[str, Any]]:
+    """Per kind: queued, due, running, failed, done_last_hour and oldest_due_lag_seconds."""
+    response = await asyncio.to_thread(lambda: supabase.rpc("job_queue_stats", {}).execute())
+    return response.data or []
@@ -1,8 +1,13 @@
 import os
+import json
+import asyncio
+from collections import defaultdict
 from supabase import create_client, Client
-from typing import Optional, Dict, Any, List
+from typing import Callable, Optional, Dict, Any, List, Set
 from pydantic import HttpUrl
 
+from ..core.compression import compress_text, decompress_text
+
 # Initialize Supabase client
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY") # Use the service role key for backend operations
@@ -12,6 +17,16 @@ if not SUPABASE_URL or not SUPABASE_KEY:
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Bulk commit ingestion: rows per upsert request, further capped by the approximate request size
+COMMIT_UPSERT_BATCH_SIZE = int(os.getenv("COMMIT_UPSERT_BATCH_SIZE", "200"))
+COMMIT_UPSERT_MAX_BYTES = int(os.getenv("COMMIT_UPSERT_MAX_BYTES", str(8 * 1024 * 1024)))
+COMMIT_FILES_INSERT_BATCH_SIZE = 1000
+COMMIT_DIFF_FETCH_BATCH_SIZE = 50  # Diffs per read request; each can be megabytes before compression
+# commits columns holding raw JSON payloads, stored compressed in commit_payloads under these kinds
+RAW_PAYLOAD_KINDS = {"raw_commit_payload": "commit", "raw_push_event_payload": "push_event"}
+PAYLOAD_COLUMNS = {kind: column for column, kind in RAW_PAYLOAD_KINDS.items()}
+DIFF_EMBEDDINGS_INSERT_BATCH_SIZE = 200  # ~15KB per row once the vector is serialized
+
 # --- User Operations ---
 async def get_or_create_user(github_user_id: Optional[int] = None, github_username: Optional[str] = None, email: Optional[str] = None, name: Optional[str] = None, avatar_url: Optional[str] = None) -> Dict[str, Any]:
     """
@@ -204,6 +219,10 @@ async def store_commit_details(
     }
     # Filter out None values for fields that are not explicitly nullable in DB or have defaults
     commit_payload_cleaned = {k: v for k, v in commit_payload.items() if v is not None}
+    # The diff and raw payloads go to commit_diffs / commit_payloads once we have the commit id,
+    # and stay inline until those rows are written
+    compressed_diff = _extract_diff(commit_payload_cleaned)
+    compressed_payloads = _extract_payloads(commit_payload_cleaned)
 
     # Check if commit already exists
     select_response = supabase.table("commits").select("id").eq("project_id", project_id).eq("commit_sha", commit_sha).execute()
@@ -228,6 +247,11 @@ async def store_commit_details(
     if db_operation_response and getattr(db_operation_response, 'data', None): # Check if data attribute exists and is not empty
         saved_commit = db_operation_response.data[0]
         commit_id_to_use = saved_commit["id"]
+        if compressed_diff:
+            _store_diffs_sync({commit_id_to_use: compressed_diff})
+        if compressed_payloads:
+            _store_payloads_sync({commit_id_to_use: compressed_payloads})
+        _clear_inline_copies_sync({commit_id_to_use: _moved_columns(compressed_diff, compressed_payloads)})
 
         if changed_files and commit_id_to_use:
             supabase.table("commit_files").delete().eq("commit_id", commit_id_to_use).execute() # Assuming delete always "succeeds" or doesn't need error check here for now
@@ -256,10 +280,298 @@ async def store_commit_details(
         print(f"DB operation status code: {status_code}")
         raise Exception(error_message)
 
-async def get_commit_by_sha(project_id: str, commit_sha: str) -> Optional[Dict[str, Any]]:
-    """Retrieves a specific commit by its SHA for a given project."""
+def _extract_diff(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Compress the diff_text of a commits row and return its commit_diffs columns (without commit_id),
+    and set the row's diff_size_bytes. diff_text itself stays in the row: it is only cleared by
+    _clear_inline_copies_sync once the commit_diffs row is written, so a failed or interrupted
+    side-table write never loses the diff. Rows without a diff are left untouched.
+    """
+    diff_text = row.get("diff_text")
+    if diff_text is None:
+        return None
+    codec, blob = compress_text(diff_text)
+    size_bytes = len(diff_text.encode("utf-8"))
+    row["diff_size_bytes"] = size_bytes
+    return {"codec": codec, "diff": "\\x" + blob.hex(), "size_bytes": size_bytes, "stored_bytes": len(blob)}
+
+
+def _extract_payloads(row: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Return the commit_payloads rows (without commit_id) of the raw JSON payloads in a commits
+    row, compressed like diffs. Like _extract_diff, the payloads stay in the row until their
+    commit_payloads rows are written.
+    """
+    payloads = []
+    for column, kind in RAW_PAYLOAD_KINDS.items():
+        value = row.get(column)
+        if value is None:
+            continue
+        text = json.dumps(value, separators=(",", ":"), default=str)
+        codec, blob = compress_text(text)
+        payloads.append({"kind": kind, "codec": codec, "payload": "\\x" + blob.hex(),
+                         "size_bytes": len(text.encode("utf-8")), "stored_bytes": len(blob)})
+    return payloads
+
+
+def _moved_columns(diff: Optional[Dict[str, Any]], payloads: List[Dict[str, Any]]) -> List[str]:
+    """commits columns whose data _extract_diff / _extract_payloads copied to a side-table row."""
+    columns = ["diff_text"] if diff else []
+    return columns + [PAYLOAD_COLUMNS[payload["kind"]] for payload in payloads]
+
+
+def _clear_inline_copies_sync(columns_by_commit_id: Dict[str, List[str]]) -> None:
+    """
+    Null the inline diff_text / raw payload columns of commits whose compressed copies are now
+    stored in commit_diffs / commit_payloads. Called only after those writes succeed; until then
+    readers get the inline copy.
+    """
+    ids_by_columns: Dict[frozenset, List[str]] = defaultdict(list)
+    for commit_id, columns in columns_by_commit_id.items():
+        if columns:
+            ids_by_columns[frozenset(columns)].append(commit_id)
+    for columns, ids in ids_by_columns.items():
+        for i in range(0, len(ids), COMMIT_UPSERT_BATCH_SIZE):
+            supabase.table("commits").update({column: None for column in columns}).in_("id", ids[i:i + COMMIT_UPSERT_BATCH_SIZE]).execute()
+
+
+def _upsert_batches(rows: List[Dict[str, Any]], row_bytes: Callable[[Dict[str, Any]], int]):
+    """Split rows into requests of at most COMMIT_UPSERT_BATCH_SIZE rows / ~COMMIT_UPSERT_MAX_BYTES."""
+    batch: List[Dict[str, Any]] = []
+    batch_bytes = 0
+    for row in rows:
+        size = row_bytes(row)
+        if batch and (len(batch) >= COMMIT_UPSERT_BATCH_SIZE or batch_bytes + size > COMMIT_UPSERT_MAX_BYTES):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(row)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+def _store_diffs_sync(diffs_by_commit_id: Dict[str, Dict[str, Any]]) -> None:
+    """Upsert compressed diffs (from _extract_diff) into commit_diffs."""
+    rows = [{"commit_id": commit_id, **diff} for commit_id, diff in diffs_by_commit_id.items()]
+    for batch in _upsert_batches(rows, lambda row: len(row["diff"]) + 256):
+        supabase.table("commit_diffs").upsert(batch, on_conflict="commit_id").execute()
+
+
+def _store_payloads_sync(payloads_by_commit_id: Dict[str, List[Dict[str, Any]]]) -> None:
+    """Upsert compressed raw payloads (from _extract_payloads) into commit_payloads."""
+    rows = [{"commit_id": commit_id, **payload} for commit_id, payloads in payloads_by_commit_id.items() for payload in payloads]
+    for batch in _upsert_batches(rows, lambda row: len(row["payload"]) + 256):
+        supabase.table("commit_payloads").upsert(batch, on_conflict="commit_id,kind").execute()
+
+
+def _store_commits_bulk_sync(project_id: str, commits: List[Dict[str, Any]]) -> Dict[str, str]:
+    # A multi-row upsert writes the same columns for every row, and a column missing from a row
+    # would be overwritten with NULL/default on conflict. So rows are grouped by the set of
+    # columns they actually carry, keeping store_commit_details' "None means don't touch" semantics.
+    # Postgres rejects an upsert that touches the same row twice, so the last entry per SHA wins.
+    rows_by_sha: Dict[str, Dict[str, Any]] = {}
+    files_by_sha: Dict[str, List[Dict[str, str]]] = {}
+    diffs_by_sha: Dict[str, Dict[str, Any]] = {}
+    payloads_by_sha: Dict[str, List[Dict[str, Any]]] = {}
+    for commit in commits:
+        row = {k: v for k, v in commit.items() if k != "changed_files" and v is not None}
+        row["project_id"] = project_id
+        if row.get("compare_url") is not None:
+            row["compare_url"] = str(row["compare_url"])
+        diff = _extract_diff(row)
+        if diff:
+            diffs_by_sha[commit["commit_sha"]] = diff
+        else:
+            diffs_by_sha.pop(commit["commit_sha"], None)
+        payloads_by_sha[commit["commit_sha"]] = _extract_payloads(row)
+        rows_by_sha[commit["commit_sha"]] = row
+        if commit.get("changed_files") is not None:
+            files_by_sha[commit["commit_sha"]] = commit["changed_files"]
+    groups: Dict[frozenset, List[Dict[str, Any]]] = defaultdict(list)
+    for row in rows_by_sha.values():
+        groups[frozenset(row)].append(row)
+
+    def row_bytes(row: Dict[str, Any]) -> int:
+        # The diff and payloads are still inline in this request
+        payload_bytes = sum(payload["size_bytes"] for payload in payloads_by_sha.get(row["commit_sha"], []))
+        return len(row.get("message") or "") + (row.get("diff_size_bytes") or 0) + payload_bytes + 1024
+
+    commit_ids: Dict[str, str] = {}
+    for rows in groups.values():
+        for batch in _upsert_batches(rows, row_bytes):
+            response = supabase.table("commits").upsert(batch, on_conflict="project_id,commit_sha").execute()
+            if not getattr(response, 'data', None):
+                raise Exception(f"Error upserting {len(batch)} commits for project {project_id}: {getattr(response, 'error', 'no data returned')}")
+            for saved in response.data:
+                commit_ids[saved["commit_sha"]] = saved["id"]
+
+    _store_diffs_sync({commit_ids[sha]: diff for sha, diff in diffs_by_sha.items() if sha in commit_ids})
+    _store_payloads_sync({commit_ids[sha]: payloads for sha, payloads in payloads_by_sha.items() if sha in commit_ids and payloads})
+    _clear_inline_copies_sync({
+        commit_ids[sha]: _moved_columns(diffs_by_sha.get(sha), payloads_by_sha.get(sha, []))
+        for sha in rows_by_sha if sha in commit_ids
+    })
+
+    # Replace the file lists of the commits we have files for
+    ids_with_files = [commit_ids[sha] for sha in files_by_sha if sha in commit_ids]
+    for i in range(0, len(ids_with_files), COMMIT_UPSERT_BATCH_SIZE):
+        supabase.table("commit_files").delete().in_("commit_id", ids_with_files[i:i + COMMIT_UPSERT_BATCH_SIZE]).execute()
+    files_to_insert = [
+        {"commit_id": commit_ids[sha], "file_path": f["file_path"], "status": f["status"]}
+        for sha, files in files_by_sha.items() if sha in commit_ids
+        for f in files
+    ]
+    for i in range(0, len(files_to_insert), COMMIT_FILES_INSERT_BATCH_SIZE):
+        files_response = supabase.table("commit_files").insert(files_to_insert[i:i + COMMIT_FILES_INSERT_BATCH_SIZE]).execute()
+        files_error = getattr(files_response, 'error', None)
+        if files_error:
+            print(f"Error storing commit files: {files_error}")
+    return commit_ids
+
+
+async def store_commits_bulk(project_id: str, commits: List[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Bulk version of store_commit_details for history ingestion.
+
+    Each item holds the commits-table columns (commit_sha, message, commit_timestamp, ..., as
+    named in store_commit_details) plus an optional 'changed_files' list. Commits are upserted
+    in batches on the (project_id, commit_sha) unique key, their diffs and raw payloads compressed
+    into commit_diffs / commit_payloads (and only then cleared inline) and their commit_files replaced with a few multi-row requests, instead of 4+
+    round-trips per commit. The blocking Supabase calls run in a worker thread.
+    Returns {commit_sha: commit id}.
+    """
+    if not commits:
+        return {}
+    return await asyncio.to_thread(_store_commits_bulk_sync, project_id, commits)
+
+# --- Ingestion checkpoints ---
+async def get_stored_commit_shas(project_id: str) -> Set[str]:
+    """SHAs of every commit already stored for the project, fetched in a single RPC."""
+    response = await asyncio.to_thread(
+        lambda: supabase.rpc("get_project_commit_shas", {"p_project_id": project_id}).execute()
+    )
+    return set(response.data or [])
+
+
+async def get_ingestion_checkpoint(project_id: str, kind: str = "commit_history") -> Optional[Dict[str, Any]]:
+    response = await asyncio.to_thread(
+        lambda: supabase.table("ingestion_checkpoints").select("*").eq("project_id", project_id).eq("kind", kind).execute()
+    )
+    return response.data[0] if response.data else None
+
+
+async def save_ingestion_checkpoint(project_id: str, kind: str = "commit_history", **fields: Any) -> None:
+    """Upsert the project's checkpoint row with the given columns (status, last_commit_sha, counts, ...)."""
+    row = {"project_id": project_id, "kind": kind, **fields}
+    await asyncio.to_thread(
+        lambda: supabase.table("ingestion_checkpoints").upsert(row, on_conflict="project_id,kind").execute()
+    )
+
+
+async def get_commit_by_sha(project_id: str, commit_sha: str, include_diff: bool = False, include_raw_payloads: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Retrieves a specific commit by its SHA for a given project. Its diff_text is only loaded with
+    include_diff, and raw_commit_payload / raw_push_event_payload only with include_raw_payloads.
+    """
     response = supabase.table("commits").select("*").eq("project_id", project_id).eq("commit_sha", commit_sha).maybe_single().execute()
-    return response.data if response.data else None
+    commit = response.data if response and response.data else None
+    if commit and include_diff:
+        commit["diff_text"] = (await get_commit_diffs([commit["id"]])).get(commit["id"])
+    if commit and include_raw_payloads and any(commit.get(column) is None for column in RAW_PAYLOAD_KINDS):
+        # A payload still inline (stored before commit_payloads existed, or whose commit_payloads
+        # row was not confirmed yet) is the current one and was already selected
+        stored = await asyncio.to_thread(_get_commit_payloads_sync, commit["id"])
+        commit.update({column: value for column, value in stored.items() if commit.get(column) is None})
+    return commit
+
+
+def _decode_bytea(value: str) -> bytes:
+    # PostgREST returns bytea as "\x<hex>"
+    return bytes.fromhex(value[2:]) if value.startswith("\\x") else bytes.fromhex(value)
+
+
+def _get_commit_diffs_sync(commit_ids: List[str]) -> Dict[str, Optional[str]]:
+    diffs: Dict[str, Optional[str]] = {commit_id: None for commit_id in commit_ids}
+    # An inline diff_text is the current diff: either stored before commit_diffs existed, or
+    # written by a store whose commit_diffs row was not confirmed yet (see _clear_inline_copies_sync)
+    for i in range(0, len(commit_ids), COMMIT_DIFF_FETCH_BATCH_SIZE):
+        response = supabase.table("commits").select("id, diff_text").in_("id", commit_ids[i:i + COMMIT_DIFF_FETCH_BATCH_SIZE]).not_.is_("diff_text", "null").execute()
+        for row in response.data or []:
+            diffs[row["id"]] = row["diff_text"]
+    missing = [commit_id for commit_id, diff in diffs.items() if diff is None]
+    for i in range(0, len(missing), COMMIT_DIFF_FETCH_BATCH_SIZE):
+        batch = missing[i:i + COMMIT_DIFF_FETCH_BATCH_SIZE]
+        response = supabase.table("commit_diffs").select("commit_id, codec, diff").in_("commit_id", batch).execute()
+        for row in response.data or []:
+            try:
+                diffs[row["commit_id"]] = decompress_text(row["codec"], _decode_bytea(row["diff"]))
+            except Exception as e:
+                # e.g. a zstd blob read by a process without zstandard; the other diffs are still returned
+                print(f"Warning: could not decode the stored diff of commit {row['commit_id']} ({row['codec']}): {e}")
+    return diffs
+
+
+def _get_commit_payloads_sync(commit_id: str) -> Dict[str, Any]:
+    """{column: decoded JSON} for the raw payloads of a commit stored in commit_payloads."""
+    response = supabase.table("commit_payloads").select("kind, codec, payload").eq("commit_id", commit_id).execute()
+    payloads = {}
+    for row in response.data or []:
+        if row["kind"] not in PAYLOAD_COLUMNS:
+            continue
+        try:
+            payloads[PAYLOAD_COLUMNS[row["kind"]]] = json.loads(decompress_text(row["codec"], _decode_bytea(row["payload"])))
+        except Exception as e:
+            print(f"Warning: could not decode the stored {row['kind']} payload of commit {commit_id} ({row['codec']}): {e}")
+    return payloads
+
+
+async def get_commit_diffs(commit_ids: List[str]) -> Dict[str, Optional[str]]:
+    """Diff text of each commit id (None when the commit has no stored diff), decompressed on demand."""
+    commit_ids = list(dict.fromkeys(str(commit_id) for commit_id in commit_ids))
+    if not commit_ids:
+        return {}
+    return await asyncio.to_thread(_get_commit_diffs_sync, commit_ids)
+
+# --- Diff embeddings (commit history search) ---
+def _pgvector_literal(embedding: List[float]) -> str:
+    # Rounded to 6 decimals to keep requests small
+    return "[" + ",".join(str(round(float(x), 6)) for x in embedding) + "]"
+
+
+def _replace_diff_embeddings_sync(project_id: str, commit_shas: List[str], rows: List[Dict[str, Any]]) -> int:
+    for i in range(0, len(commit_shas), COMMIT_UPSERT_BATCH_SIZE):
+        supabase.table("diff_embeddings").delete().eq("project_id", project_id).in_("commit_sha", commit_shas[i:i + COMMIT_UPSERT_BATCH_SIZE]).execute()
+    records = [{**row, "project_id": project_id, "embedding": _pgvector_literal(row["embedding"])} for row in rows]
+    inserted = 0
+    for i in range(0, len(records), DIFF_EMBEDDINGS_INSERT_BATCH_SIZE):
+        response = supabase.table("diff_embeddings").insert(records[i:i + DIFF_EMBEDDINGS_INSERT_BATCH_SIZE]).execute()
+        inserted += len(response.data or [])
+    return inserted
+
+
+async def replace_diff_embeddings(project_id: str, commit_shas: List[str], rows: List[Dict[str, Any]]) -> int:
+    """
+    Store the diff chunk embeddings of `commit_shas`, replacing any stored earlier so
+    re-processing a commit does not duplicate its chunks. Each row holds the diff_embeddings
+    columns (commit_sha, commit_id, file_path, ..., embedding as a list of floats).
+    Returns the number of rows inserted.
+    """
+    if not commit_shas:
+        return 0
+    return await asyncio.to_thread(_replace_diff_embeddings_sync, project_id, list(dict.fromkeys(commit_shas)), rows)
+
+
+def search_commits_sync(query_embedding: List[float], project_id: Optional[str] = None, limit: int = 10,
+                        threshold: float = 0.3, candidate_count: int = 200) -> List[Dict[str, Any]]:
+    """Commits ranked by their best matching diff chunk (search_commits RPC)."""
+    response = supabase.rpc("search_commits", {
+        "query_embedding": _pgvector_literal(query_embedding),
+        "p_project_id": project_id,
+        "match_count": limit,
+        "threshold": threshold,
+        "candidate_count": max(candidate_count, limit),
+    }).execute()
+    return response.data or []
 
 # --- Helper to get project by full name ---
 async def get_project_by_full_name(repo_full_name: str) -> Optional[Dict[str, Any]]:
@@ -0,0 +1,226 @@
+"""
+Behavioural tests for the durable job queue (app/services/job_queue.py) and its worker
+(app/workers/job_worker.py).
+
+Supabase is replaced by an in-memory `jobs` table whose claim_jobs RPC follows the SQL in
+supabase/migrations/20250605000000_create_job_queue.sql: only the oldest unfinished job of each
+queue_key is claimable, when it is queued and due or running under an expired lock.
+
+Run from api/ with `python -m pytest app/services/test_job_queue.py`.
+"""
+import asyncio
+import os
+import types
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# supabase_service needs these set to import; no request is made
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+
+from app.services import job_queue  # noqa: E402
+
+TEST_JOB = "test.job"
+
+
+def _as_time(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+class FakeJobsQuery:
+    def __init__(self, db):
+        self.db = db
+        self.action = None
+        self.filters = []
+
+    def upsert(self, rows, on_conflict=None, ignore_duplicates=False):
+        assert on_conflict == "dedupe_key" and ignore_duplicates
+        self.action = ("upsert", rows)
+        return self
+
+    def update(self, values):
+        self.action = ("update", values)
+        return self
+
+    def delete(self):
+        self.action = ("delete", None)
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and _as_time(row[column]) < _as_time(value))
+        return self
+
+    def execute(self):
+        kind, value = self.action
+        if kind == "upsert":
+            return types.SimpleNamespace(data=[self.db.insert(row) for row in value if not self.db.has_dedupe_key(row.get("dedupe_key"))])
+        matched = [row for row in self.db.rows.values() if all(f(row) for f in self.filters)]
+        if kind == "update":
+            for row in matched:
+                row.update(value)
+        else:
+            for row in matched:
+                del self.db.rows[row["id"]]
+        return types.SimpleNamespace(data=[dict(row) for row in matched])
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.rows = {}
+        self.next_id = 1
+
+    def has_dedupe_key(self, key):
+        return key is not None and any(row.get("dedupe_key") == key for row in self.rows.values())
+
+    def insert(self, row):
+        stored = {"status": "queued", "attempts": 0, "locked_by": None, "locked_at": None,
+                  "last_error": None, "finished_at": None, **row, "id": self.next_id}
+        self.rows[self.next_id] = stored
+        self.next_id += 1
+        return dict(stored)
+
+    def table(self, name):
+        assert name == job_queue.JOBS_TABLE
+        return FakeJobsQuery(self)
+
+    def rpc(self, name, params):
+        assert name == "claim_jobs"
+        return types.SimpleNamespace(execute=lambda: types.SimpleNamespace(data=self.claim(**params)))
+
+    def claim(self, p_worker, p_limit, p_lock_timeout_seconds):
+        now = datetime.now(timezone.utc)
+        heads = {}
+        for row in sorted(self.rows.values(), key=lambda row: row["id"]):
+            if row["status"] in ("queued", "running"):
+                heads.setdefault(row["queue_key"], row)
+        claimable = [
+            row for row in sorted(heads.values(), key=lambda row: row["id"])
+            if (row["status"] == "queued" and _as_time(row["run_after"]) <= now)
+            or (row["status"] == "running" and _as_time(row["locked_at"]) < now - timedelta(seconds=p_lock_timeout_seconds))
+        ][:p_limit]
+        for row in claimable:
+            row.update(status="running", locked_by=p_worker, locked_at=now.isoformat(), attempts=row["attempts"] + 1)
+        return [dict(row) for row in claimable]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeSupabase()
+    monkeypatch.setattr(job_queue, "supabase", fake)
+    monkeypatch.setattr(job_queue, "retry_delay_seconds", lambda attempts: 0)
+    return fake
+
+
+def enqueue(*jobs):
+    return asyncio.run(job_queue.enqueue_jobs(list(jobs)))
+
+
+def claim(worker="w1", limit=10):
+    return asyncio.run(job_queue.claim_jobs(worker, limit))
+
+
+def test_duplicate_deliveries_are_queued_once(db):
+    assert enqueue(job_queue.new_job(TEST_JOB, {"n": 1}, "repo/a", dedupe_key="delivery-1:sha")) == 1
+    assert enqueue(job_queue.new_job(TEST_JOB, {"n": 1}, "repo/a", dedupe_key="delivery-1:sha"),
+                   job_queue.new_job(TEST_JOB, {"n": 2}, "repo/a", dedupe_key="delivery-2:sha")) == 1
+    assert [row["payload"]["n"] for row in db.rows.values()] == [1, 2]
+
+
+def test_one_job_per_key_runs_at_a_time_in_enqueue_order(db):
+    enqueue(job_queue.new_job(TEST_JOB, {"n": 1}, "repo/a"), job_queue.new_job(TEST_JOB, {"n": 2}, "repo/a"),
+            job_queue.new_job(TEST_JOB, {"n": 3}, "repo/b"), job_queue.new_job(TEST_JOB, {"n": 4}, "repo/c", delay_seconds=3600))
+    first = claim()
+    assert [job["payload"]["n"] for job in first] == [1, 3]
+    assert all(job["status"] == "running" and job["attempts"] == 1 and job["locked_by"] == "w1" for job in first)
+    # repo/a's second job waits for the first; repo/c's job is not due yet
+    assert claim("w2") == []
+
+    asyncio.run(job_queue.complete_job(first[0]))
+    assert db.rows[first[0]["id"]]["status"] == "done" and db.rows[first[0]["id"]]["finished_at"]
+    assert [job["payload"]["n"] for job in claim("w2")] == [2]
+
+
+def test_failed_jobs_are_retried_until_max_attempts(db):
+    enqueue(job_queue.new_job(TEST_JOB, {}, "repo/a", max_attempts=2), job_queue.new_job(TEST_JOB, {}, "repo/a"))
+    (job,) = claim()
+    assert asyncio.run(job_queue.fail_job(job, "RuntimeError: boom")) is True
+    row = db.rows[job["id"]]
+    assert (row["status"], row["locked_by"], row["last_error"]) == ("queued", None, "RuntimeError: boom")
+
+    # The retry keeps its place at the head of the key
+    (retry,) = claim()
+    assert retry["id"] == job["id"] and retry["attempts"] == 2
+    assert asyncio.run(job_queue.fail_job(retry, "RuntimeError: boom again")) is False
+    assert db.rows[job["id"]]["status"] == "failed"
+    # A failed job no longer holds back its key
+    (next_job,) = claim()
+    assert next_job["id"] != job["id"]
+
+
+def test_expired_locks_are_reclaimed_and_the_old_worker_cannot_finish_the_job(db, monkeypatch):
+    enqueue(job_queue.new_job(TEST_JOB, {}, "repo/a"))
+    (stale,) = claim("dead-worker")
+    assert claim("w2") == []
+
+    db.rows[stale["id"]]["locked_at"] = (datetime.now(timezone.utc) - timedelta(seconds=job_queue.JOB_LOCK_TIMEOUT_SECONDS + 1)).isoformat()
+    (reclaimed,) = claim("w2")
+    assert reclaimed["id"] == stale["id"] and reclaimed["attempts"] == 2
+
+    asyncio.run(job_queue.complete_job(stale))
+    assert db.rows[stale["id"]]["status"] == "running" and db.rows[stale["id"]]["locked_by"] == "w2"
+    asyncio.run(job_queue.complete_job(reclaimed))
+    assert db.rows[stale["id"]]["status"] == "done"
+
+
+def test_heartbeat_only_refreshes_this_workers_running_jobs(db):
+    enqueue(job_queue.new_job(TEST_JOB, {}, "repo/a"), job_queue.new_job(TEST_JOB, {}, "repo/b"))
+    mine, theirs = claim("w1", 1), claim("w2", 1)
+    old = (datetime.now(timezone.utc) - timedelta(seconds=60)).isoformat()
+    for row in db.rows.values():
+        row["locked_at"] = old
+    asyncio.run(job_queue.heartbeat_jobs("w1", [mine[0]["id"], theirs[0]["id"]]))
+    assert db.rows[mine[0]["id"]]["locked_at"] != old
+    assert db.rows[theirs[0]["id"]]["locked_at"] == old
+
+
+def test_worker_runs_handlers_and_retries_failures(db, monkeypatch):
+    job_worker = pytest.importorskip("app.workers.job_worker")
+    monkeypatch.setattr(job_worker, "start_github_client", lambda: asyncio.sleep(0))
+    monkeypatch.setattr(job_worker, "close_github_client", lambda: asyncio.sleep(0))
+    calls = []
+
+    async def handler(payload):
+        calls.append(payload["n"])
+        if payload.get("fail_once") and calls.count(payload["n"]) == 1:
+            raise RuntimeError("transient")
+
+    monkeypatch.setitem(job_queue._JOB_HANDLERS, TEST_JOB, handler)
+    enqueue(job_queue.new_job(TEST_JOB, {"n": 1, "fail_once": True}, "repo/a"),
+            job_queue.new_job(TEST_JOB, {"n": 2}, "repo/a"),
+            job_queue.new_job(TEST_JOB, {"n": 3}, "repo/b"),
+            job_queue.new_job("unknown.kind", {}, "repo/c", max_attempts=1))
+
+    async def run_until_drained():
+        worker = job_worker.JobWorker(concurrency=2, poll_interval=0.01)
+        task = asyncio.create_task(worker.run())
+        while any(row["status"] in ("queued", "running") for row in db.rows.values()):
+            await asyncio.sleep(0.01)
+        worker.stopping.set()
+        await asyncio.wait_for(task, timeout=5)
+        return worker
+
+    worker = asyncio.run(run_until_drained())
+    statuses = {row["payload"].get("n"): (row["status"], row["attempts"]) for row in db.rows.values()}
+    assert statuses == {1: ("done", 2), 2: ("done", 1), 3: ("done", 1), None: ("failed", 1)}
+    # repo/a's jobs ran in order, the second only after the first succeeded
+    assert [n for n in calls if n in (1, 2)] == [1, 1, 2]
+    assert (worker.processed, worker.failed) == (3, 2)
@@ -0,0 +1 @@
+# Background worker processes (run separately from the API), e.g. `python -m app.workers.job_worker`.
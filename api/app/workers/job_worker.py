@@ -0,0 +1,151 @@
+"""
+Worker process for the durable job queue (app/services/job_queue.py).
+
+    python -m app.workers.job_worker --concurrency 4
+
+Runs up to `concurrency` jobs at a time, claiming more as slots free up. Locks of running jobs
+are refreshed periodically so a long job is not mistaken for an abandoned one; the jobs of a
+worker that dies are reclaimed by others after JOB_LOCK_TIMEOUT_SECONDS. SIGINT/SIGTERM stop
+claiming and let the running jobs finish.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import time
+import uuid
+from typing import Any, Dict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from ..core.config import (
+    JOB_WORKER_CONCURRENCY, JOB_POLL_INTERVAL_SECONDS, JOB_LOCK_TIMEOUT_SECONDS, JOB_RETENTION_DAYS,
+)
+from ..services import job_queue
+from ..services.supabase_service import store_raw_event_data
+from ..services.github_client import start_github_client, close_github_client
+from ..ingest.diff_processor import process_github_commit_data, process_github_push
+
+PURGE_INTERVAL_SECONDS = 3600
+
+
+async def _handle_raw_event(payload: Dict[str, Any]) -> None:
+    for entity_id in payload["entity_ids"]:
+        await store_raw_event_data(payload["event_type"], payload["delivery_id"], payload["repo_full_name"], entity_id, payload["payload"])
+
+
+async def _handle_push(payload: Dict[str, Any]) -> None:
+    await process_github_push(**payload)
+
+
+async def _handle_push_commit(payload: Dict[str, Any]) -> None:
+    await process_github_commit_data(**payload)
+
+
+job_queue.register_job_handler(job_queue.GITHUB_RAW_EVENT_JOB, _handle_raw_event)
+job_queue.register_job_handler(job_queue.GITHUB_PUSH_JOB, _handle_push)
+job_queue.register_job_handler(job_queue.GITHUB_PUSH_COMMIT_JOB, _handle_push_commit)
+
+
+class JobWorker:
+    def __init__(self, concurrency: int = JOB_WORKER_CONCURRENCY, poll_interval: float = JOB_POLL_INTERVAL_SECONDS):
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.running: Dict[int, asyncio.Task] = {}
+        self.stopping = asyncio.Event()
+        self.processed = 0
+        self.failed = 0
+
+    async def _run_job(self, job: Dict[str, Any]) -> None:
+        started = time.perf_counter()
+        handler = job_queue.get_job_handler(job["kind"])
+        try:
+            if handler is None:
+                raise RuntimeError(f"No handler registered for job kind {job['kind']!r}")
+            await handler(job.get("payload") or {})
+        except Exception as e:
+            self.failed += 1
+            retry = await job_queue.fail_job(job, f"{type(e).__name__}: {e}")
+            print(f"JobWorker: job {job['id']} ({job['kind']}, attempt {job.get('attempts')}/{job.get('max_attempts')}) failed: {e}. "
+                  f"{'Will retry.' if retry else 'Giving up.'}")
+            return
+        await job_queue.complete_job(job)
+        self.processed += 1
+        print(f"JobWorker: job {job['id']} ({job['kind']}, key {job['queue_key']}) done in {time.perf_counter() - started:.1f}s")
+
+    async def _claim(self) -> int:
+        free = self.concurrency - len(self.running)
+        if free <= 0:
+            return 0
+        try:
+            jobs = await job_queue.claim_jobs(self.worker_id, free)
+        except Exception as e:
+            print(f"JobWorker: could not claim jobs: {e}")
+            return 0
+        for job in jobs:
+            task = asyncio.create_task(self._run_job(job))
+            self.running[job["id"]] = task
+            task.add_done_callback(lambda _t, job_id=job["id"]: self.running.pop(job_id, None))
+        return len(jobs)
+
+    async def _maintenance(self) -> None:
+        """Heartbeat running jobs and purge old finished ones until stopped."""
+        last_purge = 0.0
+        while not self.stopping.is_set() or self.running:
+            try:
+                await job_queue.heartbeat_jobs(self.worker_id, list(self.running))
+                if time.monotonic() - last_purge > PURGE_INTERVAL_SECONDS:
+                    await job_queue.purge_finished_jobs(JOB_RETENTION_DAYS)
+                    last_purge = time.monotonic()
+            except Exception as e:
+                print(f"JobWorker: maintenance failed: {e}")
+            await asyncio.sleep(JOB_LOCK_TIMEOUT_SECONDS / 3)
+
+    async def run(self) -> None:
+        print(f"JobWorker {self.worker_id} started (concurrency {self.concurrency}).")
+        await start_github_client()
+        maintenance = asyncio.create_task(self._maintenance())
+        while not self.stopping.is_set():
+            claimed = await self._claim()
+            if claimed and len(self.running) < self.concurrency:
+                continue  # There may be more work; claim again right away
+            # Wait for a free slot, new work (poll) or shutdown
+            waiters = [asyncio.create_task(self.stopping.wait())]
+            if self.running and len(self.running) >= self.concurrency:
+                waiters.append(asyncio.create_task(asyncio.wait(list(self.running.values()), return_when=asyncio.FIRST_COMPLETED)))
+            done, pending = await asyncio.wait(waiters, timeout=self.poll_interval, return_when=asyncio.FIRST_COMPLETED)
+            for waiter in pending:
+                waiter.cancel()
+        if self.running:
+            print(f"JobWorker: waiting for {len(self.running)} running job(s) to finish...")
+            await asyncio.gather(*self.running.values(), return_exceptions=True)
+        maintenance.cancel()
+        await close_github_client()
+        print(f"JobWorker {self.worker_id} stopped. Processed {self.processed} job(s), {self.failed} failure(s).")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process jobs from the durable job queue")
+    parser.add_argument("--concurrency", type=int, default=JOB_WORKER_CONCURRENCY, help="Jobs run at the same time by this process.")
+    parser.add_argument("--poll-interval", type=float, default=JOB_POLL_INTERVAL_SECONDS, help="Seconds between polls when idle.")
+    args = parser.parse_args()
+
+    async def _run():
+        worker = JobWorker(concurrency=args.concurrency, poll_interval=args.poll_interval)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, worker.stopping.set)
+            except NotImplementedError:
+                pass  # Windows: Ctrl+C raises KeyboardInterrupt instead
+        await worker.run()
+
+    asyncio.run(_run())
+
+
+if __name__ == "__main__":
+    main()
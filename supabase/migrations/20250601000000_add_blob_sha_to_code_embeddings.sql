@@ -0,0 +1,7 @@
+-- Incremental re-indexing: remember which git blob each chunk was generated from so a
+-- re-index only re-embeds files whose blob SHA changed.
+ALTER TABLE "public"."code_embeddings"
+ADD COLUMN "blob_sha" text;
+
+-- Supports the per-file diff (select file_path, blob_sha) and the per-file deletes.
+CREATE INDEX "idx_code_embeddings_project_id_file_path" ON "public"."code_embeddings"("project_id", "file_path");
@@ -0,0 +1,61 @@
+-- Server-side top-k code search. Only the best `match_count` rows (without their
+-- embedding column) are returned to the API instead of thousands of raw vectors.
+
+CREATE INDEX IF NOT EXISTS "idx_code_embeddings_embedding_hnsw"
+ON "public"."code_embeddings"
+USING hnsw ("embedding" vector_cosine_ops);
+
+-- A named row type (rather than RETURNS TABLE) so the result can carry a project_id column
+-- while the function also takes a project_id argument.
+CREATE TYPE public.code_embedding_match AS (
+    id bigint,
+    project_id uuid,
+    content text,
+    file_path text,
+    symbol_type text,
+    symbol_name text,
+    start_line integer,
+    end_line integer,
+    similarity double precision
+);
+
+CREATE OR REPLACE FUNCTION public.match_code_embeddings(
+    query_embedding vector(1536),
+    project_id uuid DEFAULT NULL,
+    match_count integer DEFAULT 10,
+    threshold double precision DEFAULT 0.5
+)
+RETURNS SETOF public.code_embedding_match
+LANGUAGE sql
+STABLE
+-- Keep scanning the HNSW graph until enough rows survive the project filter (pgvector >= 0.8).
+SET hnsw.iterative_scan = strict_order
+AS $function$
+    SELECT * FROM (
+        SELECT
+            ce.id,
+            ce.project_id,
+            ce.content,
+            ce.file_path,
+            ce.symbol_type,
+            ce.symbol_name,
+            ce.start_line,
+            ce.end_line,
+            1 - (ce.embedding <=> query_embedding) AS similarity
+        FROM public.code_embeddings AS ce
+        WHERE ce.embedding IS NOT NULL
+          AND (match_code_embeddings.project_id IS NULL OR ce.project_id = match_code_embeddings.project_id)
+        ORDER BY ce.embedding <=> query_embedding
+        LIMIT match_count
+    ) AS nearest
+    -- Thresholding after the LIMIT keeps the ORDER BY ... LIMIT shape the index can serve.
+    WHERE nearest.similarity >= threshold
+    ORDER BY nearest.similarity DESC;
+$function$
+;
+
+grant execute on function public.match_code_embeddings(vector, uuid, integer, double precision) to "anon";
+
+grant execute on function public.match_code_embeddings(vector, uuid, integer, double precision) to "authenticated";
+
+grant execute on function public.match_code_embeddings(vector, uuid, integer, double precision) to "service_role";
@@ -0,0 +1,42 @@
+-- Python methods and nested classes are embedded separately from their class header,
+-- so each row records the qualified name of its enclosing class (NULL at module level).
+
+ALTER TABLE "public"."code_embeddings" ADD COLUMN IF NOT EXISTS "parent_symbol" text;
+
+ALTER TYPE public.code_embedding_match ADD ATTRIBUTE parent_symbol text;
+
+CREATE OR REPLACE FUNCTION public.match_code_embeddings(
+    query_embedding vector(1536),
+    project_id uuid DEFAULT NULL,
+    match_count integer DEFAULT 10,
+    threshold double precision DEFAULT 0.5
+)
+RETURNS SETOF public.code_embedding_match
+LANGUAGE sql
+STABLE
+-- Keep scanning the HNSW graph until enough rows survive the project filter (pgvector >= 0.8).
+SET hnsw.iterative_scan = strict_order
+AS $function$
+    SELECT * FROM (
+        SELECT
+            ce.id,
+            ce.project_id,
+            ce.content,
+            ce.file_path,
+            ce.symbol_type,
+            ce.symbol_name,
+            ce.start_line,
+            ce.end_line,
+            1 - (ce.embedding <=> query_embedding) AS similarity,
+            ce.parent_symbol
+        FROM public.code_embeddings AS ce
+        WHERE ce.embedding IS NOT NULL
+          AND (match_code_embeddings.project_id IS NULL OR ce.project_id = match_code_embeddings.project_id)
+        ORDER BY ce.embedding <=> query_embedding
+        LIMIT match_count
+    ) AS nearest
+    -- Thresholding after the LIMIT keeps the ORDER BY ... LIMIT shape the index can serve.
+    WHERE nearest.similarity >= threshold
+    ORDER BY nearest.similarity DESC;
+$function$
+;
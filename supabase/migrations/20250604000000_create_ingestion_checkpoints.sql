@@ -0,0 +1,61 @@
+-- Progress of long-running commit history ingestions, so a crashed or restarted run
+-- resumes where it stopped instead of re-walking and re-upserting the whole history.
+
+CREATE TABLE IF NOT EXISTS public.ingestion_checkpoints (
+    project_id uuid NOT NULL REFERENCES public.projects(id) ON DELETE CASCADE,
+    kind text NOT NULL DEFAULT 'commit_history',
+    status text NOT NULL DEFAULT 'running',  -- running | completed | failed
+    last_commit_sha text,
+    commits_seen integer NOT NULL DEFAULT 0,
+    commits_stored integer NOT NULL DEFAULT 0,
+    commits_skipped integer NOT NULL DEFAULT 0,
+    error text,
+    started_at timestamp with time zone DEFAULT now(),
+    completed_at timestamp with time zone,
+    updated_at timestamp with time zone DEFAULT now(),
+    PRIMARY KEY (project_id, kind)
+);
+
+CREATE TRIGGER set_timestamp_ingestion_checkpoints
+BEFORE UPDATE ON public.ingestion_checkpoints
+FOR EACH ROW EXECUTE FUNCTION public.trigger_set_timestamp();
+
+-- All commit SHAs already stored for a project, as a single array. One round-trip that is
+-- not truncated by PostgREST's max-rows limit the way a plain select would be.
+CREATE OR REPLACE FUNCTION public.get_project_commit_shas(p_project_id uuid)
+RETURNS text[]
+LANGUAGE sql
+STABLE
+AS $function$
+    SELECT coalesce(array_agg(commit_sha), ARRAY[]::text[])
+    FROM public.commits
+    WHERE project_id = p_project_id;
+$function$;
+
+grant delete on table "public"."ingestion_checkpoints" to "authenticated";
+
+grant insert on table "public"."ingestion_checkpoints" to "authenticated";
+
+grant references on table "public"."ingestion_checkpoints" to "authenticated";
+
+grant select on table "public"."ingestion_checkpoints" to "authenticated";
+
+grant trigger on table "public"."ingestion_checkpoints" to "authenticated";
+
+grant truncate on table "public"."ingestion_checkpoints" to "authenticated";
+
+grant update on table "public"."ingestion_checkpoints" to "authenticated";
+
+grant delete on table "public"."ingestion_checkpoints" to "service_role";
+
+grant insert on table "public"."ingestion_checkpoints" to "service_role";
+
+grant references on table "public"."ingestion_checkpoints" to "service_role";
+
+grant select on table "public"."ingestion_checkpoints" to "service_role";
+
+grant trigger on table "public"."ingestion_checkpoints" to "service_role";
+
+grant truncate on table "public"."ingestion_checkpoints" to "service_role";
+
+grant update on table "public"."ingestion_checkpoints" to "service_role";
@@ -0,0 +1,121 @@
+-- Durable work queue for webhook-triggered processing (see api/app/services/job_queue.py).
+-- Jobs are claimed by worker processes with FOR UPDATE SKIP LOCKED, retried with backoff,
+-- and run one at a time, in id order, per queue_key (e.g. per repository).
+
+CREATE TABLE IF NOT EXISTS public.jobs (
+    id bigserial PRIMARY KEY,
+    kind text NOT NULL,
+    queue_key text NOT NULL,
+    payload jsonb NOT NULL DEFAULT '{}'::jsonb,
+    status text NOT NULL DEFAULT 'queued',  -- queued | running | done | failed
+    attempts integer NOT NULL DEFAULT 0,
+    max_attempts integer NOT NULL DEFAULT 5,
+    run_after timestamp with time zone NOT NULL DEFAULT now(),
+    dedupe_key text UNIQUE,  -- e.g. "<delivery id>:<commit sha>", so redelivered webhooks are not queued twice
+    locked_by text,
+    locked_at timestamp with time zone,
+    last_error text,
+    created_at timestamp with time zone DEFAULT now(),
+    updated_at timestamp with time zone DEFAULT now(),
+    finished_at timestamp with time zone
+);
+
+CREATE INDEX IF NOT EXISTS idx_jobs_pending_by_key ON public.jobs (queue_key, id) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS idx_jobs_finished_at ON public.jobs (finished_at) WHERE status IN ('done', 'failed');
+
+CREATE TRIGGER set_timestamp_jobs
+BEFORE UPDATE ON public.jobs
+FOR EACH ROW EXECUTE FUNCTION public.trigger_set_timestamp();
+
+-- Claim up to p_limit runnable jobs for p_worker. Only the oldest unfinished job of each
+-- queue_key is eligible: it must be queued and due, or running under a lock older than
+-- p_lock_timeout_seconds (its worker died). A job waiting for a retry therefore also holds
+-- back the later jobs of its key, which keeps per-key ordering.
+CREATE OR REPLACE FUNCTION public.claim_jobs(
+    p_worker text,
+    p_limit integer DEFAULT 1,
+    p_lock_timeout_seconds integer DEFAULT 900
+)
+RETURNS SETOF public.jobs
+LANGUAGE sql
+AS $function$
+    -- heads only picks each key's oldest unfinished job. Eligibility is checked on the locked
+    -- row j: FOR UPDATE rechecks j's columns if another worker claimed it concurrently, while
+    -- heads stays at the statement snapshot.
+    WITH heads AS (
+        SELECT DISTINCT ON (queue_key) id
+        FROM public.jobs
+        WHERE status IN ('queued', 'running')
+        ORDER BY queue_key, id
+    ),
+    claimable AS (
+        SELECT j.id
+        FROM public.jobs j
+        JOIN heads h ON h.id = j.id
+        WHERE (j.status = 'queued' AND j.run_after <= now())
+           OR (j.status = 'running' AND j.locked_at < now() - make_interval(secs => p_lock_timeout_seconds))
+        ORDER BY j.id
+        LIMIT p_limit
+        FOR UPDATE OF j SKIP LOCKED
+    )
+    UPDATE public.jobs j
+    SET status = 'running', locked_by = p_worker, locked_at = now(), attempts = j.attempts + 1
+    FROM claimable c
+    WHERE j.id = c.id
+    RETURNING j.*;
+$function$;
+
+-- Queue depth and lag per kind, for the /jobs/stats endpoint.
+CREATE OR REPLACE FUNCTION public.job_queue_stats()
+RETURNS TABLE (
+    kind text,
+    queued bigint,
+    due bigint,
+    running bigint,
+    failed bigint,
+    done_last_hour bigint,
+    oldest_due_lag_seconds double precision
+)
+LANGUAGE sql
+STABLE
+AS $function$
+    SELECT
+        kind,
+        count(*) FILTER (WHERE status = 'queued'),
+        count(*) FILTER (WHERE status = 'queued' AND run_after <= now()),
+        count(*) FILTER (WHERE status = 'running'),
+        count(*) FILTER (WHERE status = 'failed'),
+        count(*) FILTER (WHERE status = 'done' AND finished_at > now() - interval '1 hour'),
+        extract(epoch FROM now() - min(run_after) FILTER (WHERE status = 'queued' AND run_after <= now()))
+    FROM public.jobs
+    GROUP BY kind
+    ORDER BY kind;
+$function$;
+
+grant delete on table "public"."jobs" to "authenticated";
+
+grant insert on table "public"."jobs" to "authenticated";
+
+grant references on table "public"."jobs" to "authenticated";
+
+grant select on table "public"."jobs" to "authenticated";
+
+grant trigger on table "public"."jobs" to "authenticated";
+
+grant truncate on table "public"."jobs" to "authenticated";
+
+grant update on table "public"."jobs" to "authenticated";
+
+grant delete on table "public"."jobs" to "service_role";
+
+grant insert on table "public"."jobs" to "service_role";
+
+grant references on table "public"."jobs" to "service_role";
+
+grant select on table "public"."jobs" to "service_role";
+
+grant trigger on table "public"."jobs" to "service_role";
+
+grant truncate on table "public"."jobs" to "service_role";
+
+grant update on table "public"."jobs" to "service_role";
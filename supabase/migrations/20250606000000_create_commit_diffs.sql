@@ -0,0 +1,101 @@
+-- Commit diffs and raw JSON payloads move out of the commits row into side tables of compressed
+-- blobs (see store_commits_bulk / get_commit_diffs in api/app/services/supabase_service.py).
+-- commits keeps only the diff's uncompressed size, so listing commits never reads or TOASTs them.
+
+CREATE TABLE IF NOT EXISTS public.commit_diffs (
+    commit_id uuid PRIMARY KEY REFERENCES public.commits(id) ON DELETE CASCADE,
+    codec text NOT NULL,            -- zstd | zlib | none
+    diff bytea NOT NULL,
+    size_bytes integer NOT NULL,    -- Uncompressed UTF-8 size
+    stored_bytes integer NOT NULL,  -- Compressed size
+    created_at timestamp with time zone DEFAULT now(),
+    updated_at timestamp with time zone DEFAULT now()
+);
+
+-- Already compressed; keep Postgres from trying again (it still moves large values out of line)
+ALTER TABLE public.commit_diffs ALTER COLUMN diff SET STORAGE EXTERNAL;
+
+CREATE TRIGGER set_timestamp_commit_diffs
+BEFORE UPDATE ON public.commit_diffs
+FOR EACH ROW EXECUTE FUNCTION public.trigger_set_timestamp();
+
+-- raw_commit_payload / raw_push_event_payload, as compressed JSON, one row per commit and kind
+CREATE TABLE IF NOT EXISTS public.commit_payloads (
+    commit_id uuid NOT NULL REFERENCES public.commits(id) ON DELETE CASCADE,
+    kind text NOT NULL,             -- commit | push_event
+    codec text NOT NULL,            -- zstd | zlib | none
+    payload bytea NOT NULL,
+    size_bytes integer NOT NULL,    -- Uncompressed JSON size
+    stored_bytes integer NOT NULL,  -- Compressed size
+    created_at timestamp with time zone DEFAULT now(),
+    updated_at timestamp with time zone DEFAULT now(),
+    PRIMARY KEY (commit_id, kind)
+);
+
+ALTER TABLE public.commit_payloads ALTER COLUMN payload SET STORAGE EXTERNAL;
+
+CREATE TRIGGER set_timestamp_commit_payloads
+BEFORE UPDATE ON public.commit_payloads
+FOR EACH ROW EXECUTE FUNCTION public.trigger_set_timestamp();
+
+ALTER TABLE public.commits ADD COLUMN IF NOT EXISTS diff_size_bytes integer;
+
+-- Rows written before this migration keep their inline diff_text and payloads, which readers fall
+-- back to. Sizes are recorded now; the data is moved (compressed) the next time the commit is stored.
+UPDATE public.commits SET diff_size_bytes = octet_length(diff_text) WHERE diff_text IS NOT NULL AND diff_size_bytes IS NULL;
+
+grant delete on table "public"."commit_diffs" to "authenticated";
+
+grant insert on table "public"."commit_diffs" to "authenticated";
+
+grant references on table "public"."commit_diffs" to "authenticated";
+
+grant select on table "public"."commit_diffs" to "authenticated";
+
+grant trigger on table "public"."commit_diffs" to "authenticated";
+
+grant truncate on table "public"."commit_diffs" to "authenticated";
+
+grant update on table "public"."commit_diffs" to "authenticated";
+
+grant delete on table "public"."commit_diffs" to "service_role";
+
+grant insert on table "public"."commit_diffs" to "service_role";
+
+grant references on table "public"."commit_diffs" to "service_role";
+
+grant select on table "public"."commit_diffs" to "service_role";
+
+grant trigger on table "public"."commit_diffs" to "service_role";
+
+grant truncate on table "public"."commit_diffs" to "service_role";
+
+grant update on table "public"."commit_diffs" to "service_role";
+
+grant delete on table "public"."commit_payloads" to "authenticated";
+
+grant insert on table "public"."commit_payloads" to "authenticated";
+
+grant references on table "public"."commit_payloads" to "authenticated";
+
+grant select on table "public"."commit_payloads" to "authenticated";
+
+grant trigger on table "public"."commit_payloads" to "authenticated";
+
+grant truncate on table "public"."commit_payloads" to "authenticated";
+
+grant update on table "public"."commit_payloads" to "authenticated";
+
+grant delete on table "public"."commit_payloads" to "service_role";
+
+grant insert on table "public"."commit_payloads" to "service_role";
+
+grant references on table "public"."commit_payloads" to "service_role";
+
+grant select on table "public"."commit_payloads" to "service_role";
+
+grant trigger on table "public"."commit_payloads" to "service_role";
+
+grant truncate on table "public"."commit_payloads" to "service_role";
+
+grant update on table "public"."commit_payloads" to "service_role";
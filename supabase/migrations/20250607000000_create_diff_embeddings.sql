@@ -0,0 +1,157 @@
+-- Embeddings of commit diff chunks (one or more hunks of one file, see api/app/ingest/diff_splitter.py),
+-- so commit history can be searched semantically: "which commits touched the login flow?"
+
+CREATE TABLE IF NOT EXISTS public.diff_embeddings (
+    id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    project_id uuid NOT NULL REFERENCES public.projects(id) ON DELETE CASCADE,
+    commit_id uuid REFERENCES public.commits(id) ON DELETE CASCADE,
+    commit_sha text NOT NULL,
+    file_path text NOT NULL,
+    old_path text,
+    change_status text,        -- added | deleted | modified | renamed
+    start_line integer,        -- New-side line range covered by the chunk
+    end_line integer,
+    hunk_headers text[],
+    content text,
+    embedding vector(1536),
+    created_at timestamp with time zone NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_diff_embeddings_commit ON public.diff_embeddings (project_id, commit_sha);
+
+CREATE INDEX IF NOT EXISTS idx_diff_embeddings_embedding_hnsw
+ON public.diff_embeddings
+USING hnsw (embedding vector_cosine_ops);
+
+-- Top-k diff chunks, like match_code_embeddings.
+CREATE OR REPLACE FUNCTION public.match_diff_embeddings(
+    query_embedding vector(1536),
+    p_project_id uuid DEFAULT NULL,
+    match_count integer DEFAULT 10,
+    threshold double precision DEFAULT 0.3
+)
+RETURNS TABLE (
+    id bigint,
+    project_id uuid,
+    commit_id uuid,
+    commit_sha text,
+    file_path text,
+    start_line integer,
+    end_line integer,
+    content text,
+    similarity double precision
+)
+LANGUAGE sql
+STABLE
+SET hnsw.iterative_scan = strict_order
+AS $function$
+    SELECT * FROM (
+        SELECT de.id, de.project_id, de.commit_id, de.commit_sha, de.file_path, de.start_line, de.end_line, de.content,
+               1 - (de.embedding <=> query_embedding) AS similarity
+        FROM public.diff_embeddings AS de
+        WHERE de.embedding IS NOT NULL
+          AND (p_project_id IS NULL OR de.project_id = p_project_id)
+        ORDER BY de.embedding <=> query_embedding
+        LIMIT match_count
+    ) AS nearest
+    WHERE nearest.similarity >= threshold
+    ORDER BY nearest.similarity DESC;
+$function$;
+
+-- Commits ranked by their best matching diff chunk. The `candidate_count` nearest chunks
+-- are taken from the HNSW index, then grouped per commit.
+CREATE OR REPLACE FUNCTION public.search_commits(
+    query_embedding vector(1536),
+    p_project_id uuid DEFAULT NULL,
+    match_count integer DEFAULT 10,
+    threshold double precision DEFAULT 0.3,
+    candidate_count integer DEFAULT 200
+)
+RETURNS TABLE (
+    project_id uuid,
+    commit_id uuid,
+    commit_sha text,
+    message text,
+    author_name text,
+    commit_timestamp timestamp with time zone,
+    similarity double precision,
+    matched_chunks bigint,
+    files text[],
+    best_file_path text,
+    best_start_line integer,
+    best_end_line integer
+)
+LANGUAGE sql
+STABLE
+SET hnsw.iterative_scan = strict_order
+AS $function$
+    WITH nearest AS (
+        SELECT de.project_id, de.commit_id, de.commit_sha, de.file_path, de.start_line, de.end_line,
+               1 - (de.embedding <=> query_embedding) AS similarity
+        FROM public.diff_embeddings AS de
+        WHERE de.embedding IS NOT NULL
+          AND (p_project_id IS NULL OR de.project_id = p_project_id)
+        ORDER BY de.embedding <=> query_embedding
+        LIMIT candidate_count
+    ),
+    hits AS (
+        SELECT * FROM nearest WHERE nearest.similarity >= threshold
+    ),
+    best AS (
+        SELECT DISTINCT ON (h.project_id, h.commit_sha) h.*
+        FROM hits AS h
+        ORDER BY h.project_id, h.commit_sha, h.similarity DESC
+    ),
+    per_commit AS (
+        SELECT h.project_id, h.commit_sha, count(*) AS matched_chunks, array_agg(DISTINCT h.file_path) AS files
+        FROM hits AS h
+        GROUP BY h.project_id, h.commit_sha
+    )
+    SELECT b.project_id, coalesce(b.commit_id, c.id), b.commit_sha, c.message, c.author_name, c.commit_timestamp,
+           b.similarity, p.matched_chunks, p.files, b.file_path, b.start_line, b.end_line
+    FROM best AS b
+    JOIN per_commit AS p ON p.project_id = b.project_id AND p.commit_sha = b.commit_sha
+    LEFT JOIN public.commits AS c ON c.project_id = b.project_id AND c.commit_sha = b.commit_sha
+    ORDER BY b.similarity DESC
+    LIMIT match_count;
+$function$;
+
+grant execute on function public.match_diff_embeddings(vector, uuid, integer, double precision) to "anon";
+
+grant execute on function public.match_diff_embeddings(vector, uuid, integer, double precision) to "authenticated";
+
+grant execute on function public.match_diff_embeddings(vector, uuid, integer, double precision) to "service_role";
+
+grant execute on function public.search_commits(vector, uuid, integer, double precision, integer) to "anon";
+
+grant execute on function public.search_commits(vector, uuid, integer, double precision, integer) to "authenticated";
+
+grant execute on function public.search_commits(vector, uuid, integer, double precision, integer) to "service_role";
+
+grant delete on table "public"."diff_embeddings" to "authenticated";
+
+grant insert on table "public"."diff_embeddings" to "authenticated";
+
+grant references on table "public"."diff_embeddings" to "authenticated";
+
+grant select on table "public"."diff_embeddings" to "authenticated";
+
+grant trigger on table "public"."diff_embeddings" to "authenticated";
+
+grant truncate on table "public"."diff_embeddings" to "authenticated";
+
+grant update on table "public"."diff_embeddings" to "authenticated";
+
+grant delete on table "public"."diff_embeddings" to "service_role";
+
+grant insert on table "public"."diff_embeddings" to "service_role";
+
+grant references on table "public"."diff_embeddings" to "service_role";
+
+grant select on table "public"."diff_embeddings" to "service_role";
+
+grant trigger on table "public"."diff_embeddings" to "service_role";
+
+grant truncate on table "public"."diff_embeddings" to "service_role";
+
+grant update on table "public"."diff_embeddings" to "service_role";